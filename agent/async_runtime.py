@@ -0,0 +1,304 @@
+"""
+Runtime asyncio do agente (opcional, config "runtime": "asyncio")
+Um único event loop hospeda heartbeat, polling, verificação de updates e
+execução de jobs; trabalho bloqueante dos jobs roda em um executor de threads
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from typing import TYPE_CHECKING, Dict, Any, Optional, Set
+
+from config import AgentConfig
+from async_transport import AsyncAgentTransport
+from heartbeat_sender import HeartbeatSender
+from job_poller import JobPoller
+from auto_updater import AutoUpdater
+from outbox import Outbox, PRIORITY_ACK, PRIORITY_HEARTBEAT, PRIORITY_METRICS
+from rate_governor import RateLimited
+
+if TYPE_CHECKING:
+    # Componentes opcionais: main.py só os importa quando habilitados
+    from fs_watcher import FsWatcher
+    from metrics_sender import MetricsSender
+    from log_shipper import LogShipper
+
+UPDATE_CHECK_INTERVAL = 6 * 60 * 60  # segundos
+
+class AsyncAgentRuntime:
+    """Executa os componentes do agente como coroutines"""
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        heartbeat_sender: HeartbeatSender,
+        job_poller: JobPoller,
+        auto_updater: AutoUpdater,
+        fs_watcher: Optional['FsWatcher'] = None,
+        metrics_sender: Optional['MetricsSender'] = None,
+        outbox: Optional[Outbox] = None,
+        log_shipper: Optional['LogShipper'] = None
+    ):
+        self.config = config
+        self.stop_event = stop_event
+        self.heartbeat_sender = heartbeat_sender
+        self.job_poller = job_poller
+        self.auto_updater = auto_updater
+        self.fs_watcher = fs_watcher
+        self.metrics_sender = metrics_sender
+        self.outbox = outbox
+        self.log_shipper = log_shipper
+        self.logger = logging.getLogger(__name__)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.transport: Optional[AsyncAgentTransport] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._job_tasks: Set[asyncio.Task] = set()
+
+        # Trabalho bloqueante dos jobs (execute_job) roda fora do event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(config.job_concurrency.values()),
+            thread_name_prefix="AsyncJobWorker"
+        )
+
+    def request_stop(self):
+        """Solicita parada (seguro para chamar de signal handlers e outras threads)"""
+        self.stop_event.set()
+        if self.loop and self._stopping:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _sleep(self, delay: float) -> bool:
+        """Aguarda delay segundos; retorna True se o agente está parando"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        return self._stopping.is_set()
+
+    async def run(self):
+        """Executa até request_stop() e drena os jobs em execução"""
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.stop_event.is_set():
+            self._stopping.set()
+
+        # Concorrência por tipo de job e backlog limitado (back-pressure)
+        self._lanes: Dict[str, asyncio.Semaphore] = {
+            job_type: asyncio.Semaphore(count)
+            for job_type, count in self.config.job_concurrency.items()
+        }
+        self._backlog = asyncio.Semaphore(self.config.job_queue_size)
+
+        # Estado compartilhado com o transporte síncrono (orçamento, relógio, assinador, compressão)
+        sync_transport = self.heartbeat_sender.transport
+        self.transport = AsyncAgentTransport(
+            self.config,
+            governor=sync_transport.governor,
+            clock=sync_transport.clock,
+            signer=sync_transport.signer,
+            compressor=sync_transport.compressor
+        )
+        await self.transport.open()
+
+        loops = [
+            asyncio.create_task(self._poll_loop(), name="poller"),
+            asyncio.create_task(self._update_loop(), name="updater"),
+        ]
+        if not self.config.combined_heartbeat:
+            loops.append(asyncio.create_task(self._heartbeat_loop(), name="heartbeat"))
+        if self.metrics_sender:
+            loops.append(asyncio.create_task(self._metrics_loop(), name="metrics"))
+        # O watcher é bloqueante (inotify + pool de hashers): roda em thread própria
+        watcher = None
+        if self.fs_watcher:
+            watcher = self.loop.run_in_executor(None, self.fs_watcher.run)
+        # Reenvio da outbox usa o transporte síncrono em thread própria
+        replayer = None
+        if self.outbox:
+            replayer = self.loop.run_in_executor(None, self.outbox.run)
+        # Leitura dos logs e upload com banda limitada: também em thread própria
+        shipper = None
+        if self.log_shipper:
+            shipper = self.loop.run_in_executor(None, self.log_shipper.run)
+        self.logger.info("✅ Runtime asyncio iniciado")
+
+        await self._stopping.wait()
+        self.stop_event.set()
+
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+
+        await self._drain()
+        if watcher:
+            try:
+                await asyncio.wait_for(watcher, timeout=self.config.job_drain_timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning("⚠️  Watcher não terminou dentro do timeout")
+        if replayer:
+            self.outbox.wake()
+            try:
+                await asyncio.wait_for(replayer, timeout=5)
+            except asyncio.TimeoutError:
+                pass
+        if shipper:
+            try:
+                await asyncio.wait_for(shipper, timeout=5)
+            except asyncio.TimeoutError:
+                pass
+        await self.transport.close()
+        self._executor.shutdown(wait=False)
+
+    async def _post_durable(self, function: str, body: Optional[Any], priority: int, key: Optional[str] = None):
+        """
+        POST com write-through na outbox (sem outbox, POST direto)
+
+        Returns:
+            Response, ou None se a função está sem orçamento ou bloqueada por 429
+            (com outbox, a entrada fica para o reenvio)
+        """
+        outbox = self.outbox
+        if outbox is None:
+            try:
+                return await self.transport.post(function, body)
+            except RateLimited:
+                return None
+        row_id = outbox.put(function, body, priority, key)
+        if outbox.blocked(function):
+            outbox.release(row_id)
+            return None
+        try:
+            response = await self.transport.post(function, body)
+        except RateLimited:
+            outbox.release(row_id)
+            return None
+        except BaseException:
+            # Inclui CancelledError: a entrada fica para o reenvio
+            outbox.settle(row_id, function, None)
+            raise
+        outbox.settle(row_id, function, response)
+        return response
+
+    async def _drain(self):
+        """Aguarda jobs em execução (que observam stop_event) até job_drain_timeout"""
+        if not self._job_tasks:
+            return
+        self.logger.info(f"⏳ Aguardando {len(self._job_tasks)} job(s) em execução...")
+        done, pending = await asyncio.wait(self._job_tasks, timeout=self.config.job_drain_timeout)
+        if pending:
+            self.logger.warning(f"⚠️  {len(pending)} job(s) não terminaram dentro do timeout")
+
+    async def _heartbeat_loop(self):
+        sender = self.heartbeat_sender
+        self.logger.info(f"💓 Heartbeat (asyncio) iniciado (intervalo: {self.config.heartbeat_interval}s)")
+
+        while not self._stopping.is_set():
+            try:
+                response = await self._post_durable('heartbeat', sender.os_info, PRIORITY_HEARTBEAT, key='heartbeat')
+                success = response is not None and sender.handle_response(response)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self.logger.warning("⚠️  Heartbeat timeout")
+                success = False
+            except Exception as e:
+                self.logger.error(f"❌ Erro ao enviar heartbeat: {e}")
+                success = False
+
+            if await self._sleep(sender.next_delay(success)):
+                break
+
+    async def _metrics_loop(self):
+        sender = self.metrics_sender
+        self.logger.info(f"📊 Metrics sender (asyncio) iniciado (intervalo: {self.config.metrics_interval}s)")
+
+        while not self._stopping.is_set():
+            # Leituras de /proc: microssegundos, podem rodar no próprio loop
+            metrics = sender.tick()
+            if metrics is not None:
+                if self.outbox:
+                    sender.window.reset()
+                try:
+                    response = await self._post_durable('submit-system-metrics', metrics, PRIORITY_METRICS)
+                    if response is not None:
+                        sender.handle_response(response, metrics)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.error(f"❌ Erro ao enviar métricas: {e!r}")
+                sender.schedule_next()
+
+            if await self._sleep(sender.wait_time()):
+                break
+
+    async def _poll_loop(self):
+        poller = self.job_poller
+        mode = "long-poll" if self.config.long_poll_enabled else "intervalo"
+        self.logger.info(f"🔄 Job poller (asyncio) iniciado (modo: {mode})")
+
+        while not self._stopping.is_set():
+            # Back-pressure: só buscar novos jobs se houver espaço no backlog
+            await self._backlog.acquire()
+            self._backlog.release()
+
+            request = poller.poll_request()
+            try:
+                response = await self.transport.request(
+                    request.method,
+                    'poll-jobs',
+                    body=request.body,
+                    params=request.params,
+                    timeout=request.timeout
+                )
+                jobs = poller.handle_poll_response(response, request)
+            except asyncio.CancelledError:
+                raise
+            except RateLimited as e:
+                poller.scheduler.block_for(e.retry_after)
+                jobs = []
+            except Exception as e:
+                self.logger.error(f"❌ Erro ao fazer polling: {e!r}")
+                jobs = []
+
+            for job in jobs:
+                await self._backlog.acquire()
+                task = asyncio.create_task(self._run_job(job))
+                self._job_tasks.add(task)
+                task.add_done_callback(self._job_tasks.discard)
+
+            delay = poller.next_poll_delay(len(jobs))
+            if delay > 0 and await self._sleep(delay):
+                break
+
+    async def _run_job(self, job: Dict[str, Any]):
+        poller = self.job_poller
+        lane = self._lanes.get(job.get('type')) or self._lanes.get('custom') or next(iter(self._lanes.values()))
+        try:
+            async with lane:
+                if self.stop_event.is_set():
+                    return
+                success = await self.loop.run_in_executor(self._executor, poller.execute_job, job)
+
+            if success:
+                try:
+                    response = await self._post_durable(f"ack-job/{job['id']}", None, PRIORITY_ACK, key=f"ack:{job['id']}")
+                    if response is not None:
+                        poller.handle_ack_response(job['id'], response)
+                except Exception as e:
+                    self.logger.error(f"❌ Erro ao enviar ACK para job {job['id']}: {e!r}")
+        finally:
+            self._backlog.release()
+
+    async def _update_loop(self):
+        """Verifica atualizações periodicamente (download roda no executor padrão)"""
+        while not await self._sleep(UPDATE_CHECK_INTERVAL):
+            self.logger.info("🔍 Verificação periódica de atualizações...")
+            try:
+                if await self.loop.run_in_executor(None, self.auto_updater.update_if_available):
+                    # Drena os jobs e encerra; o agente reinicia na nova versão em seguida
+                    self.logger.info("🔄 Encerrando runtime para reiniciar na nova versão...")
+                    self.request_stop()
+                    return
+            except Exception as e:
+                self.logger.error(f"❌ Erro na verificação periódica: {e}")
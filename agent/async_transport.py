@@ -0,0 +1,228 @@
+"""
+Transporte HTTP assíncrono (aiohttp) para o runtime asyncio
+Mesma interface do AgentTransport, com métodos awaitable
+"""
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+
+from compression import BodyCompressor, is_encoding_rejection
+from config import AgentConfig
+from hmac_utils import Signer
+from http_transport import iter_file, serialize_body
+from rate_governor import RateGovernor, RateLimited
+from retry_policy import (
+    CLOCK_SKEW, OK, RetryState, ServerClock, classify_error, classify_response
+)
+
+try:
+    import aiohttp
+except ImportError:  # dependência opcional (apenas runtime asyncio)
+    aiohttp = None
+
+class AsyncResponse:
+    """Resposta já lida, compatível com o subconjunto de requests.Response usado pelos componentes"""
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+class AsyncAgentTransport:
+    """Sessão aiohttp única do agente com pool de conexões por host"""
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        governor: Optional[RateGovernor] = None,
+        clock: Optional[ServerClock] = None,
+        signer: Optional[Signer] = None,
+        compressor: Optional[BodyCompressor] = None
+    ):
+        if aiohttp is None:
+            raise RuntimeError("runtime asyncio requer o pacote 'aiohttp' (pip install aiohttp)")
+        self.config = config
+        self.governor = governor
+        self.clock = clock or ServerClock()
+        self.signer = signer or Signer(config.hmac_secret)
+        self.compressor = compressor
+        if compressor is None and config.compression_enabled:
+            self.compressor = BodyCompressor(config)
+        self.logger = logging.getLogger(__name__)
+        self.session: Optional["aiohttp.ClientSession"] = None
+        self._requests_sent = 0
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.config.http_pool_connections * self.config.http_pool_maxsize,
+            limit_per_host=self.config.http_pool_maxsize
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    def function_url(self, function: str) -> str:
+        """URL de uma Edge Function (ex: 'heartbeat', 'ack-job/<id>')"""
+        return f"{self.config.server_url}/functions/v1/{function}"
+
+    async def request(
+        self,
+        method: str,
+        function: str,
+        body: Optional[Any] = None,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        retry: bool = True,
+        content_type: str = 'application/json'
+    ) -> AsyncResponse:
+        """
+        Envia uma requisição autenticada para uma Edge Function
+
+        Mesma política de novas tentativas e compressão do AgentTransport.request.
+        Exceções de rede (aiohttp.ClientError, asyncio.TimeoutError) são
+        propagadas após as tentativas; RateLimited se o orçamento da função
+        estiver esgotado por mais de max_wait
+        """
+        identity = serialize_body(body)
+        payload, encoding = identity, None
+        if self.compressor and identity:
+            if isinstance(identity, Path):
+                # Compressão do arquivo fora do event loop
+                payload, encoding = await asyncio.get_running_loop().run_in_executor(
+                    None, self.compressor.encode, function, identity
+                )
+            else:
+                payload, encoding = self.compressor.encode(function, identity)
+        client_timeout = aiohttp.ClientTimeout(
+            total=timeout if timeout is not None else self.config.request_timeout
+        )
+        try:
+            return await self._attempts(
+                method, function, payload, encoding, identity, params, client_timeout, max_wait, retry, content_type
+            )
+        finally:
+            if encoding and isinstance(payload, Path):
+                payload.unlink(missing_ok=True)
+
+    async def _attempts(
+        self,
+        method: str,
+        function: str,
+        payload: Union[bytes, Path],
+        encoding: Optional[str],
+        identity: Union[bytes, Path],
+        params: Optional[Dict[str, Any]],
+        client_timeout: "aiohttp.ClientTimeout",
+        max_wait: Optional[float],
+        retry: bool,
+        content_type: str
+    ) -> AsyncResponse:
+        """Laço de tentativas de request() (payload já codificado; identity = sem compressão)"""
+        state = RetryState()
+        retries = self.config.max_retries if retry else 0
+        attempt = 0
+        # Recusas na autenticação (relógio, codificação) acontecem antes do
+        # rate limit do servidor: o reenvio imediato não consome orçamento
+        free_retry = False
+        result = error = None
+        while True:
+            if self.governor and not free_retry:
+                try:
+                    wait = self.governor.reserve(function, max_wait)
+                except RateLimited:
+                    if not attempt:
+                        raise
+                    if error is not None:
+                        raise error
+                    return result
+                if wait:
+                    await asyncio.sleep(wait)
+
+            # A assinatura cobre exatamente os bytes enviados (já comprimidos)
+            timestamp_ms = self.clock.timestamp_ms()
+            from_file = isinstance(payload, Path)
+            if from_file:
+                # Leitura do arquivo fora do event loop
+                signature = await asyncio.get_running_loop().run_in_executor(
+                    None, self.signer.sign_chunks, iter_file(payload), timestamp_ms
+                )
+                data = open(payload, 'rb')
+            else:
+                signature = self.signer.sign(payload, timestamp_ms)
+                data = payload or None
+            headers = {
+                'X-Agent-Token': self.config.agent_token,
+                'Content-Type': content_type,
+                **signature
+            }
+            if encoding:
+                headers['Content-Encoding'] = encoding
+
+            self._requests_sent += 1
+            result = error = None
+            sent_at = time.time()
+            try:
+                async with self.session.request(
+                    method,
+                    self.function_url(function),
+                    headers=headers,
+                    data=data,
+                    params=params,
+                    timeout=client_timeout
+                ) as response:
+                    content = await response.read()
+                    result = AsyncResponse(response.status, response.headers, content)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                kind = classify_error(e)
+            else:
+                received_at = time.time()
+                kind = classify_response(result)
+                if kind == CLOCK_SKEW:
+                    self.clock.learn(result.headers.get('Date'), sent_at, received_at)
+                else:
+                    self.clock.observe(result.headers.get('Date'), sent_at, received_at)
+                if self.governor:
+                    self.governor.observe(function, result)
+                if self.compressor:
+                    self.compressor.observe(function, result)
+                    if encoding and is_encoding_rejection(result):
+                        # Reenviar na hora sem compressão (não conta como tentativa)
+                        self.compressor.reject(function, encoding)
+                        payload, encoding = identity, None
+                        free_retry = True
+                        continue
+            finally:
+                if from_file:
+                    data.close()
+
+            delay = state.next_delay(kind) if kind != OK and attempt < retries else None
+            free_retry = kind == CLOCK_SKEW
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            attempt += 1
+            self.logger.debug("🔁 %s: %s, nova tentativa em %.1fs", function, kind, delay)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def get(self, function: str, **kwargs) -> AsyncResponse:
+        return await self.request('GET', function, **kwargs)
+
+    async def post(self, function: str, body: Optional[Any] = None, **kwargs) -> AsyncResponse:
+        return await self.request('POST', function, body=body, **kwargs)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+        self.logger.info(f"🔌 Transporte assíncrono encerrado: {self._requests_sent} requests")
@@ -4,33 +4,68 @@ Verifica e aplica atualizações automaticamente com validação SHA256 e rollba
 """
 import os
 import sys
+import json
 import time
 import shutil
 import hashlib
 import logging
 import platform
 import requests
-import tempfile
 import subprocess
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
+
+from logger_config import stop_logging
+from version import AGENT_VERSION
+
+if TYPE_CHECKING:
+    from update_downloader import UpdateDownloader
 
 logger = logging.getLogger(__name__)
 
+# Segundos para a nova versão concluir o --self-test
+SELF_TEST_TIMEOUT = 120
+
+# Ambiente passado à nova versão no reinício pós-atualização
+RESTART_ENV = 'CYBERSHIELD_RESTART_AT'
+UPDATED_FROM_ENV = 'CYBERSHIELD_UPDATED_FROM'
+
 class AutoUpdater:
     """Gerenciador de auto-atualização do agente"""
     
-    def __init__(self, config):
+    def __init__(self, config, transport, argv: Optional[List[str]] = None):
         self.config = config
+        self.transport = transport
         self.current_version = self._get_current_version()
         self.platform = "windows" if platform.system() == "Windows" else "linux"
         self.exe_extension = ".exe" if self.platform == "windows" else ""
         self.current_exe = self._get_current_exe_path()
+        # Bundle onedir: a troca do executável deixaria _internal/ na versão antiga
+        self.onedir_bundle = self._is_onedir_bundle()
+        self._onedir_logged = False
+        # Argumentos repassados ao self-test e ao reinício (--config, --runtime...)
+        self.argv = list(sys.argv[1:] if argv is None else argv)
         self.backup_exe = None
+        self.restart_pending = False
+        self._installed_sha256: Optional[str] = None
+        
+        # Reinício após atualização: epoch do exec (consumido, não vai para subprocessos)
+        self.restarted_at: Optional[float] = None
+        restarted_at = os.environ.pop(RESTART_ENV, None)
+        updated_from = os.environ.pop(UPDATED_FROM_ENV, None)
+        if restarted_at:
+            try:
+                self.restarted_at = float(restarted_at)
+            except ValueError:
+                pass
+            else:
+                logger.info(
+                    f"🔁 Reiniciado após atualização de v{updated_from} "
+                    f"({(time.time() - self.restarted_at) * 1000:.0f} ms desde o exec)"
+                )
         
     def _get_current_version(self) -> str:
         """Obtém versão atual do agente"""
-        from main import AGENT_VERSION
         return AGENT_VERSION
     
     def _get_current_exe_path(self) -> Path:
@@ -42,6 +77,21 @@ class AutoUpdater:
             # Executando como script Python (desenvolvimento)
             return Path(__file__).parent / "main.py"
     
+    @staticmethod
+    def _is_onedir_bundle() -> bool:
+        """
+        Executável PyInstaller onedir (bibliotecas ao lado do executável)
+
+        No onefile o _MEIPASS é a extração temporária; no onedir fica dentro
+        da pasta do executável (_internal/ ou a própria pasta).
+        """
+        meipass = getattr(sys, '_MEIPASS', None)
+        if not getattr(sys, 'frozen', False) or not meipass:
+            return False
+        bundle_dir = Path(sys.executable).resolve().parent
+        meipass_dir = Path(meipass).resolve()
+        return meipass_dir == bundle_dir or bundle_dir in meipass_dir.parents
+
     def check_for_updates(self) -> Optional[Dict[str, Any]]:
         """
         Verifica se há atualizações disponíveis via Edge Function dedicada
@@ -50,25 +100,15 @@ class AutoUpdater:
             Dict com informações da atualização ou None se não houver
         """
         try:
-            import json
-            from hmac_utils import generate_hmac_headers
-            
             logger.info(f"🔍 Verificando atualizações... (versão atual: {self.current_version})")
             
             # Usar Edge Function dedicada ao invés de REST API
-            url = f"{self.config.server_url}/functions/v1/check-agent-updates"
-            
-            # Preparar body vazio (necessário para HMAC)
-            body = json.dumps({})
-            
-            # Gerar headers HMAC para autenticação
-            headers = {
-                'X-Agent-Token': self.config.agent_token,
-                'Content-Type': 'application/json',
-                **generate_hmac_headers(self.config.hmac_secret, body)
-            }
-            
-            response = requests.post(url, headers=headers, data=body, timeout=30)
+            # SHA256 do executável instalado: o servidor pode anunciar um patch binário
+            response = self.transport.post(
+                'check-agent-updates',
+                {'current_sha256': self._get_installed_sha256()},
+                timeout=30
+            )
             response.raise_for_status()
             
             data = response.json()
@@ -105,7 +145,7 @@ class AutoUpdater:
     
     def download_update(self, update_info: Dict[str, Any]) -> Optional[Path]:
         """
-        Baixa a atualização
+        Baixa a atualização (SHA256 validado durante o download, com retomada)
         
         Args:
             update_info: Informações da atualização
@@ -113,62 +153,105 @@ class AutoUpdater:
         Returns:
             Path do arquivo baixado ou None em caso de erro
         """
+        # Importados só quando há atualização (fora do caminho de inicialização)
+        from update_cache import ArtifactCache
+        from update_downloader import UpdateDownloader, DownloadError
+        
         try:
             download_url = update_info['download_url']
             expected_hash = update_info['sha256']
-            expected_size = update_info['size_bytes']
-            
-            logger.info(f"📥 Baixando atualização de {download_url}")
-            
-            # Criar diretório temporário
-            temp_dir = Path(tempfile.gettempdir()) / "cybershield_update"
-            temp_dir.mkdir(exist_ok=True)
-            
-            temp_file = temp_dir / f"cybershield-agent-new{self.exe_extension}"
-            
-            # Download com progress
-            response = requests.get(download_url, stream=True, timeout=300)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(temp_file, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        progress = (downloaded / total_size) * 100 if total_size > 0 else 0
-                        if downloaded % (1024 * 1024) == 0:  # Log a cada 1MB
-                            logger.info(f"📥 Download: {progress:.1f}% ({downloaded}/{total_size})")
-            
-            logger.info(f"✅ Download concluído: {temp_file}")
-            
-            # Validar tamanho
-            actual_size = temp_file.stat().st_size
-            if actual_size != expected_size:
-                logger.error(f"❌ Tamanho inválido: esperado {expected_size}, obtido {actual_size}")
-                temp_file.unlink()
-                return None
-            
-            # Validar SHA256
-            logger.info("🔐 Validando SHA256...")
-            actual_hash = self._calculate_sha256(temp_file)
+            expected_size = int(update_info['size_bytes'])
+            
+            logger.info(f"📥 Baixando atualização de {download_url} ({expected_size / (1024 * 1024):.1f} MB)")
+            
+            # Em data_dir (não no diretório temporário): o parcial sobrevive a
+            # reinícios e o download é retomado de onde parou
+            # Com update_cache_dir, apenas o primeiro agente do site baixa da internet
+            cache = None
+            if self.config.update_cache_dir:
+                cache = ArtifactCache(Path(self.config.update_cache_dir), max_wait=self.config.update_cache_wait)
+            downloader = UpdateDownloader(
+                self.transport,
+                Path(self.config.data_dir) / "updates",
+                max_resumes=self.config.max_retries,
+                segments=self.config.update_segments,
+                cache=cache,
+            )
+            name = f"cybershield-agent-{update_info.get('version', 'new')}{self.exe_extension}"
+            
+            if update_info.get('patch'):
+                new_exe = self._download_patched(update_info, downloader, name)
+                if new_exe:
+                    return new_exe
+            
+            return downloader.fetch(download_url, expected_hash, expected_size, name)
+            
+        except DownloadError as e:
+            logger.error(f"❌ Atualização inválida: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Erro ao baixar atualização: {e}")
+            return None
+    
+    def _download_patched(self, update_info: Dict[str, Any], downloader: 'UpdateDownloader', name: str) -> Optional[Path]:
+        """
+        Monta a nova versão aplicando o patch binário anunciado ao executável instalado
+        
+        Returns:
+            Path do executável novo (SHA256 completo conferido) ou None para
+            usar o download completo
+        """
+        from delta_patch import PATCH_FORMAT, PatchError, apply_patch
+        from update_downloader import DownloadError
+        
+        patch = update_info['patch']
+        installed_sha256 = self._get_installed_sha256()
+        if patch.get('format') != PATCH_FORMAT or patch.get('from_sha256') != installed_sha256:
+            logger.info("ℹ️  Patch anunciado não se aplica a este executável, usando download completo")
+            return None
+        
+        expected_hash = update_info['sha256'].lower()
+        expected_size = int(update_info['size_bytes'])
+        output = downloader.download_dir / f"{name}.patched"
+        try:
+            logger.info(
+                f"🧩 Atualização por patch: {int(patch['size_bytes']) / 1024:.0f} KiB "
+                f"em vez de {expected_size / (1024 * 1024):.1f} MB"
+            )
+            patch_file = downloader.fetch(
+                patch['download_url'], patch['sha256'], int(patch['size_bytes']), f"{name}.csdelta"
+            )
+            try:
+                actual_hash, actual_size = apply_patch(
+                    self.current_exe, patch_file, output, source_sha256=installed_sha256
+                )
+            finally:
+                patch_file.unlink(missing_ok=True)
             
-            if actual_hash.lower() != expected_hash.lower():
-                logger.error(f"❌ Hash SHA256 inválido!")
-                logger.error(f"   Esperado: {expected_hash}")
-                logger.error(f"   Obtido:   {actual_hash}")
-                temp_file.unlink()
+            if actual_size != expected_size or actual_hash != expected_hash:
+                logger.warning(
+                    f"⚠️  Resultado do patch não confere (SHA256 {actual_hash}, {actual_size} bytes), "
+                    "usando download completo"
+                )
+                output.unlink(missing_ok=True)
                 return None
             
-            logger.info("✅ Validação SHA256 OK")
-            return temp_file
+            target = downloader.download_dir / name
+            os.replace(output, target)
+            logger.info("✅ Patch aplicado, validação SHA256 OK")
+            return target
             
-        except Exception as e:
-            logger.error(f"❌ Erro ao baixar atualização: {e}")
+        except (DownloadError, PatchError, requests.exceptions.RequestException, OSError, KeyError, ValueError) as e:
+            logger.warning(f"⚠️  Falha no patch ({e}), usando download completo")
+            output.unlink(missing_ok=True)
             return None
     
+    def _get_installed_sha256(self) -> str:
+        """SHA256 do executável instalado (calculado uma vez por processo)"""
+        if self._installed_sha256 is None:
+            self._installed_sha256 = self._calculate_sha256(self.current_exe)
+        return self._installed_sha256
+    
     def _calculate_sha256(self, file_path: Path) -> str:
         """Calcula hash SHA256 de um arquivo"""
         sha256 = hashlib.sha256()
@@ -177,37 +260,121 @@ class AutoUpdater:
                 sha256.update(chunk)
         return sha256.hexdigest()
     
+    def _command(self, exe: Path, args: List[str]) -> List[str]:
+        """Linha de comando para executar exe (executável ou script em desenvolvimento)"""
+        if getattr(sys, 'frozen', False):
+            return [str(exe)] + args
+        return [sys.executable, str(exe)] + args
+    
+    def _child_env(self) -> Dict[str, str]:
+        """Ambiente para outro executável do agente (sem o estado do bootloader atual)"""
+        env = {
+            key: value for key, value in os.environ.items()
+            if not key.startswith('_PYI_') and key != '_MEIPASS2'
+        }
+        # O bootloader do PyInstaller extrai o próprio bundle em vez de herdar o nosso
+        env['PYINSTALLER_RESET_ENVIRONMENT'] = '1'
+        return env
+    
+    def _stage(self, new_exe: Path) -> Path:
+        """
+        Copia a nova versão para o diretório do executável atual
+        
+        No mesmo sistema de arquivos, a troca por os.replace é atômica.
+        """
+        staged = self.current_exe.with_name(f"{self.current_exe.name}.new")
+        shutil.copyfile(new_exe, staged)
+        if self.platform == "linux":
+            os.chmod(staged, 0o755)
+        new_exe.unlink(missing_ok=True)
+        return staged
+    
+    def _self_test(self, exe: Path, expected_version: str) -> bool:
+        """
+        Executa a nova versão com --self-test antes da troca
+        
+        Returns:
+            True se o binário iniciou, passou nas verificações e reporta a
+            versão esperada
+        """
+        command = self._command(exe, self.argv + ['--self-test'])
+        logger.info(f"🧪 Testando nova versão: {' '.join(command)}")
+        started = time.perf_counter()
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=SELF_TEST_TIMEOUT,
+                env=self._child_env()
+            )
+        except subprocess.TimeoutExpired:
+            logger.error(f"❌ Self-test não terminou em {SELF_TEST_TIMEOUT}s")
+            return False
+        except OSError as e:
+            logger.error(f"❌ Self-test não pôde executar a nova versão: {e}")
+            return False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        # Relatório JSON na última linha do stdout
+        report: Dict[str, Any] = {}
+        for line in reversed(result.stdout.splitlines()):
+            if line.startswith('{'):
+                try:
+                    report = json.loads(line)
+                except ValueError:
+                    pass
+                break
+        
+        if result.returncode != 0 or not report.get('ok'):
+            logger.error(f"❌ Self-test falhou (código {result.returncode}): {report.get('checks') or 'sem relatório'}")
+            for line in result.stderr.strip().splitlines()[-5:]:
+                logger.error(f"   {line}")
+            return False
+        if report.get('version') != expected_version:
+            logger.error(f"❌ Self-test reporta versão {report.get('version')}, esperada {expected_version}")
+            return False
+        
+        logger.info(f"✅ Self-test da v{expected_version} OK em {elapsed_ms:.0f} ms ({', '.join(report.get('checks', {}))})")
+        return True
+    
     def apply_update(self, new_exe: Path) -> bool:
         """
-        Aplica a atualização
+        Aplica a atualização (troca atômica do executável)
         
         Args:
-            new_exe: Path do novo executável
+            new_exe: Path do novo executável, no diretório do atual (ver _stage)
             
         Returns:
             True se sucesso, False caso contrário
         """
         try:
             logger.info("🔄 Aplicando atualização...")
+            started = time.perf_counter()
             
-            # Criar backup do executável atual
             backup_dir = self.current_exe.parent / "backup"
             backup_dir.mkdir(exist_ok=True)
-            
             self.backup_exe = backup_dir / f"cybershield-agent.backup{self.exe_extension}"
             
             logger.info(f"💾 Criando backup: {self.backup_exe}")
-            shutil.copy2(self.current_exe, self.backup_exe)
-            
-            # Substituir executável
-            logger.info(f"📝 Substituindo executável: {self.current_exe}")
-            shutil.move(str(new_exe), str(self.current_exe))
-            
-            # Tornar executável (Linux)
-            if self.platform == "linux":
-                os.chmod(self.current_exe, 0o755)
-            
-            logger.info("✅ Atualização aplicada com sucesso")
+            if self.platform == "windows":
+                # Executável em uso não pode ser sobrescrito, mas pode ser renomeado
+                os.replace(self.current_exe, self.backup_exe)
+                try:
+                    os.replace(new_exe, self.current_exe)
+                except OSError:
+                    os.replace(self.backup_exe, self.current_exe)
+                    raise
+            else:
+                self.backup_exe.unlink(missing_ok=True)
+                try:
+                    os.link(self.current_exe, self.backup_exe)
+                except OSError:
+                    shutil.copy2(self.current_exe, self.backup_exe)
+                # Atômico: o caminho sempre aponta para uma versão completa
+                os.replace(new_exe, self.current_exe)
+            
+            logger.info(f"✅ Atualização aplicada em {(time.perf_counter() - started) * 1000:.0f} ms")
             return True
             
         except Exception as e:
@@ -227,15 +394,12 @@ class AutoUpdater:
                 return False
             
             logger.warning("⚠️  Iniciando rollback...")
+            started = time.perf_counter()
             
-            # Restaurar backup
-            shutil.copy2(self.backup_exe, self.current_exe)
-            
-            # Tornar executável (Linux)
-            if self.platform == "linux":
-                os.chmod(self.current_exe, 0o755)
+            # Restaurar backup (troca atômica)
+            os.replace(self.backup_exe, self.current_exe)
             
-            logger.info("✅ Rollback concluído com sucesso")
+            logger.info(f"✅ Rollback concluído em {(time.perf_counter() - started) * 1000:.0f} ms")
             return True
             
         except Exception as e:
@@ -243,28 +407,49 @@ class AutoUpdater:
             return False
     
     def restart(self):
-        """Reinicia o agente"""
+        """
+        Reinicia o agente com o executável atualizado no mesmo processo (exec)
+        
+        Mesmo PID e sem janela com duas instâncias. Só retorna se o exec
+        falhar, após o rollback.
+        """
+        command = self._command(self.current_exe, self.argv)
+        env = self._child_env()
+        # Latência até o primeiro heartbeat, medida pela nova versão
+        env[RESTART_ENV] = repr(time.time())
+        env[UPDATED_FROM_ENV] = self.current_version
+        
         logger.info("🔄 Reiniciando agente...")
+        # exec e os._exit não executam atexit: drenar a fila de logs antes
+        stop_logging()
         
-        if getattr(sys, 'frozen', False):
-            # Executável PyInstaller
+        try:
             if self.platform == "windows":
-                subprocess.Popen([str(self.current_exe)])
-            else:
-                subprocess.Popen([str(self.current_exe)])
-        else:
-            # Script Python (desenvolvimento)
-            subprocess.Popen([sys.executable, str(self.current_exe)])
-        
-        sys.exit(0)
+                # No Windows o exec não preserva o PID: novo processo e saída imediata
+                subprocess.Popen(command, env=env, close_fds=True)
+                os._exit(0)
+            os.execve(command[0], command, env)
+        except OSError as e:
+            logger.error(f"❌ Falha ao reiniciar com a nova versão: {e}")
+            self.restart_pending = False
+            self.rollback()
     
     def update_if_available(self) -> bool:
         """
-        Fluxo completo de atualização
+        Fluxo completo de atualização (até a troca do executável)
         
         Returns:
-            True se atualizou, False caso contrário
+            True se atualizou; o chamador encerra os componentes e chama restart()
         """
+        if self.onedir_bundle:
+            if not self._onedir_logged:
+                self._onedir_logged = True
+                logger.info(
+                    "ℹ️  Instalação onedir: auto-update desabilitado "
+                    "(atualize pelo instalador/pacote)"
+                )
+            return False
+
         try:
             # Verificar atualizações
             update_info = self.check_for_updates()
@@ -277,90 +462,23 @@ class AutoUpdater:
                 logger.error("❌ Falha ao baixar atualização")
                 return False
             
-            # Aplicar atualização
-            if not self.apply_update(new_exe):
-                logger.error("❌ Falha ao aplicar atualização")
+            # Testar a nova versão antes da troca
+            staged = self._stage(new_exe)
+            if not self._self_test(staged, update_info['version']):
+                logger.error("❌ Nova versão falhou no self-test, atualização descartada")
+                staged.unlink(missing_ok=True)
                 return False
             
-            # Testar nova versão (basic health check)
-            logger.info("🧪 Testando nova versão...")
-            time.sleep(2)
-            
-            if not self._health_check():
-                logger.error("❌ Nova versão falhou no health check, fazendo rollback...")
-                if self.rollback():
-                    logger.info("✅ Rollback concluído")
+            # Aplicar atualização
+            if not self.apply_update(staged):
+                logger.error("❌ Falha ao aplicar atualização")
+                staged.unlink(missing_ok=True)
                 return False
             
             logger.info("🎉 Atualização concluída com sucesso!")
-            
-            # Reiniciar agente
-            self.restart()
+            self.restart_pending = True
             return True
             
         except Exception as e:
             logger.error(f"❌ Erro no processo de atualização: {e}")
             return False
-    
-    def _health_check(self) -> bool:
-        """
-        Verifica se o executável atualizado está funcionando
-        Inclui testes de configuração e conectividade com backend
-        
-        Returns:
-            True se OK, False se houver problemas
-        """
-        try:
-            # 1. Verificar se o arquivo existe e é executável
-            if not self.current_exe.exists():
-                logger.error("❌ Health check: executável não encontrado")
-                return False
-            
-            # 2. Verificar permissões (Linux)
-            if self.platform == "linux" and not os.access(self.current_exe, os.X_OK):
-                logger.error("❌ Health check: executável sem permissão de execução")
-                return False
-            
-            # 3. Verificar configuração básica
-            if not self.config.agent_name or not self.config.hmac_secret:
-                logger.error("❌ Health check: configuração inválida")
-                return False
-            
-            # 4. Testar conectividade com backend (heartbeat test)
-            try:
-                from hmac_utils import generate_hmac_headers
-                
-                heartbeat_url = f"{self.config.server_url}/functions/v1/heartbeat"
-                body = '{"test_mode": true}'
-                
-                headers = {
-                    'X-Agent-Token': self.config.agent_token,
-                    'Content-Type': 'application/json',
-                    **generate_hmac_headers(self.config.hmac_secret, body)
-                }
-                
-                response = requests.post(
-                    heartbeat_url,
-                    headers=headers,
-                    data=body,
-                    timeout=10
-                )
-                
-                if response.status_code not in [200, 201]:
-                    logger.error(f"❌ Health check: backend retornou {response.status_code}")
-                    return False
-                
-                logger.info("✅ Health check: backend conectado com sucesso")
-                
-            except requests.exceptions.Timeout:
-                logger.error("❌ Health check: timeout ao conectar backend")
-                return False
-            except requests.exceptions.RequestException as e:
-                logger.error(f"❌ Health check: erro ao conectar backend - {e}")
-                return False
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Health check falhou: {e}")
-            return False
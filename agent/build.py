@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 """
 Script de build do agente usando PyInstaller
+
+Uso:
+    python build.py                    # onefile (padrão: CI e auto-update)
+    python build.py --mode onedir      # pasta, sem extração a cada inicialização
+    python build.py --optimize         # bytecode otimizado (python -O)
+
+Medir a inicialização de cada build: tools/bench_startup.py
 """
 import os
 import sys
+import argparse
 import subprocess
 import shutil
 from pathlib import Path
 
-def build_agent():
+def build_agent(mode: str = "onefile", optimize: bool = False):
     """Build do executável usando PyInstaller"""
-    print("🔨 Iniciando build do CyberShield Agent...")
+    print(f"🔨 Iniciando build do CyberShield Agent ({mode}{', bytecode otimizado' if optimize else ''})...")
     
     # Verificar se está no diretório correto
     if not Path("main.py").exists():
@@ -24,10 +32,15 @@ def build_agent():
             shutil.rmtree(dir_name)
     
     # Comando PyInstaller
+    # onefile extrai todo o bundle para um diretório temporário a cada
+    # inicialização; onedir roda direto da pasta (inicialização mais rápida)
+    # -O: o PyInstaller compila os módulos com o nível de otimização do
+    # interpretador que o executa (asserts e blocos __debug__ removidos)
     cmd = [
         sys.executable,
+        *(["-O"] if optimize else []),
         "-m", "PyInstaller",
-        "--onefile",  # Arquivo único
+        f"--{mode}",
         "--name=cybershield-agent",
         "--clean",
         "--noconfirm",
@@ -48,16 +61,32 @@ def build_agent():
         sys.exit(1)
     
     # Verificar se executável foi criado
-    exe_path = Path("dist/cybershield-agent.exe" if sys.platform == "win32" else "dist/cybershield-agent")
+    exe_name = "cybershield-agent.exe" if sys.platform == "win32" else "cybershield-agent"
+    bundle = Path("dist/cybershield-agent") if mode == "onedir" else None
+    exe_path = bundle / exe_name if bundle else Path("dist") / exe_name
     
     if exe_path.exists():
-        size_mb = exe_path.stat().st_size / (1024 * 1024)
+        files = [p for p in bundle.rglob("*") if p.is_file()] if bundle else [exe_path]
+        size_mb = sum(p.stat().st_size for p in files) / (1024 * 1024)
         print(f"✅ Build concluído com sucesso!")
         print(f"📍 Executável: {exe_path}")
-        print(f"📊 Tamanho: {size_mb:.2f} MB")
+        print(f"📊 Tamanho: {size_mb:.2f} MB" + (f" ({len(files)} arquivos em {bundle})" if bundle else ""))
     else:
         print("❌ Erro: Executável não foi gerado")
         sys.exit(1)
 
 if __name__ == "__main__":
-    build_agent()
+    parser = argparse.ArgumentParser(description="Build do CyberShield Agent com PyInstaller")
+    parser.add_argument(
+        '--mode',
+        choices=['onefile', 'onedir'],
+        default='onefile',
+        help='onefile: executável único (distribuído pelo auto-update); onedir: pasta com inicialização mais rápida'
+    )
+    parser.add_argument(
+        '--optimize',
+        action='store_true',
+        help='Compila o bytecode com python -O'
+    )
+    args = parser.parse_args()
+    build_agent(args.mode, args.optimize)
@@ -0,0 +1,187 @@
+"""
+Compressão negociada dos bodies de requisição (gzip e, se disponível, zstd)
+
+O agente não comprime às cegas: cada Edge Function que aceita bodies
+comprimidos anuncia as codificações no header Accept-Encoding das suas
+respostas (RFC 7694). A partir daí, bodies acima de compression_min_bytes
+seguem com Content-Encoding. Um 415 (ou UNSUPPORTED_CONTENT_ENCODING)
+faz a função voltar a receber bodies sem compressão.
+
+A assinatura HMAC é calculada pelo transporte sobre os bytes comprimidos,
+exatamente os que vão para a rede.
+"""
+import gzip
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # dependência opcional
+    zstandard = None
+
+from config import AgentConfig
+
+# Preferência do agente (melhor razão primeiro)
+SUPPORTED_ENCODINGS = ('zstd', 'gzip') if zstandard else ('gzip',)
+
+# Código de erro das Edge Functions para Content-Encoding não suportado
+UNSUPPORTED_ENCODING_CODE = 'UNSUPPORTED_CONTENT_ENCODING'
+
+def parse_accept_encoding(header: Optional[str]) -> Set[str]:
+    """'gzip, zstd;q=0.5' → {'gzip', 'zstd'} (q=0 exclui a codificação)"""
+    encodings = set()
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name or name == 'identity':
+            continue
+        key, _, value = params.partition('=')
+        try:
+            if key.strip().lower() == 'q' and float(value) <= 0:
+                continue
+        except ValueError:
+            pass
+        encodings.add(name)
+    return encodings
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    if encoding == 'gzip':
+        # mtime fixo: mesmo body, mesmos bytes (e mesma assinatura em testes)
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == 'zstd' and zstandard:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"codificação não suportada: {encoding}")
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'zstd' and zstandard:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"codificação não suportada: {encoding}")
+
+def compress_file(path: Path, encoding: str, level: int = 6, chunk_size: int = 1024 * 1024) -> Path:
+    """Comprime um arquivo em streaming para um arquivo temporário (removido pelo chamador)"""
+    fd, tmp_name = tempfile.mkstemp(prefix=f"{path.name}.", suffix=f".{encoding}")
+    with open(path, 'rb') as src, open(fd, 'wb') as raw:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+        elif encoding == 'zstd' and zstandard:
+            zstandard.ZstdCompressor(level=level).copy_stream(src, raw, read_size=chunk_size)
+        else:
+            raise ValueError(f"codificação não suportada: {encoding}")
+    return Path(tmp_name)
+
+def is_encoding_rejection(response) -> bool:
+    """A função recusou o Content-Encoding enviado (415 ou código estruturado)"""
+    if response.status_code == 415:
+        return True
+    if response.status_code not in (400, 401):
+        return False
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get('code') == UNSUPPORTED_ENCODING_CODE
+
+class BodyCompressor:
+    """
+    Codificações aceitas por função (aprendidas das respostas) e economia de bytes
+
+    Compartilhado pelos transportes síncrono e assíncrono.
+    """
+
+    def __init__(self, config: AgentConfig):
+        self.min_bytes = config.compression_min_bytes
+        self.level = config.compression_level
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._accepted: Dict[str, Set[str]] = {}
+        # função → [bytes originais, bytes enviados, requisições comprimidas]
+        self._savings: Dict[str, list] = {}
+
+    @staticmethod
+    def _base(function: str) -> str:
+        """'ack-job/<id>' → 'ack-job'"""
+        return function.split('/', 1)[0]
+
+    def observe(self, function: str, response):
+        """Registra o Accept-Encoding anunciado pela função"""
+        header = response.headers.get('Accept-Encoding')
+        if header is None:
+            return
+        base = self._base(function)
+        accepted = parse_accept_encoding(header) & set(SUPPORTED_ENCODINGS)
+        with self._lock:
+            previous = self._accepted.get(base)
+            self._accepted[base] = accepted
+        if accepted and accepted != previous:
+            self.logger.info(f"🗜️  {base} aceita bodies comprimidos ({', '.join(sorted(accepted))})")
+
+    def reject(self, function: str, encoding: str):
+        """A função recusou a codificação: voltar a enviar sem compressão"""
+        base = self._base(function)
+        with self._lock:
+            self._accepted.get(base, set()).discard(encoding)
+        self.logger.warning(f"⚠️  {base} recusou body {encoding}, enviando sem compressão")
+
+    def choose(self, function: str) -> Optional[str]:
+        accepted = self._accepted.get(self._base(function))
+        if not accepted:
+            return None
+        for encoding in SUPPORTED_ENCODINGS:
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def encode(self, function: str, payload: Union[bytes, Path]) -> Tuple[Union[bytes, Path], Optional[str]]:
+        """
+        Comprime o body se a função aceitar e o tamanho justificar
+
+        Returns:
+            (body a enviar, codificação ou None). Um Path diferente do original
+            é um arquivo temporário que o chamador deve remover.
+        """
+        encoding = self.choose(function)
+        if encoding is None:
+            return payload, None
+
+        if isinstance(payload, Path):
+            size = payload.stat().st_size
+            if size < self.min_bytes:
+                return payload, None
+            encoded = compress_file(payload, encoding, self.level)
+            encoded_size = encoded.stat().st_size
+            if encoded_size >= size:
+                encoded.unlink()
+                return payload, None
+        else:
+            size = len(payload)
+            if size < self.min_bytes:
+                return payload, None
+            encoded = compress(payload, encoding, self.level)
+            encoded_size = len(encoded)
+            if encoded_size >= size:
+                # Incompressível (ex: dados já comprimidos)
+                return payload, None
+
+        with self._lock:
+            stats = self._savings.setdefault(self._base(function), [0, 0, 0])
+            stats[0] += size
+            stats[1] += encoded_size
+            stats[2] += 1
+        return encoded, encoding
+
+    def summary(self) -> str:
+        with self._lock:
+            items = sorted(self._savings.items())
+        if not items:
+            return "nenhum body comprimido"
+        return ", ".join(
+            f"{function} {count}x {original / 1024:.0f}→{sent / 1024:.0f} KiB"
+            for function, (original, sent, count) in items
+        )
@@ -3,8 +3,8 @@ Gerenciamento de configuração do agente
 """
 import json
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List
 
 @dataclass
 class AgentConfig:
@@ -15,10 +15,73 @@ class AgentConfig:
     server_url: str
     supabase_anon_key: str  # NOVO: anon key para REST API do Supabase
     heartbeat_interval: int = 60  # segundos
-    poll_interval: int = 30  # segundos
+    metrics_enabled: bool = True  # envio periódico ao submit-system-metrics
+    metrics_interval: int = 300  # segundos (servidor aceita 60 envios/hora)
+    metrics_sample_interval: float = 1.0  # segundos entre amostras de CPU/memória na janela
+    metrics_disk_path: str = "/"  # sistema de arquivos reportado em disk_*
+    combined_heartbeat: bool = False  # heartbeat embutido no poll-jobs (sem thread própria)
+    poll_interval: int = 30  # segundos (intervalo ocioso)
+    poll_min_interval: float = 1.0  # segundos entre polls após lote parcial
+    poll_backoff_factor: float = 2.0  # crescimento do intervalo após polls vazios
+    poll_batch_size: int = 10  # jobs por poll (limitado pelo servidor)
+    long_poll_enabled: bool = False  # segura o poll aberto até chegar job
+    long_poll_timeout: int = 25  # segundos que o servidor segura a requisição
+    long_poll_jitter: float = 2.0  # segundos máx. aleatórios antes de reconectar
     max_retries: int = 3
     retry_backoff: int = 2  # multiplicador exponencial
     request_timeout: int = 30  # segundos
+    runtime: str = "threads"  # "threads" ou "asyncio" (requer aiohttp)
+    http_pool_connections: int = 4  # hosts distintos mantidos no pool
+    http_pool_maxsize: int = 8  # conexões keep-alive por host
+    compression_enabled: bool = True  # gzip/zstd nas funções que anunciam Accept-Encoding
+    compression_min_bytes: int = 1024  # bodies menores seguem sem compressão
+    compression_level: int = 6  # nível do gzip (1-9) / zstd
+    rate_governor_enabled: bool = True  # orçamento local por função (limites do servidor)
+    rate_governor_max_wait: float = 10.0  # segundos máx. aguardando orçamento antes de desistir
+    rate_limits: Dict[str, List[int]] = field(default_factory=dict)  # {"função": [requisições, janela_s]}
+    job_concurrency: Dict[str, int] = field(
+        default_factory=lambda: {"scan": 1, "update": 1, "custom": 2}
+    )  # workers por tipo de job
+    job_queue_size: int = 20  # jobs aceitos e não finalizados (back-pressure)
+    job_drain_timeout: int = 30  # segundos aguardando jobs em execução no shutdown
+    scan_workers: int = 0  # processos hasher do scan (0 = número de CPUs)
+    scan_buffer_size: int = 1024 * 1024  # bytes lidos por chamada ao hashear
+    scan_max_file_size_mb: int = 100  # arquivos maiores são ignorados (0 = sem limite)
+    scan_progress_interval: int = 10  # segundos entre logs de progresso do scan
+    scan_batch_enabled: bool = True  # consultas ao scan-virus em lote ({"items": [...]})
+    scan_batch_max_items: int = 100  # hashes por lote (máximo aceito pelo servidor)
+    scan_batch_max_bytes: int = 256 * 1024  # tamanho aproximado do body de um lote
+    scan_batch_max_delay: float = 2.0  # segundos máx. que um hash espera pelo lote
+    scan_batch_in_flight: int = 2  # lotes enviados simultaneamente
+    watch_enabled: bool = False  # scan em tempo real dos diretórios de watch_paths
+    watch_paths: List[str] = field(default_factory=list)
+    watch_include: List[str] = field(default_factory=list)  # globs; vazio = todos
+    watch_exclude: List[str] = field(default_factory=list)
+    watch_debounce: float = 2.0  # segundos sem eventos antes de verificar o arquivo
+    watch_queue_max: int = 100_000  # arquivos aguardando; acima disso, rescan completo
+    watch_fallback_interval: int = 3600  # segundos entre scans sem inotify
+    data_dir: str = "data"  # estado local persistente (índices, caches)
+    outbox_enabled: bool = True  # heartbeats, métricas e ACKs gravados em disco até a entrega
+    outbox_max_entries: int = 10_000  # acima disso, as entradas menos prioritárias são descartadas
+    outbox_batch_size: int = 50  # entradas por rodada de reenvio
+    hash_index_enabled: bool = True  # reaproveitar hashes de arquivos inalterados
+    hash_index_max_entries: int = 2_000_000  # entradas mais antigas descartadas acima disso
+    hash_index_retention_days: int = 30  # entradas não vistas há mais tempo são removidas
+    verdict_cache_size: int = 100_000  # vereditos do scan-virus mantidos em memória (LRU)
+    verdict_ttl_clean: int = 3 * 24 * 3600  # segundos
+    verdict_ttl_malicious: int = 30 * 24 * 3600  # segundos
+    verdict_ttl_unknown: int = 3600  # segundos (hash ainda não analisado pelos serviços)
+    verdict_cache_persist: bool = True  # salvar o cache em data_dir entre reinícios
+    update_segments: int = 4  # segmentos Range paralelos nos downloads de update (1 = download único)
+    update_cache_dir: str = ""  # cache compartilhado (mesmo host/LAN) de artefatos por sha256; vazio = desativado
+    update_cache_wait: int = 600  # segundos aguardando outro host terminar o download do mesmo artefato
+    log_queue_size: int = 10_000  # registros aguardando a thread de escrita dos logs
+    log_queue_policy: str = "drop"  # fila cheia: "drop" descarta DEBUG/INFO, "block" aguarda espaço
+    log_format: str = "text"  # arquivo de log: "text" ou "json" (uma linha JSON por registro)
+    log_shipping_enabled: bool = False  # envio contínuo de logs/agent.log* ao diagnostics-agent-logs
+    log_ship_batch_bytes: int = 512 * 1024  # linhas por lote (bytes do log, antes da compressão)
+    log_ship_max_age: float = 60.0  # segundos máx. que uma linha nova espera pelo lote
+    log_ship_max_bytes_per_sec: int = 64 * 1024  # banda do upload dos lotes (0 = sem limite)
     
     def __post_init__(self):
         """Validação pós-inicialização"""
@@ -34,6 +97,64 @@ class AgentConfig:
             raise ValueError("heartbeat_interval deve ser >= 10 segundos")
         if self.poll_interval < 5:
             raise ValueError("poll_interval deve ser >= 5 segundos")
+        if self.metrics_interval < 60:
+            raise ValueError("metrics_interval deve ser >= 60 segundos")
+        if not 0.1 <= self.metrics_sample_interval <= self.metrics_interval:
+            raise ValueError("metrics_sample_interval deve estar entre 0.1 e metrics_interval segundos")
+        if self.poll_batch_size < 1:
+            raise ValueError("poll_batch_size deve ser >= 1")
+        if self.poll_backoff_factor < 1:
+            raise ValueError("poll_backoff_factor deve ser >= 1")
+        if self.long_poll_timeout < 1:
+            raise ValueError("long_poll_timeout deve ser >= 1 segundo")
+        if self.runtime not in ("threads", "asyncio"):
+            raise ValueError("runtime deve ser 'threads' ou 'asyncio'")
+        if self.http_pool_connections < 1 or self.http_pool_maxsize < 1:
+            raise ValueError("http_pool_connections e http_pool_maxsize devem ser >= 1")
+        if self.compression_min_bytes < 0:
+            raise ValueError("compression_min_bytes deve ser >= 0")
+        if not 1 <= self.compression_level <= 9:
+            raise ValueError("compression_level deve estar entre 1 e 9")
+        if self.rate_governor_max_wait < 0:
+            raise ValueError("rate_governor_max_wait deve ser >= 0")
+        if any(len(limit) != 2 or min(limit) < 1 for limit in self.rate_limits.values()):
+            raise ValueError("rate_limits deve mapear função → [requisições >= 1, janela_s >= 1]")
+        if not self.job_concurrency or any(n < 1 for n in self.job_concurrency.values()):
+            raise ValueError("job_concurrency deve ter ao menos um tipo, todos com >= 1 worker")
+        if self.job_queue_size < 1:
+            raise ValueError("job_queue_size deve ser >= 1")
+        if self.scan_workers < 0:
+            raise ValueError("scan_workers deve ser >= 0")
+        if self.scan_buffer_size < 4096:
+            raise ValueError("scan_buffer_size deve ser >= 4096 bytes")
+        if not 1 <= self.scan_batch_max_items <= 100:
+            raise ValueError("scan_batch_max_items deve estar entre 1 e 100")
+        if self.scan_batch_in_flight < 1 or self.scan_batch_max_delay <= 0:
+            raise ValueError("scan_batch_in_flight deve ser >= 1 e scan_batch_max_delay > 0")
+        if self.watch_debounce < 0 or self.watch_queue_max < 1 or self.watch_fallback_interval < 60:
+            raise ValueError("watch_debounce >= 0, watch_queue_max >= 1 e watch_fallback_interval >= 60")
+        if self.hash_index_max_entries < 1 or self.hash_index_retention_days < 1:
+            raise ValueError("hash_index_max_entries e hash_index_retention_days devem ser >= 1")
+        if self.outbox_max_entries < 1 or self.outbox_batch_size < 1:
+            raise ValueError("outbox_max_entries e outbox_batch_size devem ser >= 1")
+        if self.verdict_cache_size < 0:
+            raise ValueError("verdict_cache_size deve ser >= 0 (0 desativa o cache)")
+        if not 1 <= self.update_segments <= 16:
+            raise ValueError("update_segments deve estar entre 1 e 16")
+        if self.update_cache_wait < 0:
+            raise ValueError("update_cache_wait deve ser >= 0")
+        if self.log_queue_size < 100:
+            raise ValueError("log_queue_size deve ser >= 100")
+        if self.log_queue_policy not in ("drop", "block"):
+            raise ValueError("log_queue_policy deve ser 'drop' ou 'block'")
+        if self.log_format not in ("text", "json"):
+            raise ValueError("log_format deve ser 'text' ou 'json'")
+        if not 4096 <= self.log_ship_batch_bytes <= 8 * 1024 * 1024:
+            raise ValueError("log_ship_batch_bytes deve estar entre 4096 e 8 MB")
+        if self.log_ship_max_age < 1:
+            raise ValueError("log_ship_max_age deve ser >= 1 segundo")
+        if self.log_ship_max_bytes_per_sec and self.log_ship_max_bytes_per_sec < 1024:
+            raise ValueError("log_ship_max_bytes_per_sec deve ser 0 (sem limite) ou >= 1024")
 
 def load_config(config_path: str) -> AgentConfig:
     """
@@ -0,0 +1,159 @@
+"""
+Patches binários entre versões do executável do agente (formato csdelta1)
+
+Um patch descreve o executável novo como uma sequência de cópias de
+trechos do executável instalado e de bytes novos (inserções), comprimida
+com LZMA. Em um onefile do PyInstaller os módulos que não mudaram são
+trechos idênticos (apenas deslocados), e o patch fica muito menor que o
+executável inteiro.
+
+    MAGIC | tamanho do alvo (u64) | SHA256 da origem (32 bytes) | xz(operações)
+
+    COPY   0x01 | offset na origem (u64) | tamanho (u32)
+    INSERT 0x02 | tamanho (u32) | bytes
+    END    0x00
+
+O aplicador não confia no patch: o resultado é sempre comparado pelo
+chamador com o SHA256 completo anunciado pelo check-agent-updates.
+Os patches são gerados por tools/make_update_patch.py.
+"""
+import lzma
+import struct
+import hashlib
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+PATCH_FORMAT = 'csdelta1'
+MAGIC = b'CSDELTA1'
+
+OP_END = 0x00
+OP_COPY = 0x01
+OP_INSERT = 0x02
+
+_HEADER = struct.Struct('<Q32s')
+_COPY = struct.Struct('<QI')
+_INSERT = struct.Struct('<I')
+
+MAX_OP_LENGTH = 0xFFFFFFFF
+CHUNK_SIZE = 1024 * 1024
+
+class PatchError(Exception):
+    """Patch inválido, truncado ou gerado para outra origem"""
+
+class PatchWriter:
+    """Grava um patch csdelta1 (cópias contíguas são unidas automaticamente)"""
+
+    def __init__(self, fileobj: BinaryIO, target_size: int, source_sha256: str, preset: int = 9):
+        self._out = fileobj
+        self._out.write(MAGIC + _HEADER.pack(target_size, bytes.fromhex(source_sha256)))
+        self._compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=preset)
+        self._pending_copy: Optional[Tuple[int, int]] = None
+        self.copied = 0
+        self.inserted = 0
+
+    def copy(self, offset: int, length: int):
+        if self._pending_copy:
+            start, size = self._pending_copy
+            if start + size == offset and size + length <= MAX_OP_LENGTH:
+                self._pending_copy = (start, size + length)
+                return
+            self._flush_copy()
+        self._pending_copy = (offset, length)
+
+    def insert(self, data: bytes):
+        self._flush_copy()
+        for start in range(0, len(data), MAX_OP_LENGTH):
+            piece = data[start:start + MAX_OP_LENGTH]
+            self._emit(bytes([OP_INSERT]) + _INSERT.pack(len(piece)))
+            self._emit(piece)
+            self.inserted += len(piece)
+
+    def close(self):
+        self._flush_copy()
+        self._emit(bytes([OP_END]))
+        self._out.write(self._compressor.flush())
+
+    def _flush_copy(self):
+        if self._pending_copy:
+            offset, length = self._pending_copy
+            self._emit(bytes([OP_COPY]) + _COPY.pack(offset, length))
+            self.copied += length
+            self._pending_copy = None
+
+    def _emit(self, data: bytes):
+        self._out.write(self._compressor.compress(data))
+
+def read_header(patch: Path) -> Tuple[int, str]:
+    """(tamanho do alvo, SHA256 da origem) de um patch"""
+    with open(patch, 'rb') as f:
+        return _read_header(f)
+
+def _read_header(f: BinaryIO) -> Tuple[int, str]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise PatchError("formato de patch desconhecido")
+    raw = f.read(_HEADER.size)
+    if len(raw) != _HEADER.size:
+        raise PatchError("cabeçalho do patch truncado")
+    target_size, source_sha256 = _HEADER.unpack(raw)
+    return target_size, source_sha256.hex()
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise PatchError("patch truncado")
+    return data
+
+def apply_patch(source: Path, patch: Path, output: Path, source_sha256: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Reconstrói o executável novo a partir do instalado, em streaming
+
+    Args:
+        source: executável instalado
+        patch: arquivo csdelta1
+        output: destino (sobrescrito)
+        source_sha256: SHA256 já conhecido da origem, conferido com o patch
+            antes de qualquer escrita
+
+    Returns:
+        (SHA256 hex, tamanho) do arquivo gerado
+    """
+    sha256 = hashlib.sha256()
+    written = 0
+    try:
+        with open(patch, 'rb') as raw_patch, open(source, 'rb') as src, open(output, 'wb') as dst:
+            target_size, patch_source = _read_header(raw_patch)
+            if source_sha256 and patch_source != source_sha256.lower():
+                raise PatchError("patch gerado para outro executável de origem")
+            source_size = src.seek(0, 2)
+
+            with lzma.open(raw_patch, 'rb', format=lzma.FORMAT_XZ) as ops:
+                while True:
+                    op = _read_exact(ops, 1)[0]
+                    if op == OP_END:
+                        break
+                    if op == OP_COPY:
+                        offset, length = _COPY.unpack(_read_exact(ops, _COPY.size))
+                        if offset + length > source_size:
+                            raise PatchError("cópia fora dos limites da origem")
+                        src.seek(offset)
+                        reader = src
+                    elif op == OP_INSERT:
+                        (length,) = _INSERT.unpack(_read_exact(ops, _INSERT.size))
+                        reader = ops
+                    else:
+                        raise PatchError(f"operação desconhecida no patch: {op:#x}")
+
+                    if written + length > target_size:
+                        raise PatchError("patch gera mais bytes que o anunciado")
+                    while length:
+                        chunk = _read_exact(reader, min(CHUNK_SIZE, length))
+                        dst.write(chunk)
+                        sha256.update(chunk)
+                        written += len(chunk)
+                        length -= len(chunk)
+    except (lzma.LZMAError, EOFError) as e:
+        raise PatchError(f"patch corrompido: {e}")
+
+    if written != target_size:
+        raise PatchError(f"patch gerou {written} bytes, esperado {target_size}")
+    return sha256.hexdigest(), written
@@ -0,0 +1,355 @@
+"""
+Scan incremental em tempo real (Linux, inotify via ctypes)
+
+Os diretórios de watch_paths são monitorados recursivamente; rajadas de
+eventos de escrita são agrupadas (debounce) em uma fila sem duplicatas e
+apenas os arquivos alterados seguem para o hash e a consulta de vereditos.
+Se o limite de watches do kernel for atingido (ENOSPC), ou fora do Linux,
+o watcher volta a scans periódicos completos (baratos com o HashIndex).
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from collections import OrderedDict
+from threading import Event
+from typing import Dict, List, Optional, Tuple
+
+from config import AgentConfig
+from http_transport import AgentTransport
+from hash_index import HashIndex
+from scan_engine import ScanEngine, ScanSpec
+from scan_client import ScanClient
+from scan_coalescer import ScanCoalescer
+from verdict_cache import VerdictCache
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE_SELF
+    | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+# Arquivos alterados verificados por ciclo do loop
+SCAN_BATCH = 1000
+
+# errnos de inotify_init1/inotify_add_watch que indicam limite do kernel
+LIMIT_ERRNOS = (errno.ENOSPC, errno.EMFILE, errno.ENOMEM)
+
+class Inotify:
+    """Wrapper mínimo de inotify(7) via ctypes (sem dependências externas)"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._add_watch.restype = ctypes.c_int
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path: str) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """Eventos (wd, mask, name) disponíveis em até timeout segundos"""
+        if not self._poll.poll(int(timeout * 1000)):
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class WatchLimitReached(Exception):
+    """Limite de watches/instâncias do inotify atingido"""
+
+class FsWatcher:
+    """Monitora watch_paths e verifica arquivos novos/alterados continuamente"""
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        transport: AgentTransport,
+        verdict_cache: Optional[VerdictCache] = None
+    ):
+        self.config = config
+        self.stop_event = stop_event
+        self.transport = transport
+        self.verdict_cache = verdict_cache
+        self.logger = logging.getLogger(__name__)
+
+        self.spec = ScanSpec(
+            roots=[os.path.abspath(os.path.expanduser(p)) for p in config.watch_paths],
+            include=[p.lower() for p in config.watch_include],
+            exclude=list(config.watch_exclude),
+            recursive=True,
+            max_file_size=config.scan_max_file_size_mb * 1024 * 1024
+        )
+
+        self.inotify: Optional[Inotify] = None
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+        # caminho → instante a partir do qual o arquivo está "quieto" (debounce);
+        # a ordem de inserção acompanha o último evento, logo os prazos são crescentes
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+        self._rescan_requested = False
+
+        self._engine: Optional[ScanEngine] = None
+        self._client: Optional[ScanClient] = None
+        self._coalescer: Optional[ScanCoalescer] = None
+        self._index: Optional[HashIndex] = None
+
+    def run(self):
+        """Loop principal (thread própria); retorna quando stop_event é setado"""
+        if not self.spec.roots:
+            self.logger.warning("⚠️  watch_enabled sem watch_paths, watcher não iniciado")
+            return
+
+        self._client = ScanClient(self.config, self.transport, self.verdict_cache)
+        if self.config.scan_batch_enabled:
+            self._coalescer = ScanCoalescer(self.config, self._client, self.stop_event)
+        if self.config.hash_index_enabled:
+            self._index = HashIndex(
+                os.path.join(self.config.data_dir, 'hash_index.db'),
+                max_entries=self.config.hash_index_max_entries,
+                retention_days=self.config.hash_index_retention_days
+            )
+            self._index.open()
+
+        try:
+            with ScanEngine(self.config, self.stop_event, self._index) as engine:
+                self._engine = engine
+                if sys.platform.startswith('linux') and self._start_watching():
+                    self._watch_loop()
+                self._periodic_loop()
+        except Exception as e:
+            self.logger.error(f"❌ Erro no watcher: {e}")
+        finally:
+            self._stop_watching()
+            if self._coalescer:
+                self._coalescer.close()
+            if self._index:
+                self._index.close()
+            if self.verdict_cache is not None:
+                self.verdict_cache.save()
+
+    def _on_result(self, result):
+        if self._coalescer:
+            self._coalescer.submit(result.path, result.sha256)
+        else:
+            self._client.check(result.path, result.sha256)
+
+    # ------------------------------------------------------------------
+    # inotify
+    # ------------------------------------------------------------------
+
+    def _start_watching(self) -> bool:
+        """Cria os watches recursivos; False se o kernel não comporta"""
+        try:
+            self.inotify = Inotify()
+            for root in self.spec.roots:
+                self._add_tree(root, enqueue=False)
+        except (OSError, WatchLimitReached) as e:
+            self._fallback(e)
+            return False
+
+        self.logger.info(
+            f"👁️  Monitorando {len(self._wd_paths)} diretório(s) em {', '.join(self.spec.roots)} "
+            f"(debounce: {self.config.watch_debounce}s)"
+        )
+        return True
+
+    def _stop_watching(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+        self._wd_paths.clear()
+        self._path_wds.clear()
+
+    def _fallback(self, error: Exception):
+        self.logger.warning(
+            f"⚠️  inotify indisponível ({error}); usando scan periódico a cada "
+            f"{self.config.watch_fallback_interval}s. Aumente fs.inotify.max_user_watches "
+            f"para o modo em tempo real"
+        )
+        self._stop_watching()
+        self._pending.clear()
+
+    def _add_tree(self, root: str, enqueue: bool):
+        """Adiciona watches em root e subdiretórios; com enqueue, agenda os arquivos já existentes"""
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            try:
+                wd = self.inotify.add_watch(current)
+            except OSError as e:
+                if e.errno in LIMIT_ERRNOS:
+                    raise WatchLimitReached(f"{e.strerror} ({len(self._wd_paths)} watches)")
+                continue  # removido ou sem permissão
+            self._wd_paths[wd] = current
+            self._path_wds[current] = wd
+
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.spec.excludes_dir(entry.path, entry.name):
+                                stack.append(entry.path)
+                        elif enqueue and entry.is_file(follow_symlinks=False):
+                            self._enqueue(entry.path, entry.name)
+            except OSError:
+                continue
+
+    def _remove_tree(self, root: str):
+        """Remove os watches de um diretório movido para fora (o wd seguiria o diretório)"""
+        prefix = root + os.sep
+        for path in [p for p in self._path_wds if p == root or p.startswith(prefix)]:
+            wd = self._path_wds.pop(path)
+            self._wd_paths.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def _enqueue(self, path: str, name: str):
+        if not self.spec.accepts_file(path, name):
+            return
+        if len(self._pending) >= self.config.watch_queue_max:
+            # Rajada maior que a fila: um rescan completo (com índice) é mais barato
+            self.logger.warning("⚠️  Fila de arquivos alterados cheia, agendando rescan completo")
+            self._pending.clear()
+            self._rescan_requested = True
+            return
+        self._pending[path] = time.monotonic() + self.config.watch_debounce
+        self._pending.move_to_end(path)
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self.logger.warning("⚠️  Fila do inotify transbordou, agendando rescan completo")
+            self._rescan_requested = True
+            return
+
+        base = self._wd_paths.get(wd)
+        if base is None:
+            return
+        if mask & IN_IGNORED:
+            # Diretório removido (ou watch removido): o wd não é mais válido
+            self._wd_paths.pop(wd, None)
+            if self._path_wds.get(base) == wd:
+                del self._path_wds[base]
+            return
+        if not name:
+            return
+
+        path = os.path.join(base, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if not self.spec.excludes_dir(path, name):
+                    self._add_tree(path, enqueue=True)
+            elif mask & IN_MOVED_FROM:
+                self._remove_tree(path)
+            return
+
+        # IN_CREATE cobre hardlinks (sem close_write); o debounce absorve o resto
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE):
+            self._enqueue(path, name)
+
+    def _take_ready(self) -> List[str]:
+        now = time.monotonic()
+        ready = []
+        while self._pending and len(ready) < SCAN_BATCH:
+            path, deadline = next(iter(self._pending.items()))
+            if deadline > now:
+                break
+            self._pending.popitem(last=False)
+            ready.append(path)
+        return ready
+
+    def _watch_loop(self):
+        while not self.stop_event.is_set():
+            timeout = 1.0
+            if self._pending:
+                first_deadline = next(iter(self._pending.values()))
+                timeout = min(timeout, max(0.0, first_deadline - time.monotonic()))
+
+            try:
+                for wd, mask, name in self.inotify.read_events(timeout):
+                    self._handle_event(wd, mask, name)
+            except WatchLimitReached as e:
+                self._fallback(e)
+                return
+
+            if self._rescan_requested:
+                self._rescan_requested = False
+                self._pending.clear()
+                self._full_scan()
+                continue
+
+            ready = self._take_ready()
+            if ready:
+                spec = ScanSpec(roots=ready, max_file_size=self.spec.max_file_size)
+                stats = self._engine.run(spec, self._on_result, verbose=False)
+                self.logger.info(
+                    f"🔎 {stats.files_hashed + stats.files_cached} arquivo(s) alterado(s) verificado(s)"
+                    f" ({len(self._pending)} aguardando)"
+                )
+
+    # ------------------------------------------------------------------
+    # Fallback: scans periódicos
+    # ------------------------------------------------------------------
+
+    def _full_scan(self):
+        self._engine.run(self.spec, self._on_result)
+        if self._index and not self.stop_event.is_set():
+            self._index.compact()
+
+    def _periodic_loop(self):
+        while not self.stop_event.is_set():
+            self._full_scan()
+            self.logger.info(f"  → Vereditos: {self._client.summary()}")
+            if self.stop_event.wait(self.config.watch_fallback_interval):
+                break
@@ -0,0 +1,188 @@
+"""
+Índice persistente de hashes de arquivos (SQLite em modo WAL)
+
+Guarda, por caminho, (st_dev, st_ino, size, mtime_ns, sha256). Em rescans,
+arquivos com a mesma tupla de stat reutilizam o hash do índice e não são
+relidos. O índice é apenas um cache: se o arquivo estiver corrompido ele é
+movido para quarentena e recriado vazio (custo: um scan completo).
+"""
+import os
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Escritas acumuladas por transação
+FLUSH_EVERY = 1000
+
+# Arquivos modificados há menos que isso não entram no índice: uma escrita
+# logo após o hash pode manter o mesmo mtime (granularidade do filesystem)
+RACY_WINDOW_NS = 2 * 1_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    last_seen INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_last_seen ON files (last_seen);
+"""
+
+def _today() -> int:
+    return int(time.time() // 86400)
+
+class HashIndex:
+    """Índice path → (stat, sha256) usado pelo scan para pular arquivos inalterados"""
+
+    def __init__(self, db_path: str, max_entries: int, retention_days: int):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.retention_days = retention_days
+        self.logger = logging.getLogger(__name__)
+
+        self.conn: Optional[sqlite3.Connection] = None
+        self._today = _today()
+        self._pending_upserts: List[Tuple] = []
+        self._pending_touches: List[Tuple] = []
+
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Abre (ou cria) o índice; um arquivo corrompido é reconstruído"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._connect()
+            if self.conn.execute("PRAGMA quick_check").fetchone()[0] != 'ok':
+                raise sqlite3.DatabaseError("quick_check falhou")
+        except sqlite3.DatabaseError as e:
+            self._rebuild(e)
+
+    def _connect(self):
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _rebuild(self, error: Exception):
+        """Move o índice corrompido para quarentena e recria vazio"""
+        self.logger.warning(f"⚠️  Índice de hashes corrompido ({error}), recriando")
+        if self.conn:
+            try:
+                self.conn.close()
+            except sqlite3.Error:
+                pass
+            self.conn = None
+
+        suffix = f".corrupt-{int(time.time())}"
+        for extra in ('', '-wal', '-shm'):
+            src = Path(f"{self.db_path}{extra}")
+            if src.exists():
+                os.replace(src, f"{self.db_path}{suffix}{extra}")
+
+        self._pending_upserts.clear()
+        self._pending_touches.clear()
+        self._connect()
+
+    def lookup(self, path: str, dev: int, ino: int, size: int, mtime_ns: int) -> Optional[str]:
+        """
+        Returns:
+            sha256 indexado se a tupla de stat não mudou, senão None
+        """
+        try:
+            row = self.conn.execute(
+                "SELECT dev, ino, size, mtime_ns, sha256, last_seen FROM files WHERE path = ?",
+                (path,)
+            ).fetchone()
+        except sqlite3.DatabaseError as e:
+            self._rebuild(e)
+            row = None
+
+        if row is None or row[:4] != (dev, ino, size, mtime_ns):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # Evitar reescrever a linha a cada scan do mesmo dia
+        if row[5] != self._today:
+            self._pending_touches.append((self._today, path))
+            self._maybe_flush()
+        return row[4]
+
+    def record(self, path: str, dev: int, ino: int, size: int, mtime_ns: int, sha256: str):
+        """Registra o hash recém-calculado de um arquivo"""
+        if mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+            return
+        self._pending_upserts.append((path, dev, ino, size, mtime_ns, sha256, self._today))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._pending_upserts) + len(self._pending_touches) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Grava as escritas pendentes em uma única transação"""
+        if not self._pending_upserts and not self._pending_touches:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, dev, ino, size, mtime_ns, sha256, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._pending_upserts
+                )
+                self.conn.executemany("UPDATE files SET last_seen = ? WHERE path = ?", self._pending_touches)
+        except sqlite3.DatabaseError as e:
+            self._rebuild(e)
+        finally:
+            self._pending_upserts.clear()
+            self._pending_touches.clear()
+
+    def compact(self):
+        """
+        Remove entradas não vistas há retention_days, aplica max_entries
+        (descartando as mais antigas) e devolve o espaço livre ao disco
+        """
+        self.flush()
+        try:
+            with self.conn:
+                expired = self.conn.execute(
+                    "DELETE FROM files WHERE last_seen < ?",
+                    (self._today - self.retention_days,)
+                ).rowcount
+
+                total = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                excess = max(0, total - self.max_entries)
+                if excess:
+                    self.conn.execute(
+                        "DELETE FROM files WHERE path IN "
+                        "(SELECT path FROM files ORDER BY last_seen LIMIT ?)",
+                        (excess,)
+                    )
+
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages / page_count > 0.25:
+                self.conn.execute("VACUUM")
+
+            if expired or excess:
+                self.logger.info(
+                    f"🧹 Índice de hashes compactado: {expired} expiradas, {excess} acima do limite"
+                )
+        except sqlite3.DatabaseError as e:
+            self._rebuild(e)
+
+    def close(self):
+        if self.conn:
+            try:
+                self.flush()
+                self.conn.close()
+            except sqlite3.Error as e:
+                self.logger.error(f"❌ Erro ao fechar índice de hashes: {e}")
+            self.conn = None
@@ -1,31 +1,99 @@
 """
 Componente de envio de heartbeats
 """
+import json
 import time
+import hashlib
 import logging
 import requests
 import platform
 from threading import Event
-from typing import Optional
+from typing import Dict, Any, Optional
 
 from config import AgentConfig
-from hmac_utils import generate_hmac_headers
+from http_transport import AgentTransport
+from outbox import Outbox, PRIORITY_HEARTBEAT
+from rate_governor import RateLimited
+from retry_policy import DecorrelatedJitter
+
+# Teto do intervalo entre heartbeats após falhas consecutivas
+MAX_HEARTBEAT_BACKOFF = 300
 
 class HeartbeatSender:
     """Envia heartbeats periódicos ao servidor"""
     
-    def __init__(self, config: AgentConfig, stop_event: Event):
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        transport: AgentTransport,
+        outbox: Optional[Outbox] = None,
+        restarted_at: Optional[float] = None
+    ):
         self.config = config
         self.stop_event = stop_event
+        self.transport = transport
+        self.outbox = outbox
+        # Epoch do exec quando o processo é o reinício de uma atualização
+        self.restarted_at = restarted_at
+        # Sinalizado no primeiro heartbeat aceito (--startup-profile aguarda por ele)
+        self.first_heartbeat = Event()
         self.logger = logging.getLogger(__name__)
+        self._retry_count = 0
+        self._backoff = DecorrelatedJitter(config.heartbeat_interval, MAX_HEARTBEAT_BACKOFF)
+        # Último envio recusado por rate limit (servidor ou orçamento local)
+        self._rate_limited = False
         
         # Sistema operacional info
-        self.os_info = {
+        self.os_info = self._collect_os_info()
+        # Hash do OS info confirmado pelo servidor (modo combined_heartbeat)
+        self._acked_os_info_hash: Optional[str] = None
+    
+    @staticmethod
+    def _collect_os_info() -> Dict[str, str]:
+        return {
             "os_type": platform.system(),
             "os_version": platform.version(),
             "hostname": platform.node()
         }
     
+    @staticmethod
+    def os_info_hash(os_info: Dict[str, str]) -> str:
+        """SHA256 do OS info em JSON canônico"""
+        canonical = json.dumps(os_info, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    def compact_heartbeat(self) -> Dict[str, Any]:
+        """
+        Heartbeat embutido no poll-jobs (modo combined_heartbeat)
+        
+        O OS info completo só é incluído no primeiro contato, quando muda
+        ou quando o servidor pede (X-OS-Info-Required); nos demais polls
+        vai apenas o hash.
+        """
+        self.os_info = self._collect_os_info()
+        current_hash = self.os_info_hash(self.os_info)
+        heartbeat: Dict[str, Any] = {"os_info_hash": current_hash}
+        if current_hash != self._acked_os_info_hash:
+            heartbeat["os_info"] = self.os_info
+        return heartbeat
+    
+    def handle_combined_response(self, response, heartbeat: Dict[str, Any]):
+        """Registra o resultado do heartbeat enviado junto com o poll"""
+        if response.headers.get('X-OS-Info-Required'):
+            self._acked_os_info_hash = None
+        elif "os_info" in heartbeat:
+            self._acked_os_info_hash = heartbeat["os_info_hash"]
+        self._on_accepted()
+    
+    def _on_accepted(self):
+        """Heartbeat aceito: sinaliza o primeiro e loga a latência do reinício pós-atualização"""
+        self.first_heartbeat.set()
+        if self.restarted_at is not None:
+            latency = time.time() - self.restarted_at
+            self.restarted_at = None
+            self.logger.info(f"⏱️  Primeiro heartbeat após a atualização: {latency * 1000:.0f} ms desde o reinício")
+    
     def send_heartbeat(self) -> bool:
         """
         Envia um heartbeat ao servidor
@@ -33,78 +101,90 @@ class HeartbeatSender:
         Returns:
             True se sucesso, False caso contrário
         """
-        url = f"{self.config.server_url}/functions/v1/heartbeat"
-        
-        # Preparar headers
-        headers = {
-            'X-Agent-Token': self.config.agent_token,
-            'Content-Type': 'application/json',
-        }
-        
-        # Body com informações do SO
-        body = self.os_info
-        
-        # Adicionar HMAC headers
-        import json
-        body_str = json.dumps(body)
-        hmac_headers = generate_hmac_headers(
-            self.config.hmac_secret,
-            body_str
-        )
-        headers.update(hmac_headers)
-        
         try:
-            response = requests.post(
-                url,
-                json=body,
-                headers=headers,
-                timeout=self.config.request_timeout
-            )
-            
-            if response.status_code == 200:
-                self.logger.debug(f"✅ Heartbeat enviado com sucesso")
-                return True
-            elif response.status_code == 401:
-                self.logger.error(f"❌ Heartbeat rejeitado: Autenticação falhou")
-                self.logger.error(f"Response: {response.text}")
-                return False
-            elif response.status_code == 429:
-                self.logger.warning(f"⚠️  Rate limit excedido. Aguardando...")
-                return False
+            # Body com informações do SO (assinado pelo transporte)
+            if self.outbox:
+                # Só o heartbeat mais recente fica na outbox
+                response = self.outbox.send('heartbeat', self.os_info, PRIORITY_HEARTBEAT, key='heartbeat')
+                if response is None:
+                    self._rate_limited = True
+                    self.logger.warning("⚠️  Heartbeat adiado (rate limit), mantido na outbox")
+                    return False
             else:
-                self.logger.warning(f"⚠️  Heartbeat falhou: HTTP {response.status_code}")
-                return False
+                response = self.transport.post('heartbeat', self.os_info)
+            return self.handle_response(response)
                 
+        except RateLimited as e:
+            self._rate_limited = True
+            self.logger.warning(f"⚠️  Heartbeat adiado: {e}")
+            return False
         except requests.exceptions.Timeout:
-            self.logger.warning(f"⚠️  Heartbeat timeout")
+            self.logger.warning("⚠️  Heartbeat timeout")
             return False
         except requests.exceptions.ConnectionError:
-            self.logger.warning(f"⚠️  Erro de conexão ao servidor")
+            self.logger.warning("⚠️  Erro de conexão ao servidor")
             return False
         except Exception as e:
             self.logger.error(f"❌ Erro ao enviar heartbeat: {e}")
             return False
     
+    def handle_response(self, response) -> bool:
+        """
+        Interpreta a resposta do heartbeat (independente do transporte)
+        
+        Returns:
+            True se sucesso, False caso contrário
+        """
+        if response.status_code == 200:
+            self.logger.debug("✅ Heartbeat enviado com sucesso")
+            self._on_accepted()
+            return True
+        elif response.status_code == 401:
+            self.logger.error("❌ Heartbeat rejeitado: Autenticação falhou")
+            self.logger.error(f"Response: {response.text}")
+            return False
+        elif response.status_code == 429:
+            self._rate_limited = True
+            self.logger.warning("⚠️  Rate limit excedido. Aguardando...")
+            return False
+        else:
+            self.logger.warning(f"⚠️  Heartbeat falhou: HTTP {response.status_code}")
+            return False
+    
+    def next_delay(self, success: bool) -> float:
+        """
+        Intervalo até o próximo heartbeat, com backoff após falhas consecutivas
+
+        O backoff usa jitter: após uma queda do servidor, os agentes não
+        voltam todos no mesmo instante.
+        """
+        if success:
+            self._retry_count = 0
+            self._backoff.reset()
+            return self.config.heartbeat_interval
+        
+        if self._rate_limited:
+            # Rate limit não é falha do agente: aguardar o orçamento, sem backoff
+            self._rate_limited = False
+            governor = self.transport.governor
+            wait = governor.blocked_for('heartbeat') if governor else 0.0
+            return max(self.config.heartbeat_interval, wait)
+        
+        self._retry_count += 1
+        if self._retry_count >= self.config.max_retries:
+            backoff = self._backoff.next()
+            self.logger.warning(f"⚠️  {self._retry_count} falhas consecutivas. Aguardando {backoff:.0f}s...")
+            return backoff
+        return self.config.heartbeat_interval
+    
     def run(self):
         """Loop principal de heartbeat"""
         self.logger.info(f"💓 Heartbeat sender iniciado (intervalo: {self.config.heartbeat_interval}s)")
         
-        retry_count = 0
-        
         while not self.stop_event.is_set():
             success = self.send_heartbeat()
             
-            if success:
-                retry_count = 0
-            else:
-                retry_count += 1
-                if retry_count >= self.config.max_retries:
-                    backoff = min(300, self.config.heartbeat_interval * (2 ** retry_count))
-                    self.logger.warning(f"⚠️  {retry_count} falhas consecutivas. Aguardando {backoff}s...")
-                    self.stop_event.wait(backoff)
-                    continue
-            
             # Aguardar próximo heartbeat
-            self.stop_event.wait(self.config.heartbeat_interval)
+            self.stop_event.wait(self.next_delay(success))
         
         self.logger.info("💓 Heartbeat sender parado")
@@ -5,11 +5,78 @@ import hmac
 import hashlib
 import uuid
 import time
-from typing import Dict
+from typing import Dict, Iterable, Optional, Union
+
+class Signature:
+    """
+    Assinatura em andamento: o body é alimentado em pedaços com update()
+
+    O payload assinado é o mesmo de generate_hmac_headers
+    ("{timestamp}:{nonce}:{body}"), sem montar o body inteiro em memória.
+    """
+
+    def __init__(self, mac: "hmac.HMAC", timestamp_ms: Optional[int] = None):
+        if timestamp_ms is None:
+            timestamp_ms = int(time.time() * 1000)
+        self.timestamp = str(timestamp_ms)
+        self.nonce = str(uuid.uuid4())
+        self._mac = mac
+        self._mac.update(f"{self.timestamp}:{self.nonce}:".encode('utf-8'))
+
+    def update(self, chunk: Union[bytes, str]):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self._mac.update(chunk)
+
+    def hexdigest(self) -> str:
+        return self._mac.hexdigest()
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            'X-HMAC-Signature': self.hexdigest(),
+            'X-Timestamp': self.timestamp,
+            'X-Nonce': self.nonce
+        }
+
+class Signer:
+    """
+    Assinador HMAC-SHA256 pré-chaveado
+
+    A chave é decodificada e o HMAC chaveado uma única vez; cada assinatura
+    parte de um copy(), que reaproveita os estados internos já calculados.
+    Compartilhável entre threads.
+    """
+
+    def __init__(self, hmac_secret: str):
+        self._mac = hmac.new(bytes.fromhex(hmac_secret), digestmod=hashlib.sha256)
+
+    def begin(self, timestamp_ms: Optional[int] = None) -> Signature:
+        """Inicia uma assinatura incremental (body via update())"""
+        return Signature(self._mac.copy(), timestamp_ms)
+
+    def sign(self, body: Union[bytes, str] = b"", timestamp_ms: Optional[int] = None) -> Dict[str, str]:
+        """Headers X-HMAC-Signature, X-Timestamp e X-Nonce para um body completo"""
+        signature = self.begin(timestamp_ms)
+        signature.update(body)
+        return signature.headers()
+
+    def sign_chunks(self, chunks: Iterable[bytes], timestamp_ms: Optional[int] = None) -> Dict[str, str]:
+        """Headers para um body lido em pedaços (ex: arquivo grande), sem concatená-lo"""
+        signature = self.begin(timestamp_ms)
+        for chunk in chunks:
+            signature.update(chunk)
+        return signature.headers()
+
+    def verify(self, signature: str, timestamp: str, nonce: str, body: Union[bytes, str] = b"") -> bool:
+        mac = self._mac.copy()
+        mac.update(f"{timestamp}:{nonce}:".encode('utf-8'))
+        mac.update(body.encode('utf-8') if isinstance(body, str) else body)
+        return hmac.compare_digest(signature, mac.hexdigest())
 
 def generate_hmac_headers(
     hmac_secret: str,
-    body: str = ""
+    body: str = "",
+    timestamp_ms: Optional[int] = None
 ) -> Dict[str, str]:
     """
     Gera headers HMAC-SHA256 para autenticação
@@ -17,12 +84,17 @@ def generate_hmac_headers(
     Args:
         hmac_secret: Secret de 64 caracteres (32 bytes em hex)
         body: Corpo da requisição (JSON string ou vazio)
+        timestamp_ms: Timestamp a assinar (padrão: relógio local), ex: corrigido pelo ServerClock
     
     Returns:
         Dict com headers X-HMAC-Signature, X-Timestamp, X-Nonce
+
+    Para assinaturas repetidas com o mesmo secret use Signer (chave decodificada uma vez)
     """
     # Gerar timestamp e nonce
-    timestamp = str(int(time.time() * 1000))  # milissegundos
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    timestamp = str(timestamp_ms)  # milissegundos
     nonce = str(uuid.uuid4())
     
     # Construir payload
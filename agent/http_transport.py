@@ -0,0 +1,339 @@
+"""
+Transporte HTTP compartilhado por todos os componentes do agente
+Mantém conexões keep-alive com o servidor e centraliza a autenticação
+"""
+import io
+import os
+import json
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, Union
+
+from config import AgentConfig
+from hmac_utils import Signer
+from compression import BodyCompressor, is_encoding_rejection
+from rate_governor import RateGovernor, RateLimited
+from retry_policy import (
+    CLOCK_SKEW, OK, RetryState, ServerClock, classify_error, classify_response
+)
+
+# Pedaços de leitura de bodies enviados a partir de arquivo
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Blocos entregues ao socket por uploads com banda limitada
+THROTTLE_BLOCK_SIZE = 16 * 1024
+
+def serialize_body(body: Optional[Any]) -> Union[bytes, Path]:
+    """
+    Bytes exatos do body (dict → JSON), ou o Path de um arquivo a enviar em streaming
+    """
+    if body is None:
+        return b""
+    if isinstance(body, (bytes, Path)):
+        return body
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return json.dumps(body).encode('utf-8')
+
+def iter_file(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+class ThrottledReader:
+    """
+    Body de upload entregue ao socket a no máximo bytes_per_sec
+
+    O urllib3 lê bodies com read() em blocos; cada bloco só é devolvido
+    quando o orçamento de banda permite. __len__ mantém o Content-Length
+    (sem chunked encoding), e a assinatura segue cobrindo os mesmos bytes.
+    """
+
+    def __init__(self, source: Union[bytes, io.BufferedReader], bytes_per_sec: int):
+        if isinstance(source, bytes):
+            self._length = len(source)
+            source = io.BytesIO(source)
+        else:
+            self._length = os.fstat(source.fileno()).st_size
+        self._source = source
+        self.bytes_per_sec = bytes_per_sec
+        self._started: Optional[float] = None
+        self._sent = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(THROTTLE_BLOCK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if self._started is None:
+            self._started = time.monotonic()
+        if size is None or size < 0 or size > THROTTLE_BLOCK_SIZE:
+            size = THROTTLE_BLOCK_SIZE
+        chunk = self._source.read(size)
+        if chunk:
+            self._sent += len(chunk)
+            # Pacing pelo total enviado: pausas do lado do servidor não viram rajadas
+            delay = self._started + self._sent / self.bytes_per_sec - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return chunk
+
+    def close(self):
+        self._source.close()
+
+class AgentTransport:
+    """Sessão HTTP única do agente com pool de conexões por host"""
+
+    def __init__(self, config: AgentConfig, governor: Optional[RateGovernor] = None):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        # Orçamento por Edge Function, compartilhado com o transporte assíncrono
+        self.governor = governor
+        if governor is None and config.rate_governor_enabled:
+            self.governor = RateGovernor(config.rate_limits, config.rate_governor_max_wait)
+        # Offset do relógio do servidor (header Date), aplicado às assinaturas
+        self.clock = ServerClock()
+        # Chave HMAC decodificada uma vez, compartilhada com o transporte assíncrono
+        self.signer = Signer(config.hmac_secret)
+        # Codificações aceitas por função (Accept-Encoding das respostas)
+        self.compressor = BodyCompressor(config) if config.compression_enabled else None
+
+        # Pool de conexões: um pool por host, limitado a http_pool_maxsize conexões
+        self._adapter = HTTPAdapter(
+            pool_connections=config.http_pool_connections,
+            pool_maxsize=config.http_pool_maxsize,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests_sent = 0
+
+    def function_url(self, function: str) -> str:
+        """URL de uma Edge Function (ex: 'heartbeat', 'ack-job/<id>')"""
+        return f"{self.config.server_url}/functions/v1/{function}"
+
+    def auth_headers(self, body: Union[bytes, str, Path] = b"", content_type: str = 'application/json') -> Dict[str, str]:
+        """Headers de autenticação do agente (X-Agent-Token + HMAC)"""
+        timestamp_ms = self.clock.timestamp_ms()
+        if isinstance(body, Path):
+            # Arquivo assinado em pedaços, sem carregá-lo inteiro em memória
+            signature = self.signer.sign_chunks(iter_file(body), timestamp_ms)
+        else:
+            signature = self.signer.sign(body, timestamp_ms)
+        return {
+            'X-Agent-Token': self.config.agent_token,
+            'Content-Type': content_type,
+            **signature
+        }
+
+    def request(
+        self,
+        method: str,
+        function: str,
+        body: Optional[Any] = None,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        retry: bool = True,
+        content_type: str = 'application/json',
+        max_bytes_per_sec: Optional[int] = None
+    ) -> requests.Response:
+        """
+        Envia uma requisição autenticada para uma Edge Function
+
+        Falhas de conexão, 5xx, autenticação transitória e relógio fora da
+        janela são repetidas aqui (até config.max_retries vezes, com jitter);
+        cada tentativa é reassinada com timestamp e nonce novos. O body é
+        comprimido se a função anunciou suporte (ver compression.py).
+
+        Args:
+            method: Método HTTP (GET, POST)
+            function: Nome da Edge Function (com path opcional)
+            body: Dict serializado como JSON, string/bytes já serializados,
+                Path de um arquivo (assinado e enviado em streaming) ou None
+            params: Query string opcional
+            timeout: Timeout em segundos (padrão: config.request_timeout)
+            max_wait: Espera máx. por orçamento (padrão: config.rate_governor_max_wait)
+            retry: False para uma única tentativa (ex: reenvio da outbox)
+            content_type: Content-Type do body (antes da compressão)
+            max_bytes_per_sec: Banda máxima do upload do body (None = sem limite)
+
+        Returns:
+            Response do requests (a última, se as tentativas se esgotaram)
+
+        Raises:
+            RateLimited: orçamento da função esgotado por mais de max_wait
+            requests.RequestException: falha de rede após as tentativas
+        """
+        identity = serialize_body(body)
+        payload, encoding = identity, None
+        if self.compressor and identity:
+            payload, encoding = self.compressor.encode(function, identity)
+        try:
+            return self._attempts(
+                method, function, payload, encoding, identity, params,
+                timeout if timeout is not None else self.config.request_timeout,
+                max_wait, retry, content_type, max_bytes_per_sec
+            )
+        finally:
+            if encoding and isinstance(payload, Path):
+                payload.unlink(missing_ok=True)
+
+    def _attempts(
+        self,
+        method: str,
+        function: str,
+        payload: Union[bytes, Path],
+        encoding: Optional[str],
+        identity: Union[bytes, Path],
+        params: Optional[Dict[str, Any]],
+        timeout: float,
+        max_wait: Optional[float],
+        retry: bool,
+        content_type: str,
+        max_bytes_per_sec: Optional[int] = None
+    ) -> requests.Response:
+        """Laço de tentativas de request() (payload já codificado; identity = sem compressão)"""
+        state = RetryState()
+        retries = self.config.max_retries if retry else 0
+        attempt = 0
+        # Recusas na autenticação (relógio, codificação) acontecem antes do
+        # rate limit do servidor: o reenvio imediato não consome orçamento
+        free_retry = False
+        response = error = None
+        while True:
+            if self.governor and not free_retry:
+                try:
+                    wait = self.governor.reserve(function, max_wait)
+                except RateLimited:
+                    if not attempt:
+                        raise
+                    # Sem orçamento para repetir: devolver o último resultado
+                    if error is not None:
+                        raise error
+                    return response
+                if wait:
+                    time.sleep(wait)
+
+            # A assinatura cobre exatamente os bytes enviados (já comprimidos)
+            headers = self.auth_headers(payload, content_type)
+            if encoding:
+                headers['Content-Encoding'] = encoding
+            response = error = None
+            sent_at = time.time()
+            data = open(payload, 'rb') if isinstance(payload, Path) else payload or None
+            if max_bytes_per_sec and data:
+                data = ThrottledReader(data, max_bytes_per_sec)
+            try:
+                response = self._send(
+                    method,
+                    self.function_url(function),
+                    headers=headers,
+                    data=data,
+                    params=params,
+                    timeout=timeout
+                )
+            except requests.RequestException as e:
+                error = e
+                kind = classify_error(e)
+            else:
+                received_at = time.time()
+                kind = classify_response(response)
+                if kind == CLOCK_SKEW:
+                    self.clock.learn(response.headers.get('Date'), sent_at, received_at)
+                else:
+                    self.clock.observe(response.headers.get('Date'), sent_at, received_at)
+                if self.governor:
+                    self.governor.observe(function, response)
+                if self.compressor:
+                    self.compressor.observe(function, response)
+                    if encoding and is_encoding_rejection(response):
+                        # Reenviar na hora sem compressão (não conta como tentativa)
+                        self.compressor.reject(function, encoding)
+                        payload, encoding = identity, None
+                        free_retry = True
+                        continue
+            finally:
+                if hasattr(data, 'close'):
+                    data.close()
+
+            delay = state.next_delay(kind) if kind != OK and attempt < retries else None
+            free_retry = kind == CLOCK_SKEW
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            self.logger.debug("🔁 %s: %s, nova tentativa em %.1fs", function, kind, delay)
+            if delay:
+                time.sleep(delay)
+
+    def get(self, function: str, **kwargs) -> requests.Response:
+        return self.request('GET', function, **kwargs)
+
+    def post(self, function: str, body: Optional[Any] = None, **kwargs) -> requests.Response:
+        return self.request('POST', function, body=body, **kwargs)
+
+    def download(self, url: str, timeout: float = 300, **kwargs) -> requests.Response:
+        """GET sem autenticação para URLs externas (ex: download de updates)"""
+        return self._send('GET', url, stream=True, timeout=timeout, **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self._lock:
+            self._requests_sent += 1
+        return self.session.request(method, url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estatísticas de reutilização de conexões
+
+        Returns:
+            Dict com requests, new_connections, reused_connections e reuse_ratio
+        """
+        new_connections = 0
+        pools = self._adapter.poolmanager.pools
+        with pools.lock:
+            pool_list = list(pools._container.values())
+        for pool in pool_list:
+            new_connections += getattr(pool, 'num_connections', 0)
+
+        with self._lock:
+            requests_sent = self._requests_sent
+
+        reused = max(0, requests_sent - new_connections)
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': round(reused / requests_sent, 3) if requests_sent else 0.0,
+        }
+
+    def close(self):
+        """Fecha todas as conexões do pool"""
+        stats = self.stats()
+        self.logger.info(
+            "🔌 Transporte HTTP encerrado: %d requests, %d conexões novas (reuso: %.0f%%)",
+            stats['requests'], stats['new_connections'], stats['reuse_ratio'] * 100
+        )
+        if self.governor:
+            self.logger.info(f"🚦 Governador de taxa: {self.governor.summary()}")
+        if self.compressor:
+            self.logger.info(f"🗜️  Compressão: {self.compressor.summary()}")
+        self.session.close()
@@ -0,0 +1,171 @@
+"""
+Pool de execução de jobs com concorrência limitada por tipo
+"""
+import time
+import logging
+from queue import Queue, Empty
+from threading import Event, Thread, Condition
+from typing import Callable, Dict, Any, List
+
+from config import AgentConfig
+
+class JobExecutor:
+    """
+    Executa jobs em workers dedicados por tipo (scan, update, custom)
+
+    O backlog (jobs aceitos e ainda não finalizados) é limitado por
+    job_queue_size: submit() bloqueia enquanto o backlog estiver cheio,
+    o que segura o polling até haver capacidade (back-pressure).
+    """
+
+    DEFAULT_LANE = 'custom'
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        handler: Callable[[Dict[str, Any]], bool],
+        on_complete: Callable[[Dict[str, Any], bool], None]
+    ):
+        self.config = config
+        self.stop_event = stop_event
+        self.handler = handler
+        self.on_complete = on_complete
+        self.logger = logging.getLogger(__name__)
+
+        self.concurrency = dict(config.job_concurrency)
+        self.max_backlog = config.job_queue_size
+
+        # Uma fila por tipo de job; o tamanho total é limitado pelo backlog
+        self._lanes: Dict[str, Queue] = {job_type: Queue() for job_type in self.concurrency}
+        self._workers: List[Thread] = []
+
+        self._cond = Condition()
+        self._backlog = 0
+        self._running = 0
+
+    def start(self):
+        """Inicia os workers de cada tipo"""
+        for job_type, count in self.concurrency.items():
+            for i in range(count):
+                worker = Thread(
+                    target=self._worker,
+                    args=(job_type,),
+                    name=f"JobWorker-{job_type}-{i + 1}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+        self.logger.info(
+            "⚙️  Executor de jobs iniciado (concorrência: %s, backlog máx: %d)",
+            self.concurrency, self.max_backlog
+        )
+
+    def wait_for_capacity(self) -> bool:
+        """
+        Bloqueia até haver espaço no backlog
+
+        Returns:
+            True se há capacidade, False se o agente está parando
+        """
+        with self._cond:
+            while self._backlog >= self.max_backlog:
+                if self.stop_event.is_set():
+                    return False
+                self._cond.wait(timeout=0.5)
+        return not self.stop_event.is_set()
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """
+        Enfileira um job para execução (bloqueia se o backlog estiver cheio)
+
+        Returns:
+            True se aceito, False se o agente está parando
+        """
+        if not self.wait_for_capacity():
+            return False
+
+        lane = self._lane_for(job.get('type'))
+        with self._cond:
+            self._backlog += 1
+        self._lanes[lane].put(job)
+        return True
+
+    def pending(self) -> int:
+        """Jobs aceitos e ainda não finalizados (na fila + em execução)"""
+        with self._cond:
+            return self._backlog
+
+    def _lane_for(self, job_type: str) -> str:
+        if job_type in self._lanes:
+            return job_type
+        if self.DEFAULT_LANE in self._lanes:
+            return self.DEFAULT_LANE
+        return next(iter(self._lanes))
+
+    def _worker(self, lane: str):
+        queue = self._lanes[lane]
+
+        while not self.stop_event.is_set():
+            try:
+                job = queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+            if self.stop_event.is_set():
+                # Não iniciar novos jobs durante o shutdown
+                self._release(started=False)
+                break
+
+            with self._cond:
+                self._running += 1
+
+            success = False
+            try:
+                success = self.handler(job)
+            except Exception as e:
+                self.logger.error(f"❌ Erro inesperado no job {job.get('id')}: {e}")
+
+            try:
+                self.on_complete(job, success)
+            except Exception as e:
+                self.logger.error(f"❌ Erro ao finalizar job {job.get('id')}: {e}")
+            finally:
+                self._release(started=True)
+
+    def _release(self, started: bool):
+        with self._cond:
+            self._backlog -= 1
+            if started:
+                self._running -= 1
+            self._cond.notify_all()
+
+    def shutdown(self, timeout: float) -> bool:
+        """
+        Aguarda os jobs em execução terminarem (stop_event já deve estar setado)
+
+        Jobs ainda na fila não são iniciados nem confirmados; o servidor os
+        reenfileira via cleanup-stuck-jobs.
+
+        Returns:
+            True se todos os workers terminaram dentro do timeout
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            running = self._running
+            queued = self._backlog - self._running
+        if running:
+            self.logger.info(f"⏳ Aguardando {running} job(s) em execução (timeout: {timeout}s)...")
+        if queued:
+            self.logger.warning(f"⚠️  {queued} job(s) na fila não serão executados")
+
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+
+        alive = [w.name for w in self._workers if w.is_alive()]
+        if alive:
+            self.logger.warning(f"⚠️  Workers ainda ativos após timeout: {', '.join(alive)}")
+            return False
+        return True
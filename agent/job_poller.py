@@ -1,22 +1,126 @@
 """
 Componente de polling e execução de jobs
 """
+import os
 import time
 import logging
-import requests
+from dataclasses import dataclass
 from threading import Event
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 
 from config import AgentConfig
-from hmac_utils import generate_hmac_headers
+from http_transport import AgentTransport
+from heartbeat_sender import HeartbeatSender
+from job_executor import JobExecutor
+from outbox import Outbox, PRIORITY_ACK
+from rate_governor import RateLimited
+from poll_scheduler import PollScheduler
+from verdict_cache import VerdictCache
+
+if TYPE_CHECKING:
+    from log_shipper import LogShipper
+
+# Tamanho de lote aplicado por servidores que não informam X-Batch-Limit
+DEFAULT_BATCH_LIMIT = 3
+
+# Após cair para interval polling, tentar long-poll novamente depois deste tempo
+LONG_POLL_REPROBE_SECONDS = 3600
+
+@dataclass
+class PollRequest:
+    """Parâmetros de uma requisição ao poll-jobs"""
+    method: str
+    params: Dict[str, Any]
+    timeout: float
+    long_poll: bool
+    heartbeat: Optional[Dict[str, Any]] = None
+    
+    @property
+    def body(self) -> Optional[Dict[str, Any]]:
+        return {"heartbeat": self.heartbeat} if self.heartbeat is not None else None
 
 class JobPoller:
     """Faz polling de jobs pendentes e executa"""
     
-    def __init__(self, config: AgentConfig, stop_event: Event):
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        transport: AgentTransport,
+        heartbeat_sender: Optional[HeartbeatSender] = None,
+        outbox: Optional[Outbox] = None,
+        log_shipper: Optional['LogShipper'] = None
+    ):
         self.config = config
         self.stop_event = stop_event
+        self.transport = transport
+        # ACKs não entregues ficam em disco e são reenviados (o job não roda de novo)
+        self.outbox = outbox
+        # Modo combined_heartbeat: o heartbeat vai embutido em cada poll
+        self.heartbeat_sender = heartbeat_sender if config.combined_heartbeat else None
+        # Jobs ship_logs dividem a banda com o envio contínuo (criado no 1º job se desativado)
+        self.log_shipper = log_shipper
         self.logger = logging.getLogger(__name__)
+        self.executor = JobExecutor(
+            config,
+            stop_event,
+            handler=self.execute_job,
+            on_complete=self._on_job_complete
+        )
+        # Com heartbeat combinado, o poll ocioso também não pode exceder heartbeat_interval
+        idle_interval = config.poll_interval
+        if self.heartbeat_sender:
+            idle_interval = min(config.poll_interval, config.heartbeat_interval)
+        self.scheduler = PollScheduler(
+            idle_interval=idle_interval,
+            min_interval=config.poll_min_interval,
+            backoff_factor=config.poll_backoff_factor
+        )
+        # Vereditos do scan-virus compartilhados por todos os jobs de scan
+        self.verdict_cache = None
+        if config.verdict_cache_size:
+            self.verdict_cache = VerdictCache(
+                max_entries=config.verdict_cache_size,
+                ttls={
+                    'clean': config.verdict_ttl_clean,
+                    'malicious': config.verdict_ttl_malicious,
+                    'unknown': config.verdict_ttl_unknown,
+                },
+                persist_path=(
+                    os.path.join(config.data_dir, 'verdict_cache.json')
+                    if config.verdict_cache_persist else None
+                )
+            )
+            self.verdict_cache.load()
+        # Lote efetivo informado pelo servidor no último poll
+        self.batch_limit = DEFAULT_BATCH_LIMIT
+        # Long-poll: desativado até o reprobe se o servidor não confirmar suporte
+        self._long_poll_disabled_until = 0.0
+        self._long_poll_completed = False
+    
+    def long_poll_active(self) -> bool:
+        """True se o próximo poll deve usar long-poll"""
+        return (
+            self.config.long_poll_enabled
+            and time.monotonic() >= self._long_poll_disabled_until
+        )
+    
+    def poll_request(self) -> PollRequest:
+        """Parâmetros do próximo poll"""
+        long_poll = self.long_poll_active()
+        self._long_poll_completed = False
+        params = {'limit': self.config.poll_batch_size}
+        timeout = self.config.request_timeout
+        if long_poll:
+            # O servidor segura a requisição por até long_poll_timeout segundos
+            params['wait'] = self.config.long_poll_timeout
+            timeout += self.config.long_poll_timeout
+        
+        if self.heartbeat_sender:
+            # POST com heartbeat compacto no body (assinado pelo transporte)
+            return PollRequest('POST', params, timeout, long_poll, self.heartbeat_sender.compact_heartbeat())
+        # GET com body vazio (HMAC assinado sobre "")
+        return PollRequest('GET', params, timeout, long_poll)
     
     def poll_jobs(self) -> List[Dict[str, Any]]:
         """
@@ -25,45 +129,82 @@ class JobPoller:
         Returns:
             Lista de jobs a executar
         """
-        url = f"{self.config.server_url}/functions/v1/poll-jobs"
-        
-        # Preparar headers
-        headers = {
-            'X-Agent-Token': self.config.agent_token,
-            'Content-Type': 'application/json',
-        }
-        
-        # Adicionar HMAC headers (body vazio para GET)
-        hmac_headers = generate_hmac_headers(self.config.hmac_secret, "")
-        headers.update(hmac_headers)
+        request = self.poll_request()
         
         try:
-            response = requests.get(
-                url,
-                headers=headers,
-                timeout=self.config.request_timeout
+            response = self.transport.request(
+                request.method,
+                'poll-jobs',
+                body=request.body,
+                params=request.params,
+                timeout=request.timeout
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                jobs = data.get('jobs', [])
-                if jobs:
-                    self.logger.info(f"📥 Recebidos {len(jobs)} job(s)")
-                return jobs
-            elif response.status_code == 401:
-                self.logger.error(f"❌ Poll rejeitado: Autenticação falhou")
-                return []
-            elif response.status_code == 429:
-                self.logger.warning(f"⚠️  Rate limit excedido no polling")
-                return []
-            else:
-                self.logger.warning(f"⚠️  Poll falhou: HTTP {response.status_code}")
-                return []
+            return self.handle_poll_response(response, request)
                 
+        except RateLimited as e:
+            self.scheduler.block_for(e.retry_after)
+            self.logger.debug("Poll adiado: %s", e)
+            return []
         except Exception as e:
             self.logger.error(f"❌ Erro ao fazer polling: {e}")
             return []
     
+    def handle_poll_response(self, response, request: PollRequest) -> List[Dict[str, Any]]:
+        """
+        Interpreta a resposta do poll-jobs (independente do transporte)
+        
+        Returns:
+            Lista de jobs a executar
+        """
+        if response.status_code == 200:
+            data = response.json()
+            # poll-jobs retorna um array puro; aceitar também {"jobs": [...]}
+            jobs = data if isinstance(data, list) else data.get('jobs', [])
+            self.batch_limit = int(response.headers.get('X-Batch-Limit', DEFAULT_BATCH_LIMIT))
+            if request.long_poll:
+                self._check_long_poll_support(response)
+            if request.heartbeat is not None:
+                self.heartbeat_sender.handle_combined_response(response, request.heartbeat)
+            if jobs:
+                self.logger.info(f"📥 Recebidos {len(jobs)} job(s)")
+            return jobs
+        elif response.status_code == 401:
+            self.logger.error("❌ Poll rejeitado: Autenticação falhou")
+            return []
+        elif response.status_code == 429:
+            reset_at = self._json_field(response, 'resetAt')
+            self.scheduler.record_rate_limit(reset_at)
+            self.logger.warning(f"⚠️  Rate limit excedido no polling (reset: {reset_at})")
+            return []
+        else:
+            self.logger.warning(f"⚠️  Poll falhou: HTTP {response.status_code}")
+            return []
+    
+    def next_poll_delay(self, received: int) -> float:
+        """Segundos até o próximo poll (imediato enquanto o servidor devolver lotes cheios)"""
+        if self._long_poll_completed:
+            return self.scheduler.long_poll_delay(
+                received, self.batch_limit, self.config.long_poll_jitter
+            )
+        return self.scheduler.next_delay(received, self.batch_limit)
+    
+    def _check_long_poll_support(self, response):
+        """Cai para interval polling se o servidor ignorou o parâmetro wait"""
+        if int(response.headers.get('X-Long-Poll', 0)) > 0:
+            self._long_poll_completed = True
+            return
+        self._long_poll_disabled_until = time.monotonic() + LONG_POLL_REPROBE_SECONDS
+        self.logger.warning(
+            "⚠️  Servidor não suporta long-poll, usando polling por intervalo "
+            f"(nova tentativa em {LONG_POLL_REPROBE_SECONDS // 60} min)"
+        )
+    
+    def _json_field(self, response, key: str) -> Any:
+        try:
+            return response.json().get(key)
+        except (ValueError, AttributeError):
+            return None
+    
     def execute_job(self, job: Dict[str, Any]) -> bool:
         """
         Executa um job
@@ -82,22 +223,29 @@ class JobPoller:
         
         try:
             # Implementar execução baseada no tipo
+            # stop_event.wait() permite cancelar o job durante o shutdown
             if job_type == 'scan':
                 self.logger.info(f"  → Scan de vírus: {payload}")
-                # TODO: Implementar scan
-                time.sleep(2)  # Simular execução
+                cancelled = self.run_scan(payload)
             elif job_type == 'update':
                 self.logger.info(f"  → Update do agente")
                 # TODO: Implementar update
-                time.sleep(1)
+                cancelled = self.stop_event.wait(1)
+            elif job_type == 'ship_logs':
+                self.logger.info(f"  → Envio de logs: {payload}")
+                cancelled = self.run_ship_logs(payload, job_id)
             elif job_type == 'custom':
                 self.logger.info(f"  → Job customizado: {payload}")
                 # TODO: Implementar custom
-                time.sleep(1)
+                cancelled = self.stop_event.wait(1)
             else:
                 self.logger.warning(f"  ⚠️  Tipo de job desconhecido: {job_type}")
                 return False
             
+            if cancelled:
+                self.logger.warning(f"⚠️  Job {job_id} cancelado (agente parando)")
+                return False
+            
             self.logger.info(f"✅ Job {job_id} executado com sucesso")
             return True
             
@@ -105,57 +253,138 @@ class JobPoller:
             self.logger.error(f"❌ Erro ao executar job {job_id}: {e}")
             return False
     
+    def run_scan(self, payload: Dict[str, Any]) -> bool:
+        """
+        Executa o scan descrito no payload e consulta o scan-virus para cada hash
+
+        Returns:
+            True se o scan foi interrompido pelo shutdown
+        """
+        # Pool de processos, sqlite e coalescer só no primeiro job de scan
+        from scan_engine import ScanEngine, ScanSpec
+        from scan_client import ScanClient
+        from scan_coalescer import ScanCoalescer
+        from hash_index import HashIndex
+
+        spec = ScanSpec.from_payload(payload, self.config)
+        client = ScanClient(self.config, self.transport, self.verdict_cache)
+        coalescer = ScanCoalescer(self.config, client, self.stop_event) if self.config.scan_batch_enabled else None
+
+        def on_result(result):
+            if coalescer:
+                coalescer.submit(result.path, result.sha256)
+            else:
+                client.check(result.path, result.sha256)
+
+        index = None
+        if self.config.hash_index_enabled:
+            index = HashIndex(
+                os.path.join(self.config.data_dir, 'hash_index.db'),
+                max_entries=self.config.hash_index_max_entries,
+                retention_days=self.config.hash_index_retention_days
+            )
+            index.open()
+        try:
+            ScanEngine(self.config, self.stop_event, index).run(spec, on_result)
+            if index and not self.stop_event.is_set():
+                index.compact()
+        finally:
+            if coalescer:
+                coalescer.close()
+            if index:
+                index.close()
+
+        self.logger.info(f"  → Vereditos: {client.summary()}")
+        if self.verdict_cache is not None:
+            self.logger.info(f"  → Cache de vereditos: {self.verdict_cache.summary()}")
+            self.verdict_cache.save()
+        return self.stop_event.is_set()
+    
+    def run_ship_logs(self, payload: Dict[str, Any], job_id: Optional[str] = None) -> bool:
+        """
+        Envia os registros de log dos últimos payload["minutes"] minutos
+
+        Returns:
+            True se o envio foi interrompido pelo shutdown
+
+        Raises:
+            RuntimeError: lote recusado pelo servidor ou falha de rede
+        """
+        from log_shipper import LogShipper, MAX_SHIP_MINUTES
+
+        minutes = int(payload.get('minutes', 15))
+        if not 1 <= minutes <= MAX_SHIP_MINUTES:
+            raise ValueError(f"minutes deve estar entre 1 e {MAX_SHIP_MINUTES}")
+        if self.log_shipper is None:
+            self.log_shipper = LogShipper(self.config, self.stop_event, self.transport)
+        if self.log_shipper.ship_recent(minutes, job_id=job_id):
+            return False
+        if self.stop_event.is_set():
+            return True
+        raise RuntimeError("envio dos logs ao diagnostics-agent-logs falhou")
+    
     def acknowledge_job(self, job_id: str) -> bool:
         """
         Envia ACK ao servidor informando conclusão do job
         """
-        url = f"{self.config.server_url}/functions/v1/ack-job/{job_id}"
-        
-        headers = {
-            'X-Agent-Token': self.config.agent_token,
-            'Content-Type': 'application/json',
-        }
-        
-        hmac_headers = generate_hmac_headers(self.config.hmac_secret, "")
-        headers.update(hmac_headers)
-        
         try:
-            response = requests.post(
-                url,
-                headers=headers,
-                timeout=self.config.request_timeout
-            )
-            
-            if response.status_code == 200:
-                self.logger.debug(f"✅ ACK enviado para job {job_id}")
-                return True
+            if self.outbox:
+                response = self.outbox.send(f'ack-job/{job_id}', None, PRIORITY_ACK, key=f'ack:{job_id}')
+                if response is None:
+                    self.logger.warning(f"⚠️  ACK do job {job_id} adiado (rate limit), mantido na outbox")
+                    return False
             else:
-                self.logger.warning(f"⚠️  ACK falhou para job {job_id}: HTTP {response.status_code}")
-                return False
+                response = self.transport.post(f'ack-job/{job_id}')
+            return self.handle_ack_response(job_id, response)
                 
         except Exception as e:
-            self.logger.error(f"❌ Erro ao enviar ACK para job {job_id}: {e}")
+            suffix = " (mantido na outbox)" if self.outbox else ""
+            self.logger.error(f"❌ Erro ao enviar ACK para job {job_id}: {e}{suffix}")
             return False
     
+    def handle_ack_response(self, job_id: str, response) -> bool:
+        """Interpreta a resposta do ack-job (independente do transporte)"""
+        if response.status_code == 200:
+            self.logger.debug("✅ ACK enviado para job %s", job_id)
+            return True
+        self.logger.warning(f"⚠️  ACK falhou para job {job_id}: HTTP {response.status_code}")
+        return False
+    
+    def _on_job_complete(self, job: Dict[str, Any], success: bool):
+        """Callback do executor ao finalizar um job"""
+        if success:
+            self.acknowledge_job(job['id'])
+    
     def run(self):
         """Loop principal de polling"""
-        self.logger.info(f"🔄 Job poller iniciado (intervalo: {self.config.poll_interval}s)")
+        mode = "long-poll" if self.config.long_poll_enabled else "intervalo"
+        self.logger.info(f"🔄 Job poller iniciado (modo: {mode}, intervalo: {self.config.poll_interval}s)")
+        
+        self.executor.start()
         
         while not self.stop_event.is_set():
+            # Back-pressure: só buscar novos jobs se houver espaço no backlog
+            if not self.executor.wait_for_capacity():
+                break
+            
             # Fazer polling
             jobs = self.poll_jobs()
             
-            # Executar jobs
+            # Enfileirar jobs (execução ocorre nos workers)
             for job in jobs:
-                if self.stop_event.is_set():
+                if not self.executor.submit(job):
                     break
-                
-                success = self.execute_job(job)
-                
-                if success:
-                    self.acknowledge_job(job['id'])
             
             # Aguardar próximo poll
-            self.stop_event.wait(self.config.poll_interval)
+            delay = self.next_poll_delay(len(jobs))
+            if delay > 0:
+                self.stop_event.wait(delay)
         
         self.logger.info("🔄 Job poller parado")
+    
+    def drain(self, timeout: float) -> bool:
+        """Aguarda os jobs em execução terminarem (chamado após stop_event)"""
+        drained = self.executor.shutdown(timeout)
+        if self.verdict_cache is not None:
+            self.verdict_cache.save()
+        return drained
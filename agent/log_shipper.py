@@ -0,0 +1,496 @@
+"""
+Envio dos logs do agente ao diagnostics-agent-logs
+
+Acompanha logs/agent.log* a partir de um cursor persistido em data_dir
+(device + inode + offset). A rotação renomeia agent.log para agent.log.1
+sem mudar o inode: o cursor é reencontrado entre os backups, o restante do
+arquivo rotacionado é enviado e a leitura segue nos mais novos.
+
+Linhas novas formam lotes (log_ship_batch_bytes ou log_ship_max_age, o que
+vier primeiro). O body de cada lote é gravado em arquivo temporário e
+enviado como Path: o transporte comprime (se a função anunciou), assina o
+HMAC em pedaços e faz o upload em streaming com banda limitada. O cursor
+só avança depois que o servidor aceita o lote.
+
+O job "ship_logs" ({"minutes": N}) usa o mesmo pipeline para enviar os
+últimos N minutos sob demanda, sem mexer no cursor do envio contínuo.
+"""
+import os
+import re
+import json
+import time
+import calendar
+import logging
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable, List, Optional, Tuple
+
+import requests
+
+from config import AgentConfig
+from http_transport import AgentTransport
+from logger_config import DATE_FORMAT, LOG_BACKUP_COUNT, LOG_DIR, LOG_FILE
+from poll_scheduler import parse_reset_at
+from rate_governor import RateLimited, DEFAULT_BLOCK_SECONDS
+from version import AGENT_VERSION
+
+LOG_FUNCTION = 'diagnostics-agent-logs'
+
+# Bytes lidos do arquivo por chamada
+READ_CHUNK_SIZE = 64 * 1024
+
+# Segundos entre verificações de linhas novas (stat, sem leitura)
+CHECK_INTERVAL = 2.0
+
+# Espera máx. entre tentativas após falhas de envio
+MAX_RETRY_DELAY = 300.0
+
+# Janela máx. do job ship_logs
+MAX_SHIP_MINUTES = 24 * 60
+
+# Nível dos registros nos formatos text ("| ERROR    |") e json ("level":"ERROR")
+_LEVEL_RE = re.compile(rb'\| (WARNING|ERROR|CRITICAL) *\||"level":"(WARNING|ERROR|CRITICAL)"')
+_TEXT_TS_RE = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \|')
+_JSON_TS_RE = re.compile(rb'^\{"ts":"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})')
+
+@dataclass
+class LogCursor:
+    """Posição no log: arquivo (device + inode, estável na rotação) e offset"""
+    dev: int
+    inode: int
+    offset: int = 0
+
+    @classmethod
+    def at(cls, st: os.stat_result, offset: int = 0) -> 'LogCursor':
+        return cls(st.st_dev, st.st_ino, offset)
+
+    def same_file(self, st: os.stat_result) -> bool:
+        return (st.st_dev, st.st_ino) == (self.dev, self.inode)
+
+# (arquivo, stat, offset inicial, rotacionado) na ordem de leitura
+Segment = Tuple[Path, os.stat_result, int, bool]
+
+def line_timestamp(line: bytes) -> Optional[float]:
+    """Epoch do registro (text: horário local; json: UTC) ou None (continuação de traceback)"""
+    match = _TEXT_TS_RE.match(line)
+    if match:
+        return time.mktime(time.strptime(match.group(1).decode(), DATE_FORMAT))
+    match = _JSON_TS_RE.match(line)
+    if match:
+        return calendar.timegm(time.strptime(match.group(1).decode(), '%Y-%m-%dT%H:%M:%S'))
+    return None
+
+class LogBatch:
+    """
+    Body JSON de um lote, gravado em arquivo temporário à medida que as linhas chegam
+
+    Mesmo formato aceito pelo diagnostics-agent-logs ({logs, log_type,
+    severity, timestamp}); o lote nunca fica inteiro em memória.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix='log_batch.', suffix='.json', dir=directory)
+        self.path = Path(name)
+        self._file = open(fd, 'wb')
+        self._file.write(b'{"logs":[')
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lines = 0
+        self.severity = 'info'
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.max_bytes
+
+    def add(self, line: bytes):
+        if self.severity != 'error':
+            match = _LEVEL_RE.search(line)
+            if match:
+                level = match.group(1) or match.group(2)
+                self.severity = 'warning' if level == b'WARNING' else 'error'
+        text = line.rstrip(b'\r').decode('utf-8', errors='replace')
+        if self.lines:
+            self._file.write(b',')
+        self._file.write(json.dumps(text, ensure_ascii=False).encode('utf-8'))
+        self.size += len(line) + 1
+        self.lines += 1
+
+    def finish(self, **fields) -> Path:
+        """Fecha o JSON com os campos do lote; retorna o arquivo do body"""
+        fields.update(severity=self.severity, line_count=self.lines)
+        self._file.write(b'],' + json.dumps(fields)[1:].encode('utf-8'))
+        self._file.close()
+        return self.path
+
+    def discard(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+class LogShipper:
+    """Tail persistente de logs/agent.log* e envio em lotes ao diagnostics-agent-logs"""
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        transport: AgentTransport,
+        log_dir: Path = LOG_DIR
+    ):
+        self.config = config
+        self.stop_event = stop_event
+        self.transport = transport
+        self.log_dir = Path(log_dir)
+        self.state_path = Path(config.data_dir) / 'log_shipper.json'
+        self.logger = logging.getLogger(__name__)
+        self.cursor: Optional[LogCursor] = None
+        # Envio contínuo e job ship_logs dividem a mesma banda
+        self._upload_lock = Lock()
+        self._failures = 0
+        self.batches_sent = 0
+        self.lines_sent = 0
+        self.bytes_sent = 0
+
+    # ------------------------------------------------------------------
+    # Cursor persistido
+
+    def load(self):
+        """Carrega o cursor salvo (sem cursor: começa do início do agent.log atual)"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.cursor = LogCursor(int(data['dev']), int(data['inode']), int(data['offset']))
+        except FileNotFoundError:
+            self.cursor = None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"⚠️  Cursor do envio de logs ignorado ({e})")
+            self.cursor = None
+
+    def save(self):
+        """Grava o cursor de forma atômica (arquivo temporário + rename)"""
+        if self.cursor is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, **self.cursor.__dict__}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            self.logger.error(f"❌ Erro ao salvar cursor do envio de logs: {e}")
+
+    # ------------------------------------------------------------------
+    # Arquivos e segmentos
+
+    def _files(self) -> List[Tuple[Path, os.stat_result]]:
+        """agent.log e backups existentes, do mais novo ao mais antigo"""
+        files = []
+        for index in range(LOG_BACKUP_COUNT + 1):
+            path = self.log_dir / (LOG_FILE if index == 0 else f"{LOG_FILE}.{index}")
+            try:
+                files.append((path, path.stat()))
+            except FileNotFoundError:
+                if index == 0:
+                    return []
+        return files
+
+    def _segments(self, cursor: Optional[LogCursor]) -> Optional[List[Segment]]:
+        """
+        Trechos a ler a partir do cursor, do mais antigo ao agent.log atual
+
+        Returns:
+            Lista de segmentos, ou None se o arquivo do cursor não existe mais
+        """
+        files = self._files()
+        if not files:
+            return []
+        if cursor is None:
+            path, st = files[0]
+            return [(path, st, 0, False)]
+        for index, (path, st) in enumerate(files):
+            if cursor.same_file(st):
+                # Tamanho menor que o offset: arquivo truncado, recomeçar do início
+                start = cursor.offset if st.st_size >= cursor.offset else 0
+                newer = [(p, s, 0, i > 0) for i, (p, s) in reversed(list(enumerate(files[:index])))]
+                return [(path, st, start, index > 0)] + newer
+        return None
+
+    def _tail_segments(self) -> List[Segment]:
+        if self.cursor is None:
+            # Primeira execução: fixar o agent.log atual já na primeira verificação,
+            # para que rotações antes do primeiro lote não pulem linhas
+            files = self._files()
+            if files:
+                self.cursor = LogCursor.at(files[0][1])
+        segments = self._segments(self.cursor)
+        if segments is None:
+            # Rotacionado além de LOG_BACKUP_COUNT (agente parado por muito tempo)
+            self.logger.warning("⚠️  Posição do envio de logs não encontrada nos backups; continuando do agent.log atual")
+            path, st = self._files()[0]
+            self.cursor = LogCursor.at(st)
+            segments = [(path, st, 0, False)]
+        return segments
+
+    def pending_bytes(self) -> int:
+        """Bytes do log ainda não enviados (só stat, sem leitura)"""
+        return sum(max(0, st.st_size - start) for _, st, start, _ in self._tail_segments())
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def _fill(
+        self,
+        batch: LogBatch,
+        segments: List[Segment],
+        keep: Optional[Callable[[bytes], bool]] = None,
+        end: Optional[LogCursor] = None
+    ) -> Optional[LogCursor]:
+        """
+        Lê linhas completas dos segmentos para o lote até enchê-lo
+
+        Args:
+            keep: Filtro de linhas (as recusadas são puladas, o cursor avança)
+            end: Não ler além desta posição (snapshot do job ship_logs)
+
+        Returns:
+            Cursor logo após a última linha consumida (None = nada consumido)
+        """
+        cursor = None
+        for index, (path, st, start, rotated) in enumerate(segments):
+            limit = end.offset if end is not None and end.same_file(st) else None
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                # Rotacionado entre o stat e o open: a próxima rodada reencontra o inode
+                break
+            with f:
+                if not LogCursor.at(os.fstat(f.fileno())).same_file(st):
+                    break
+                # Arquivo rotacionado não cresce mais: a última linha vai mesmo sem \n
+                position = self._read_lines(f, start, batch, keep, limit, final=rotated and limit is None)
+            cursor = LogCursor.at(st, position)
+            if batch.full or limit is not None or not rotated or position < st.st_size:
+                break
+            # Arquivo rotacionado consumido até o fim: o cursor passa para o próximo
+            cursor = LogCursor.at(segments[index + 1][1])
+        return cursor
+
+    @staticmethod
+    def _read_lines(
+        f,
+        start: int,
+        batch: LogBatch,
+        keep: Optional[Callable[[bytes], bool]],
+        limit: Optional[int],
+        final: bool
+    ) -> int:
+        """Adiciona ao lote as linhas de f a partir de start; retorna o offset após a última consumida"""
+        f.seek(start)
+        position = start
+        buffer = b''
+        while not batch.full:
+            size = READ_CHUNK_SIZE
+            if limit is not None:
+                size = min(size, limit - position - len(buffer))
+            chunk = f.read(size) if size > 0 else b''
+            if not chunk:
+                if buffer and final:
+                    if keep is None or keep(buffer):
+                        batch.add(buffer)
+                    position += len(buffer)
+                break
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                if keep is None or keep(line):
+                    batch.add(line)
+                position += len(line) + 1
+                if batch.full:
+                    # Linhas restantes ficam para o próximo lote
+                    break
+        return position
+
+    # ------------------------------------------------------------------
+    # Envio
+
+    def _upload(self, body: Path) -> bool:
+        """POST do lote; aguarda o orçamento em 429/rate limit local"""
+        with self._upload_lock:
+            while not self.stop_event.is_set():
+                try:
+                    response = self.transport.post(
+                        LOG_FUNCTION,
+                        body,
+                        max_bytes_per_sec=self.config.log_ship_max_bytes_per_sec or None
+                    )
+                except RateLimited as e:
+                    self.logger.debug("🚦 Envio de logs aguardando orçamento (%.1fs)", e.retry_after)
+                    self.stop_event.wait(e.retry_after)
+                    continue
+                except requests.RequestException as e:
+                    self.logger.warning(f"⚠️  Envio de logs falhou: {e}")
+                    return False
+                if response.status_code == 429:
+                    try:
+                        reset_ts = parse_reset_at(response.json().get('resetAt'))
+                    except ValueError:
+                        reset_ts = None
+                    delay = (reset_ts - time.time()) if reset_ts else DEFAULT_BLOCK_SECONDS
+                    self.logger.warning(f"⚠️  Rate limit no envio de logs, nova tentativa em {max(delay, 1):.0f}s")
+                    self.stop_event.wait(max(delay, 1))
+                    continue
+                if response.status_code == 200:
+                    return True
+                self.logger.warning(f"⚠️  Envio de logs falhou: HTTP {response.status_code}")
+                return False
+            return False
+
+    def _new_batch(self) -> LogBatch:
+        return LogBatch(Path(self.config.data_dir), self.config.log_ship_batch_bytes)
+
+    def _ship(self, batch: LogBatch, log_type: str, **extra) -> bool:
+        body = batch.finish(
+            log_type=log_type,
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            agent_version=AGENT_VERSION,
+            **extra
+        )
+        try:
+            ok = self._upload(body)
+        finally:
+            body.unlink(missing_ok=True)
+        if ok:
+            self.batches_sent += 1
+            self.lines_sent += batch.lines
+            self.bytes_sent += batch.size
+            self.logger.debug("📤 Lote de logs enviado: %d linhas, %d bytes (%s)", batch.lines, batch.size, batch.severity)
+        return ok
+
+    def ship_pending(self) -> bool:
+        """
+        Envia as linhas novas em lotes, avançando o cursor a cada lote aceito
+
+        Returns:
+            True se tudo o que estava pendente foi enviado
+        """
+        while not self.stop_event.is_set():
+            batch = self._new_batch()
+            try:
+                cursor = self._fill(batch, self._tail_segments())
+            except OSError:
+                batch.discard()
+                raise
+            if not batch.lines:
+                batch.discard()
+                if cursor is not None and cursor != self.cursor:
+                    # Só rotação/linhas vazias: avançar sem enviar
+                    self.cursor = cursor
+                    self.save()
+                return True
+            if not self._ship(batch, 'agent_log'):
+                return False
+            self.cursor = cursor
+            self.save()
+            if not batch.full:
+                return True
+        return False
+
+    def ship_recent(self, minutes: int, job_id: Optional[str] = None) -> bool:
+        """
+        Job ship_logs: envia os registros dos últimos N minutos
+
+        Lê dos backups ao agent.log (até o tamanho que ele tinha no início do
+        job), pelo mesmo pipeline de lotes, sem alterar o cursor persistido.
+
+        Returns:
+            True se todos os lotes foram aceitos
+        """
+        cutoff = time.time() - minutes * 60
+        files = self._files()
+        # Backups modificados antes do corte só têm registros antigos
+        recent = [(path, st) for path, st in files if st.st_mtime >= cutoff]
+        if not recent:
+            self.logger.info(f"📤 Nenhum registro de log nos últimos {minutes} min")
+            return True
+        cursor = LogCursor.at(recent[-1][1])
+        end = LogCursor.at(files[0][1], files[0][1].st_size)
+
+        started = False
+
+        def since_cutoff(line: bytes) -> bool:
+            nonlocal started
+            if not started:
+                ts = line_timestamp(line)
+                started = ts is not None and ts >= cutoff
+            return started
+
+        batches = lines = 0
+        while not self.stop_event.is_set():
+            segments = self._segments(cursor)
+            if not segments:
+                self.logger.warning("⚠️  Logs rotacionados durante o envio sob demanda; envio interrompido")
+                break
+            batch = self._new_batch()
+            try:
+                cursor = self._fill(batch, segments, keep=since_cutoff, end=end)
+            except OSError:
+                batch.discard()
+                raise
+            if not batch.lines:
+                batch.discard()
+                break
+            if not self._ship(batch, 'agent_log_request', minutes=minutes, job_id=job_id):
+                return False
+            batches += 1
+            lines += batch.lines
+            if not batch.full or cursor is None:
+                break
+
+        self.logger.info(f"📤 Logs dos últimos {minutes} min enviados: {lines} linhas em {batches} lote(s)")
+        return not self.stop_event.is_set()
+
+    def summary(self) -> str:
+        return f"{self.batches_sent} lotes, {self.lines_sent} linhas, {self.bytes_sent / 1024:.0f} KB de log"
+
+    def run(self):
+        """Loop principal: envia quando o lote enche ou a linha mais antiga expira"""
+        self.load()
+        self.logger.info(
+            f"📤 Log shipper iniciado (lote: {self.config.log_ship_batch_bytes // 1024} KB "
+            f"ou {self.config.log_ship_max_age:.0f}s)"
+        )
+        interval = min(CHECK_INTERVAL, self.config.log_ship_max_age)
+        pending_since = None
+        retry_at = 0.0
+
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            try:
+                pending = self.pending_bytes()
+            except OSError as e:
+                self.logger.warning(f"⚠️  Erro ao verificar logs: {e}")
+                pending = 0
+            if not pending:
+                pending_since = None
+            else:
+                if pending_since is None:
+                    pending_since = now
+                due = pending >= self.config.log_ship_batch_bytes or now - pending_since >= self.config.log_ship_max_age
+                if due and now >= retry_at:
+                    try:
+                        ok = self.ship_pending()
+                    except OSError as e:
+                        self.logger.warning(f"⚠️  Erro ao ler logs para envio: {e}")
+                        ok = False
+                    if ok:
+                        self._failures = 0
+                        pending_since = None
+                    else:
+                        self._failures += 1
+                        retry_at = now + min(MAX_RETRY_DELAY, CHECK_INTERVAL * 2 ** self._failures)
+            self.stop_event.wait(interval)
+
+        self.logger.info(f"📤 Log shipper parado ({self.summary()})")
@@ -1,25 +1,126 @@
 """
 Configuração de logging estruturado
+
+As threads do agente só enfileiram os registros (QueueHandler); uma thread
+dedicada (QueueListener) formata e grava no console e no arquivo. Um disco
+lento ou a rotação do arquivo não seguram heartbeats e polls. A fila é
+limitada: com a política "drop", DEBUG/INFO são descartados quando ela
+enche (e a contagem é registrada); WARNING e acima sempre aguardam espaço.
 """
-import logging
 import sys
-from logging.handlers import RotatingFileHandler
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s | %(levelname)-8s | %(name)s | %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-def setup_logging(level: str = "INFO"):
+# Arquivo de log com rotação (lido também pelo log_shipper)
+LOG_DIR = Path("logs")
+LOG_FILE = "agent.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
+LOG_BACKUP_COUNT = 5
+
+# Pipeline ativo (setup_logging pode ser chamado de novo após carregar o config)
+_listener: Optional['AgentQueueListener'] = None
+_queue_handler: Optional['AgentQueueHandler'] = None
+
+class JsonLinesFormatter(logging.Formatter):
+    """Um objeto JSON compacto por linha (ts em UTC, nível, logger, mensagem)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+class AgentQueueListener(QueueListener):
+    """QueueListener cujo stop() aguarda espaço na fila (a original falha com a fila cheia)"""
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class AgentQueueHandler(QueueHandler):
+    """QueueHandler com fila limitada e política de descarte"""
+    
+    def __init__(self, log_queue: queue.Queue, block: bool = False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+        self.dropped_total = 0
+        self._lock = Lock()
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Só interpola a mensagem (congela os argumentos); data, formato e
+        # traceback ficam para a thread do listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.block or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+        else:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                    self.dropped_total += 1
+                return
+        if self.dropped:
+            self._report_dropped()
+    
+    def _report_dropped(self):
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            f"⚠️  {dropped} mensagens de log descartadas (fila de logs cheia)", None, None
+        )
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += dropped
+
+def setup_logging(
+    level: str = "INFO",
+    queue_size: int = 10_000,
+    queue_policy: str = "drop",
+    log_format: str = "text"
+):
     """
-    Configura logging estruturado com rotação
+    Configura logging estruturado com rotação, escrito por uma thread dedicada
     
     Args:
         level: Nível de logging (DEBUG, INFO, WARNING, ERROR)
+        queue_size: Registros aguardando escrita
+        queue_policy: "drop" (descarta DEBUG/INFO com a fila cheia) ou "block"
+        log_format: Formato do arquivo: "text" ou "json" (JSON lines)
     """
-    # Criar diretório de logs
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
+    global _listener, _queue_handler
     
-    # Formato de log
-    log_format = '%(asctime)s | %(levelname)-8s | %(name)s | %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
+    # Reconfiguração: drenar a fila do pipeline anterior
+    stop_logging()
+    
+    # Criar diretório de logs
+    LOG_DIR.mkdir(exist_ok=True)
     
     # Configurar root logger
     root_logger = logging.getLogger()
@@ -28,28 +129,60 @@ def setup_logging(level: str = "INFO"):
     # Remover handlers existentes
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+        handler.close()
     
     # Handler para console (stdout)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(
-        logging.Formatter(log_format, date_format)
+        logging.Formatter(LOG_FORMAT, DATE_FORMAT)
     )
-    root_logger.addHandler(console_handler)
     
     # Handler para arquivo com rotação (10MB, 5 backups)
     file_handler = RotatingFileHandler(
-        log_dir / "agent.log",
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5,
+        LOG_DIR / LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
         encoding='utf-8'
     )
     file_handler.setLevel(level)
     file_handler.setFormatter(
-        logging.Formatter(log_format, date_format)
+        JsonLinesFormatter() if log_format == "json" else logging.Formatter(LOG_FORMAT, DATE_FORMAT)
     )
-    root_logger.addHandler(file_handler)
+    
+    # As threads do agente só enfileiram; o listener formata e grava
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = AgentQueueHandler(log_queue, block=(queue_policy == "block"))
+    _listener = AgentQueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    root_logger.addHandler(_queue_handler)
     
     # Silenciar logs verbose de bibliotecas externas
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("requests").setLevel(logging.WARNING)
+
+def stop_logging():
+    """
+    Drena a fila e volta a gravar de forma síncrona
+    
+    Chamado no encerramento (atexit) e antes do exec/os._exit do reinício
+    pós-atualização, que não executam atexit.
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        root_logger.addHandler(handler)
+    if _queue_handler.dropped_total:
+        logging.getLogger(__name__).warning(
+            f"⚠️  {_queue_handler.dropped_total} mensagens de log descartadas nesta execução (fila de logs cheia)"
+        )
+    for handler in _listener.handlers:
+        handler.flush()
+    _listener = None
+    _queue_handler = None
+
+atexit.register(stop_logging)
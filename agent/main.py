@@ -5,38 +5,69 @@ Agente autônomo que se comunica com o servidor via HMAC-signed requests
 """
 import sys
 import time
-import logging
-import signal
-import argparse
-from threading import Thread, Event
-from typing import Optional
 
-from config import AgentConfig, load_config
-from heartbeat_sender import HeartbeatSender
-from job_poller import JobPoller
-from logger_config import setup_logging
-from auto_updater import AutoUpdater
+# --startup-profile: instalado antes dos demais imports para cronometrá-los
+_profiler = None
+if '--startup-profile' in sys.argv:
+    from startup_profile import StartupProfiler
+    _profiler = StartupProfiler.install()
 
-# Versão do agente
-AGENT_VERSION = "1.0.0"
+import os  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import signal  # noqa: E402
+import argparse  # noqa: E402
+from threading import Thread, Event  # noqa: E402
+from typing import TYPE_CHECKING, Optional  # noqa: E402
+
+from config import AgentConfig, load_config  # noqa: E402
+from logger_config import setup_logging  # noqa: E402
+from version import AGENT_VERSION  # noqa: E402
+
+if TYPE_CHECKING:
+    from heartbeat_sender import HeartbeatSender
+    from metrics_sender import MetricsSender
+    from job_poller import JobPoller
+    from auto_updater import AutoUpdater
+    from http_transport import AgentTransport
+    from fs_watcher import FsWatcher
+    from outbox import Outbox
+    from log_shipper import LogShipper
+
+# Segundos que o --startup-profile aguarda o primeiro heartbeat aceito
+STARTUP_PROFILE_TIMEOUT = 120
 
 class CyberShieldAgent:
     """Orquestrador principal do agente"""
     
-    def __init__(self, config: AgentConfig):
+    def __init__(self, config: AgentConfig, profiler: Optional['StartupProfiler'] = None):
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.stop_event = Event()
+        # --startup-profile: marcos da inicialização até o primeiro heartbeat
+        self.profiler = profiler
         
         # Componentes
+        self.transport: Optional[AgentTransport] = None
         self.heartbeat_sender: Optional[HeartbeatSender] = None
+        self.metrics_sender: Optional[MetricsSender] = None
         self.job_poller: Optional[JobPoller] = None
         self.auto_updater: Optional[AutoUpdater] = None
+        self.fs_watcher: Optional[FsWatcher] = None
+        self.outbox: Optional[Outbox] = None
+        self.log_shipper: Optional[LogShipper] = None
         
         # Threads
         self.heartbeat_thread: Optional[Thread] = None
+        self.metrics_thread: Optional[Thread] = None
         self.poller_thread: Optional[Thread] = None
         self.update_thread: Optional[Thread] = None
+        self.watcher_thread: Optional[Thread] = None
+        self.outbox_thread: Optional[Thread] = None
+        self.log_shipper_thread: Optional[Thread] = None
+        
+        # Runtime asyncio (config "runtime": "asyncio")
+        self.async_runtime = None
     
     def start(self):
         """Inicia o agente"""
@@ -44,28 +75,89 @@ class CyberShieldAgent:
         self.logger.info(f"Agent Name: {self.config.agent_name}")
         self.logger.info(f"Server URL: {self.config.server_url}")
         
+        # Componentes importados aqui (e os opcionais só se habilitados):
+        # --version, --help e --self-test não pagam pelo agente inteiro
+        from http_transport import AgentTransport
+        from auto_updater import AutoUpdater
+        from heartbeat_sender import HeartbeatSender
+        from job_poller import JobPoller
+        self._mark("imports")
+        
+        # Transporte HTTP compartilhado (keep-alive) por todos os componentes
+        self.transport = AgentTransport(self.config)
+        
         # Verificar atualizações ao iniciar
-        self.auto_updater = AutoUpdater(self.config)
+        self.auto_updater = AutoUpdater(self.config, self.transport)
         if self.auto_updater.update_if_available():
-            # Se atualizou, o processo será reiniciado
-            return
+            # Nada iniciado ainda: exec direto na nova versão (só retorna se falhar)
+            self.auto_updater.restart()
+        self._mark("update_check")
+        
+        # Heartbeats, métricas e ACKs passam pela outbox (reenviados após falhas/reinícios)
+        if self.config.outbox_enabled:
+            from outbox import Outbox
+            self.outbox = Outbox(self.config, self.transport, self.stop_event)
+            self.outbox.open()
         
         # Inicializar componentes
         self.heartbeat_sender = HeartbeatSender(
             self.config, 
-            self.stop_event
+            self.stop_event,
+            self.transport,
+            outbox=self.outbox,
+            restarted_at=self.auto_updater.restarted_at
         )
+        if self.config.metrics_enabled:
+            from metrics_sender import MetricsSender
+            self.metrics_sender = MetricsSender(
+                self.config,
+                self.stop_event,
+                self.transport,
+                outbox=self.outbox
+            )
+        if self.config.log_shipping_enabled:
+            from log_shipper import LogShipper
+            self.log_shipper = LogShipper(self.config, self.stop_event, self.transport)
         self.job_poller = JobPoller(
             self.config,
-            self.stop_event
+            self.stop_event,
+            self.transport,
+            heartbeat_sender=self.heartbeat_sender,
+            outbox=self.outbox,
+            log_shipper=self.log_shipper
         )
+        if self.config.watch_enabled:
+            from fs_watcher import FsWatcher
+            self.fs_watcher = FsWatcher(
+                self.config,
+                self.stop_event,
+                self.transport,
+                verdict_cache=self.job_poller.verdict_cache
+            )
+        self._mark("components")
+        if self.profiler:
+            Thread(target=self._report_startup_profile, name="StartupProfileThread", daemon=True).start()
+        
+        if self.config.runtime == "asyncio":
+            self._run_async()
+            return
         
         # Iniciar threads
-        self.heartbeat_thread = Thread(
-            target=self.heartbeat_sender.run,
-            name="HeartbeatThread",
-            daemon=True
-        )
+        if self.config.combined_heartbeat:
+            # Heartbeat viaja embutido em cada poll; sem thread dedicada
+            self.logger.info("💓 Heartbeat combinado ao poll-jobs")
+        else:
+            self.heartbeat_thread = Thread(
+                target=self.heartbeat_sender.run,
+                name="HeartbeatThread",
+                daemon=True
+            )
+        if self.metrics_sender:
+            self.metrics_thread = Thread(
+                target=self.metrics_sender.run,
+                name="MetricsThread",
+                daemon=True
+            )
         self.poller_thread = Thread(
             target=self.job_poller.run,
             name="PollerThread",
@@ -76,10 +168,37 @@ class CyberShieldAgent:
             name="UpdateThread",
             daemon=True
         )
+        if self.outbox:
+            self.outbox_thread = Thread(
+                target=self.outbox.run,
+                name="OutboxThread",
+                daemon=True
+            )
+        if self.log_shipper:
+            self.log_shipper_thread = Thread(
+                target=self.log_shipper.run,
+                name="LogShipperThread",
+                daemon=True
+            )
+        if self.fs_watcher:
+            self.watcher_thread = Thread(
+                target=self.fs_watcher.run,
+                name="WatcherThread",
+                daemon=True
+            )
         
-        self.heartbeat_thread.start()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.start()
+        if self.metrics_thread:
+            self.metrics_thread.start()
         self.poller_thread.start()
         self.update_thread.start()
+        if self.outbox_thread:
+            self.outbox_thread.start()
+        if self.log_shipper_thread:
+            self.log_shipper_thread.start()
+        if self.watcher_thread:
+            self.watcher_thread.start()
         
         self.logger.info("✅ Agente iniciado com sucesso")
         
@@ -90,6 +209,75 @@ class CyberShieldAgent:
         except KeyboardInterrupt:
             self.logger.info("Interrupção do usuário detectada")
             self.stop()
+        
+        # stop_event sinalizado por outra thread (atualização aplicada ou --startup-profile)
+        self._shutdown()
+        self.logger.info("✅ Agente parado")
+        if self.auto_updater.restart_pending:
+            self._restart_after_update()
+    
+    def _mark(self, milestone: str):
+        if self.profiler:
+            self.profiler.mark(milestone)
+    
+    def _report_startup_profile(self):
+        """--startup-profile: relatório no primeiro heartbeat aceito, depois encerra o agente"""
+        if self.heartbeat_sender.first_heartbeat.wait(timeout=STARTUP_PROFILE_TIMEOUT):
+            self._mark("first_heartbeat")
+        else:
+            self.logger.error(f"❌ Nenhum heartbeat aceito em {STARTUP_PROFILE_TIMEOUT}s")
+        
+        report = self.profiler.report()
+        self.profiler.log_report(self.logger, report)
+        print_report({
+            "version": AGENT_VERSION,
+            "runtime": self.config.runtime,
+            "frozen": bool(getattr(sys, 'frozen', False)),
+            "first_heartbeat_ms": self.profiler.elapsed_ms("first_heartbeat"),
+            **report,
+        })
+        
+        self.stop_event.set()
+        if self.async_runtime:
+            self.async_runtime.request_stop()
+    
+    def _run_async(self):
+        """Executa heartbeat, polling, updates e jobs em um único event loop"""
+        import asyncio
+        from async_runtime import AsyncAgentRuntime
+        
+        self.async_runtime = AsyncAgentRuntime(
+            self.config,
+            self.stop_event,
+            self.heartbeat_sender,
+            self.job_poller,
+            self.auto_updater,
+            fs_watcher=self.fs_watcher,
+            metrics_sender=self.metrics_sender,
+            outbox=self.outbox,
+            log_shipper=self.log_shipper
+        )
+        self.logger.info("✅ Agente iniciado com sucesso (runtime: asyncio)")
+        
+        try:
+            asyncio.run(self.async_runtime.run())
+        except KeyboardInterrupt:
+            self.logger.info("Interrupção do usuário detectada")
+        
+        if self.outbox:
+            self.outbox.close()
+        self.transport.close()
+        self.logger.info("✅ Agente parado")
+        
+        if self.auto_updater.restart_pending:
+            self._restart_after_update()
+    
+    def _restart_after_update(self):
+        """Componentes já encerrados: exec na nova versão"""
+        self.auto_updater.restart()
+        # Exec falhou (versão anterior restaurada): o gerenciador de serviço reinicia
+        self.logger.error("❌ Reinício após atualização falhou, encerrando")
+        sys.exit(1)
     
     def _periodic_update_check(self):
         """Verifica atualizações periodicamente (a cada 6 horas)"""
@@ -101,7 +289,9 @@ class CyberShieldAgent:
                 if not self.stop_event.is_set():
                     self.logger.info("🔍 Verificação periódica de atualizações...")
                     if self.auto_updater.update_if_available():
-                        # Se atualizou, o processo será reiniciado
+                        # O loop principal encerra os componentes e reinicia
+                        self.logger.info("🔄 Encerrando componentes para reiniciar na nova versão...")
+                        self.stop_event.set()
                         return
             except Exception as e:
                 self.logger.error(f"❌ Erro na verificação periódica: {e}")
@@ -111,16 +301,112 @@ class CyberShieldAgent:
         self.logger.info("🛑 Parando agente...")
         self.stop_event.set()
         
+        if self.async_runtime:
+            # O event loop drena os jobs e encerra; start() retorna em seguida
+            self.async_runtime.request_stop()
+            return
+        
+        self._shutdown()
+        self.logger.info("✅ Agente parado")
+        sys.exit(0)
+    
+    def _shutdown(self):
+        """Aguarda as threads e fecha outbox e transporte (runtime threads)"""
         # Aguardar threads
         if self.heartbeat_thread and self.heartbeat_thread.is_alive():
             self.heartbeat_thread.join(timeout=5)
+        if self.metrics_thread and self.metrics_thread.is_alive():
+            self.metrics_thread.join(timeout=5)
         if self.poller_thread and self.poller_thread.is_alive():
             self.poller_thread.join(timeout=5)
+        if self.job_poller:
+            # Jobs em execução recebem o stop_event e são drenados aqui
+            self.job_poller.drain(self.config.job_drain_timeout)
         if self.update_thread and self.update_thread.is_alive():
             self.update_thread.join(timeout=5)
+        if self.watcher_thread and self.watcher_thread.is_alive():
+            # Lotes de hash em execução terminam antes do watcher sair
+            self.watcher_thread.join(timeout=self.config.job_drain_timeout)
+        if self.log_shipper_thread and self.log_shipper_thread.is_alive():
+            # Upload em andamento é interrompido; o cursor só avança com lotes aceitos
+            self.log_shipper_thread.join(timeout=5)
+        if self.outbox_thread and self.outbox_thread.is_alive():
+            self.outbox.wake()
+            self.outbox_thread.join(timeout=5)
+        if self.outbox:
+            # Entradas não entregues são reenviadas na próxima inicialização
+            self.outbox.close()
         
-        self.logger.info("✅ Agente parado")
-        sys.exit(0)
+        if self.transport:
+            self.transport.close()
+
+def run_self_test(config: AgentConfig) -> bool:
+    """
+    Modo --self-test: verifica este executável sem iniciar o agente
+    
+    Executado pelo auto-updater na nova versão antes da troca do executável.
+    Imprime um relatório JSON na última linha do stdout.
+    
+    Returns:
+        True se todas as verificações passaram
+    """
+    import tempfile
+    from hmac_utils import Signer
+    from http_transport import AgentTransport
+    from scan_engine import check_worker_pool
+    
+    started = time.perf_counter()
+    checks = {}
+    
+    def check(name, fn):
+        try:
+            fn()
+            checks[name] = "ok"
+        except Exception as e:
+            checks[name] = f"erro: {e!r}"
+    
+    def hmac_roundtrip():
+        signer = Signer(config.hmac_secret)
+        headers = signer.sign(b'{"self_test": true}')
+        if not signer.verify(headers['X-HMAC-Signature'], headers['X-Timestamp'], headers['X-Nonce'], b'{"self_test": true}'):
+            raise RuntimeError("assinatura não confere")
+    
+    def data_dir_writable():
+        os.makedirs(config.data_dir, exist_ok=True)
+        with tempfile.TemporaryFile(dir=config.data_dir) as f:
+            f.write(b'ok')
+    
+    def backend_heartbeat():
+        transport = AgentTransport(config)
+        try:
+            response = transport.post('heartbeat', {"test_mode": True}, timeout=10)
+            if response.status_code not in (200, 201):
+                raise RuntimeError(f"HTTP {response.status_code}")
+        finally:
+            transport.close()
+    
+    check("hmac", hmac_roundtrip)
+    check("data_dir", data_dir_writable)
+    if config.runtime == "asyncio":
+        check("runtime", lambda: __import__("async_runtime"))
+    # Jobs de scan e o watcher sempre usam o pool de hashers (scan_workers = 0 é
+    # o número de CPUs); o executável congelado precisa subi-lo (freeze_support)
+    check("scan_workers", check_worker_pool)
+    check("backend", backend_heartbeat)
+    
+    ok = all(result == "ok" for result in checks.values())
+    print_report({
+        "version": AGENT_VERSION,
+        "ok": ok,
+        "checks": checks,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    })
+    return ok
+
+def print_report(report: dict):
+    """Relatório JSON em uma única escrita no stdout (não intercala com a thread de logs)"""
+    sys.stdout.write(json.dumps(report) + "\n")
+    sys.stdout.flush()
 
 def signal_handler(agent: CyberShieldAgent):
     """Handler para sinais SIGTERM/SIGINT"""
@@ -146,6 +432,22 @@ def main():
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
         help='Nível de logging'
     )
+    parser.add_argument(
+        '--runtime',
+        type=str,
+        choices=['threads', 'asyncio'],
+        help='Runtime de execução (sobrescreve "runtime" do config)'
+    )
+    parser.add_argument(
+        '--self-test',
+        action='store_true',
+        help='Verifica o executável (assinatura, data_dir, subprocessos, backend) e sai'
+    )
+    parser.add_argument(
+        '--startup-profile',
+        action='store_true',
+        help='Inicia o agente, relata tempos de import e até o primeiro heartbeat e sai'
+    )
     parser.add_argument(
         '--version',
         action='version',
@@ -154,16 +456,25 @@ def main():
     
     args = parser.parse_args()
     
-    # Setup logging
+    # Setup logging (padrões até o config ser carregado, para reportar erros dele)
     setup_logging(args.log_level)
     logger = logging.getLogger(__name__)
     
     try:
         # Carregar configuração
         config = load_config(args.config)
+        if args.runtime:
+            config.runtime = args.runtime
+        # Fila de logs e formato do arquivo vêm do config
+        setup_logging(args.log_level, config.log_queue_size, config.log_queue_policy, config.log_format)
+        if _profiler:
+            _profiler.mark("config")
+        
+        if args.self_test:
+            sys.exit(0 if run_self_test(config) else 1)
         
         # Criar agente
-        agent = CyberShieldAgent(config)
+        agent = CyberShieldAgent(config, profiler=_profiler)
         
         # Configurar signal handlers
         signal.signal(signal.SIGTERM, signal_handler(agent))
@@ -183,4 +494,9 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    if getattr(sys, 'frozen', False):
+        # Necessário para o pool de hashers do scan no executável PyInstaller
+        # (no modo script é um no-op; o import fica fora do caminho de inicialização)
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
@@ -0,0 +1,195 @@
+"""
+Coleta de métricas do sistema para o submit-system-metrics
+
+No Linux tudo vem direto de /proc e os.statvfs, sem subprocessos: o uso de
+CPU é a variação dos contadores de /proc/stat entre duas amostras (em vez
+do `top -bn1`, que bloqueia por um segundo). Em outros sistemas apenas os
+campos disponíveis na stdlib são enviados (o servidor aceita campos ausentes).
+"""
+import os
+import shutil
+import logging
+import platform
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+GB = 1024 ** 3
+
+PROC_STAT = '/proc/stat'
+PROC_MEMINFO = '/proc/meminfo'
+PROC_UPTIME = '/proc/uptime'
+PROC_NET_DEV = '/proc/net/dev'
+PROC_CPUINFO = '/proc/cpuinfo'
+
+def _read_cpu_times() -> Tuple[int, int]:
+    """
+    Primeira linha de /proc/stat ("cpu  user nice system idle iowait ...")
+
+    Returns:
+        (jiffies totais, jiffies ociosos) desde o boot
+    """
+    with open(PROC_STAT, 'rb') as f:
+        fields = f.readline().split()
+    # guest/guest_nice já estão contidos em user/nice
+    values = [int(v) for v in fields[1:9]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return sum(values), idle
+
+def _read_meminfo() -> Dict[str, int]:
+    """Campos de /proc/meminfo em bytes"""
+    info = {}
+    with open(PROC_MEMINFO, 'rb') as f:
+        for line in f:
+            key, _, rest = line.partition(b':')
+            if key in (b'MemTotal', b'MemFree', b'MemAvailable', b'Buffers', b'Cached'):
+                info[key.decode()] = int(rest.split()[0]) * 1024
+    return info
+
+def _read_net_bytes() -> Tuple[int, int]:
+    """Bytes (enviados, recebidos) somados de todas as interfaces exceto loopback"""
+    sent = received = 0
+    with open(PROC_NET_DEV, 'rb') as f:
+        for line in f.readlines()[2:]:
+            name, _, counters = line.partition(b':')
+            if name.strip() == b'lo':
+                continue
+            values = counters.split()
+            received += int(values[0])
+            sent += int(values[8])
+    return sent, received
+
+def _read_btime() -> Optional[int]:
+    """Instante do boot (epoch) informado pelo kernel em /proc/stat"""
+    with open(PROC_STAT, 'rb') as f:
+        for line in f:
+            if line.startswith(b'btime'):
+                return int(line.split()[1])
+    return None
+
+def _read_cpu_name() -> Optional[str]:
+    try:
+        with open(PROC_CPUINFO, 'rb') as f:
+            for line in f:
+                key, _, value = line.partition(b':')
+                # "model name" no x86; "Hardware"/"Processor" em alguns ARM
+                if key.strip() in (b'model name', b'Hardware', b'Processor'):
+                    return value.strip().decode('utf-8', 'replace') or None
+    except OSError:
+        pass
+    return platform.processor() or None
+
+class MetricsCollector:
+    """
+    Gera o payload do submit-system-metrics
+
+    Cada collect() custa algumas leituras de /proc (microssegundos). O
+    percentual de CPU é calculado desde a amostra anterior; a primeira é
+    feita na criação do coletor.
+    """
+
+    def __init__(self, disk_path: str = '/'):
+        self.disk_path = disk_path
+        self.logger = logging.getLogger(__name__)
+        self.has_proc = os.path.exists(PROC_STAT)
+
+        # Valores fixos durante a vida do processo
+        self.cpu_name = _read_cpu_name()
+        self.cpu_cores = os.cpu_count()
+        self.boot_time: Optional[int] = None
+        self._last_cpu: Optional[Tuple[int, int]] = None
+
+        if self.has_proc:
+            try:
+                self.boot_time = _read_btime()
+                self._last_cpu = _read_cpu_times()
+            except (OSError, ValueError, IndexError) as e:
+                self.logger.warning(f"⚠️  /proc indisponível para métricas ({e})")
+                self.has_proc = False
+
+    def cpu_usage_percent(self) -> Optional[float]:
+        """Uso de CPU desde a amostra anterior (None se não houve intervalo)"""
+        total, idle = _read_cpu_times()
+        last_total, last_idle = self._last_cpu
+        self._last_cpu = (total, idle)
+        delta_total = total - last_total
+        if delta_total <= 0:
+            return None
+        return round((1 - (idle - last_idle) / delta_total) * 100, 2)
+
+    def _memory(self) -> Dict[str, float]:
+        info = _read_meminfo()
+        total = info['MemTotal']
+        # MemAvailable existe desde o kernel 3.14
+        available = info.get('MemAvailable', info['MemFree'] + info.get('Buffers', 0) + info.get('Cached', 0))
+        used = total - available
+        return {
+            'memory_total_gb': round(total / GB, 2),
+            'memory_used_gb': round(used / GB, 2),
+            'memory_free_gb': round(info['MemFree'] / GB, 2),
+            'memory_usage_percent': round(used / total * 100, 2) if total else 0.0,
+        }
+
+    def _disk(self) -> Dict[str, float]:
+        if hasattr(os, 'statvfs'):
+            st = os.statvfs(self.disk_path)
+            total = st.f_blocks * st.f_frsize
+            used = (st.f_blocks - st.f_bfree) * st.f_frsize
+            # Espaço disponível para usuários comuns (coluna "Avail" do df)
+            free = st.f_bavail * st.f_frsize
+        else:
+            total, used, free = shutil.disk_usage(self.disk_path)
+        return {
+            'disk_total_gb': round(total / GB, 2),
+            'disk_used_gb': round(used / GB, 2),
+            'disk_free_gb': round(free / GB, 2),
+            'disk_usage_percent': round(used / total * 100, 2) if total else 0.0,
+        }
+
+    def sample(self) -> Dict[str, float]:
+        """Amostra rápida (CPU desde a amostra anterior e memória) para a janela de envio"""
+        if not self.has_proc:
+            return {}
+        sample = {}
+        try:
+            cpu = self.cpu_usage_percent()
+            if cpu is not None:
+                sample['cpu_usage_percent'] = cpu
+            sample['memory_usage_percent'] = self._memory()['memory_usage_percent']
+        except (OSError, ValueError, IndexError, KeyError) as e:
+            self.logger.debug("Erro ao amostrar /proc: %s", e)
+        return sample
+
+    def collect(self) -> Dict[str, Any]:
+        """Payload do submit-system-metrics com os campos disponíveis"""
+        metrics: Dict[str, Any] = {}
+        if self.cpu_name:
+            metrics['cpu_name'] = self.cpu_name
+        if self.cpu_cores:
+            metrics['cpu_cores'] = self.cpu_cores
+
+        try:
+            metrics.update(self._disk())
+        except OSError as e:
+            self.logger.warning(f"⚠️  Erro ao ler uso de disco de {self.disk_path}: {e}")
+
+        if not self.has_proc:
+            return metrics
+
+        try:
+            cpu = self.cpu_usage_percent()
+            if cpu is not None:
+                metrics['cpu_usage_percent'] = cpu
+            metrics.update(self._memory())
+
+            sent, received = _read_net_bytes()
+            metrics['network_bytes_sent'] = sent
+            metrics['network_bytes_received'] = received
+
+            with open(PROC_UPTIME, 'rb') as f:
+                metrics['uptime_seconds'] = int(float(f.read().split()[0]))
+            if self.boot_time:
+                metrics['last_boot_time'] = datetime.fromtimestamp(self.boot_time, timezone.utc).isoformat()
+        except (OSError, ValueError, IndexError, KeyError) as e:
+            self.logger.warning(f"⚠️  Erro ao ler métricas de /proc: {e}")
+
+        return metrics
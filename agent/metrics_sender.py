@@ -0,0 +1,156 @@
+"""
+Componente de envio de métricas do sistema
+"""
+import math
+import time
+import logging
+from datetime import datetime, timezone
+from threading import Event
+from typing import Dict, Any, Optional
+
+from config import AgentConfig
+from http_transport import AgentTransport
+from metrics_collector import MetricsCollector
+from metrics_window import MetricsWindow
+from outbox import Outbox, PRIORITY_METRICS
+from rate_governor import RateLimited
+from poll_scheduler import parse_reset_at
+
+# Janela do primeiro envio (métricas disponíveis logo após o início)
+CPU_WARMUP_SECONDS = 1.0
+
+class MetricsSender:
+    """
+    Envia métricas do sistema periodicamente (submit-system-metrics)
+
+    Entre dois envios CPU e memória são amostradas a cada
+    metrics_sample_interval segundos; o envio leva a média no campo de
+    sempre e min/max/média/p95 da janela em "aggregates", para que os
+    alertas do servidor enxerguem picos entre os envios.
+    """
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        stop_event: Event,
+        transport: AgentTransport,
+        outbox: Optional[Outbox] = None
+    ):
+        self.config = config
+        self.stop_event = stop_event
+        self.transport = transport
+        self.outbox = outbox
+        self.logger = logging.getLogger(__name__)
+        self.collector = MetricsCollector(config.metrics_disk_path)
+        # Capacidade para uma janela completa; envios falhos não fazem a memória crescer
+        capacity = math.ceil(config.metrics_interval / config.metrics_sample_interval) + 1
+        self.window = MetricsWindow(capacity)
+        self._blocked_until = 0.0
+        self._next_upload = time.monotonic() + CPU_WARMUP_SECONDS
+
+    def tick(self) -> Optional[Dict[str, Any]]:
+        """
+        Registra uma amostra na janela
+
+        Returns:
+            Payload do envio se a janela venceu, senão None
+        """
+        if time.monotonic() < self._next_upload:
+            self.window.add(self.collector.sample())
+            return None
+        return self.build_payload()
+
+    def build_payload(self) -> Dict[str, Any]:
+        """Snapshot atual com CPU/memória substituídos pelo agregado da janela"""
+        metrics = self.collector.collect()
+        # Envios vindos da outbox chegam atrasados: o servidor usa este instante
+        metrics['collected_at'] = datetime.now(timezone.utc).isoformat()
+        self.window.add(metrics)
+        aggregates = self.window.aggregate()
+        for name, stats in aggregates.items():
+            metrics[name] = stats['mean']
+        if aggregates:
+            metrics['aggregates'] = aggregates
+        return metrics
+
+    def wait_time(self) -> float:
+        """Segundos até a próxima amostra (ou envio, se vier antes)"""
+        return max(0.0, min(self.config.metrics_sample_interval, self._next_upload - time.monotonic()))
+
+    def schedule_next(self):
+        self._next_upload = time.monotonic() + self.next_delay()
+
+    def send_metrics(self, metrics: Dict[str, Any]) -> bool:
+        """
+        Envia o payload de uma janela
+
+        Returns:
+            True se sucesso, False caso contrário
+        """
+        try:
+            if self.outbox:
+                # A janela passa a ser da outbox (reenviada se este envio falhar)
+                self.window.reset()
+                response = self.outbox.send('submit-system-metrics', metrics, PRIORITY_METRICS)
+                if response is None:
+                    self.logger.warning("⚠️  Envio de métricas adiado (rate limit), mantido na outbox")
+                    return False
+            else:
+                response = self.transport.post('submit-system-metrics', metrics)
+            return self.handle_response(response, metrics)
+        except RateLimited as e:
+            self.logger.warning(f"⚠️  Envio de métricas adiado: {e}")
+            return False
+        except Exception as e:
+            suffix = " (mantido na outbox)" if self.outbox else ""
+            self.logger.error(f"❌ Erro ao enviar métricas: {e}{suffix}")
+            return False
+
+    def handle_response(self, response, metrics: Dict[str, Any]) -> bool:
+        """
+        Interpreta a resposta do submit-system-metrics (independente do transporte)
+
+        Returns:
+            True se sucesso, False caso contrário
+        """
+        if response.status_code == 200:
+            cpu_peak = metrics.get('aggregates', {}).get('cpu_usage_percent', {}).get('max', '-')
+            self.logger.info(
+                f"📊 Métricas enviadas (CPU: {metrics.get('cpu_usage_percent', '-')}% / pico {cpu_peak}%, "
+                f"RAM: {metrics.get('memory_usage_percent', '-')}%, "
+                f"Disco: {metrics.get('disk_usage_percent', '-')}%)"
+            )
+            # Janela entregue; sem outbox, após falhas ela continua acumulando (limitada ao buffer)
+            self.window.reset()
+            alerts = response.json().get('alerts_generated', 0)
+            if alerts:
+                self.logger.warning(f"⚠️  {alerts} alerta(s) gerado(s) pelas métricas")
+            return True
+        if response.status_code == 429:
+            try:
+                reset_ts = parse_reset_at(response.json().get('resetAt'))
+            except ValueError:
+                reset_ts = None
+            if reset_ts:
+                self._blocked_until = reset_ts
+            self.logger.warning("⚠️  Rate limit no envio de métricas")
+            return False
+        self.logger.warning(f"⚠️  Envio de métricas falhou: HTTP {response.status_code}")
+        return False
+
+    def next_delay(self) -> float:
+        """Intervalo até o próximo envio (respeitando o resetAt de um 429)"""
+        return max(self.config.metrics_interval, self._blocked_until - time.time())
+
+    def run(self):
+        """Loop principal de envio de métricas"""
+        self.logger.info(f"📊 Metrics sender iniciado (intervalo: {self.config.metrics_interval}s)")
+
+        while not self.stop_event.is_set():
+            metrics = self.tick()
+            if metrics is not None:
+                self.send_metrics(metrics)
+                self.schedule_next()
+            self.stop_event.wait(self.wait_time())
+
+        self.logger.info("📊 Metrics sender parado")
@@ -0,0 +1,77 @@
+"""
+Janela de amostras de métricas entre dois envios ao submit-system-metrics
+
+As amostras de alta frequência (por padrão 1/s) ficam em ring buffers de
+tamanho fixo (array de doubles): a memória não cresce com o uptime e, se um
+envio falhar, apenas as amostras mais antigas são sobrescritas. Cada envio
+leva só o agregado (min/max/média/p95) da janela.
+"""
+import math
+from array import array
+from typing import Dict, Iterable, Optional
+
+# Métricas amostradas em alta frequência (as que geram alertas no servidor
+# e variam em segundos; disco e rede seguem como snapshot do envio)
+SAMPLED_METRICS = ('cpu_usage_percent', 'memory_usage_percent')
+
+class RingBuffer:
+    """Buffer circular de floats com capacidade fixa"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._values = array('d', bytes(8 * capacity))
+        self._next = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+
+    def values(self) -> array:
+        """Amostras presentes (a ordem não importa para a agregação)"""
+        return self._values[:self.count]
+
+    def aggregate(self) -> Optional[Dict[str, float]]:
+        """min/max/média/p95 (nearest-rank) das amostras, ou None se vazio"""
+        if not self.count:
+            return None
+        ordered = sorted(self.values())
+        p95 = ordered[max(0, math.ceil(0.95 * self.count) - 1)]
+        return {
+            'min': round(ordered[0], 2),
+            'max': round(ordered[-1], 2),
+            'mean': round(math.fsum(ordered) / self.count, 2),
+            'p95': round(p95, 2),
+            'samples': self.count,
+        }
+
+class MetricsWindow:
+    """Um RingBuffer por métrica amostrada"""
+
+    def __init__(self, capacity: int, metrics: Iterable[str] = SAMPLED_METRICS):
+        self.buffers = {name: RingBuffer(capacity) for name in metrics}
+
+    def add(self, sample: Dict[str, float]):
+        for name, buffer in self.buffers.items():
+            value = sample.get(name)
+            if value is not None:
+                buffer.append(value)
+
+    def aggregate(self) -> Dict[str, Dict[str, float]]:
+        """Agregado por métrica (métricas sem amostras são omitidas)"""
+        result = {}
+        for name, buffer in self.buffers.items():
+            stats = buffer.aggregate()
+            if stats:
+                result[name] = stats
+        return result
+
+    def reset(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
@@ -0,0 +1,354 @@
+"""
+Outbox persistente das chamadas de saída (SQLite em modo WAL)
+
+Heartbeats, métricas e ACKs são gravados antes do envio e removidos quando
+o servidor confirma. Se o servidor estiver inacessível (ou limitando com
+429), a entrada permanece em disco e é reenviada em lotes quando a
+conectividade volta, inclusive após um crash ou reinício do agente.
+
+O body é guardado sem assinatura: o HMAC (timestamp + nonce) é gerado pelo
+transporte no momento de cada tentativa.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from threading import Event, Lock
+from typing import Any, Dict, Optional, Set
+
+from config import AgentConfig
+from http_transport import AgentTransport
+from poll_scheduler import parse_reset_at
+from rate_governor import RateLimited
+from retry_policy import (
+    AUTH_TRANSIENT, CLOCK_SKEW, RATE_LIMITED, SERVER, DecorrelatedJitter, classify_response
+)
+
+# Prioridades (menor sai primeiro no reenvio)
+PRIORITY_ACK = 0
+PRIORITY_METRICS = 1
+PRIORITY_HEARTBEAT = 2
+
+# Bloqueio aplicado a 429 sem resetAt
+DEFAULT_BLOCK_SECONDS = 60
+
+# Intervalo entre rodadas de reenvio (e teto do backoff sem conectividade)
+REPLAY_INTERVAL = 5.0
+MAX_REPLAY_BACKOFF = 300.0
+
+# Entradas descartadas após este número de respostas retentáveis do servidor
+# (5xx, autenticação transitória, 429). Falhas de rede não contam: sem
+# resposta, a entrada espera a conectividade voltar pelo tempo que for
+MAX_ATTEMPTS = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL,
+    function TEXT NOT NULL,
+    body TEXT,
+    dedupe_key TEXT UNIQUE,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_order ON outbox (priority, id);
+"""
+
+def _base_function(function: str) -> str:
+    """'ack-job/<id>' → 'ack-job'"""
+    return function.split('/', 1)[0]
+
+class Outbox:
+    """
+    Fila durável de chamadas de saída com reenvio priorizado (ACKs primeiro)
+
+    send() grava a entrada e tenta o envio imediato (write-through); o
+    chamador recebe a resposta como antes. run() é o loop de reenvio,
+    executado em thread própria.
+    """
+
+    def __init__(self, config: AgentConfig, transport: AgentTransport, stop_event: Event):
+        self.config = config
+        self.transport = transport
+        self.stop_event = stop_event
+        self.db_path = Path(config.data_dir) / 'outbox.db'
+        self.max_entries = config.outbox_max_entries
+        self.batch_size = config.outbox_batch_size
+        self.logger = logging.getLogger(__name__)
+
+        # Conexão compartilhada por heartbeat, métricas, workers de jobs e reenvio
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+        self._wake = Event()
+        # Entradas com envio imediato em andamento (não reenviar em paralelo)
+        self._in_flight: Set[int] = set()
+        self._blocked_until: Dict[str, float] = {}
+        # Backoff sem conectividade com jitter: agentes que perderam o servidor
+        # juntos não voltam todos no mesmo instante
+        self._backoff = DecorrelatedJitter(REPLAY_INTERVAL, MAX_REPLAY_BACKOFF)
+        self._next_ready = 0.0
+        self._offline = False
+
+        self.replayed = 0
+        self.dropped = 0
+
+    def open(self):
+        """Abre (ou cria) a outbox; um arquivo corrompido é recriado vazio"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._connect()
+            if self.conn.execute("PRAGMA quick_check").fetchone()[0] != 'ok':
+                raise sqlite3.DatabaseError("quick_check falhou")
+        except sqlite3.DatabaseError as e:
+            self._rebuild(e)
+
+        pending = self.pending_count()
+        if pending:
+            self.logger.info(f"📮 Outbox com {pending} envio(s) pendente(s) da execução anterior")
+            self._wake.set()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _rebuild(self, error: Exception):
+        """Move a outbox corrompida para quarentena e recria vazia"""
+        self.logger.warning(f"⚠️  Outbox corrompida ({error}), recriando")
+        if self.conn:
+            try:
+                self.conn.close()
+            except sqlite3.Error:
+                pass
+            self.conn = None
+
+        suffix = f".corrupt-{int(time.time())}"
+        for extra in ('', '-wal', '-shm'):
+            src = Path(f"{self.db_path}{extra}")
+            if src.exists():
+                os.replace(src, f"{self.db_path}{suffix}{extra}")
+        self._connect()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def put(self, function: str, body: Optional[Any], priority: int, key: Optional[str] = None) -> int:
+        """
+        Grava uma chamada na outbox
+
+        Args:
+            function: Edge Function (com path opcional, ex: 'ack-job/<id>')
+            body: Dict serializado como JSON, ou None
+            priority: PRIORITY_* (menor sai primeiro)
+            key: Chave de coalescência; uma nova entrada substitui a anterior
+
+        Returns:
+            id da entrada (marcada como em envio até settle())
+        """
+        body_str = json.dumps(body) if body is not None else None
+        with self._lock:
+            with self.conn:
+                if key is not None:
+                    self.conn.execute("DELETE FROM outbox WHERE dedupe_key = ?", (key,))
+                row_id = self.conn.execute(
+                    "INSERT INTO outbox (priority, function, body, dedupe_key, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (priority, function, body_str, key, time.time())
+                ).lastrowid
+                self._enforce_limit()
+            self._in_flight.add(row_id)
+        return row_id
+
+    def _enforce_limit(self):
+        """Descarta as entradas menos prioritárias (e mais antigas) acima de max_entries"""
+        total = self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM outbox WHERE id IN "
+                "(SELECT id FROM outbox ORDER BY priority DESC, id LIMIT ?)",
+                (excess,)
+            )
+            self.dropped += excess
+            self.logger.warning(f"⚠️  Outbox cheia: {excess} envio(s) antigo(s) descartado(s)")
+
+    def blocked(self, function: str) -> bool:
+        return time.time() < self._blocked_until.get(_base_function(function), 0.0)
+
+    def settle(self, row_id: int, function: str, response) -> bool:
+        """
+        Registra o resultado de uma tentativa (response None = falha de rede,
+        que não conta como tentativa)
+
+        Returns:
+            True se a entrada saiu da outbox (entregue ou rejeitada em definitivo)
+        """
+        settled = self._settle(row_id, function, response)
+        if not settled:
+            # Envio imediato falhou: o loop de reenvio assume a entrada
+            self._wake.set()
+        return settled
+
+    def _settle(self, row_id: int, function: str, response) -> bool:
+        base = _base_function(function)
+        keep = response is None or self._retryable(base, response)
+        with self._lock:
+            self._in_flight.discard(row_id)
+            with self.conn:
+                if keep:
+                    # Falha de rede (sem resposta) não conta para MAX_ATTEMPTS
+                    if response is not None:
+                        self.conn.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+                else:
+                    self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+        if not keep and response.status_code >= 400:
+            self.logger.warning(f"⚠️  {function} rejeitado pelo servidor (HTTP {response.status_code}), descartado da outbox")
+        return not keep
+
+    def _retryable(self, base: str, response) -> bool:
+        kind = classify_response(response)
+        if kind == RATE_LIMITED:
+            try:
+                reset_ts = parse_reset_at(response.json().get('resetAt'))
+            except ValueError:
+                reset_ts = None
+            self._blocked_until[base] = reset_ts or time.time() + DEFAULT_BLOCK_SECONDS
+            return True
+        # Autenticação transitória (ex: erro ao gravar o nonce, relógio fora da janela) e 5xx/408
+        return kind in (AUTH_TRANSIENT, CLOCK_SKEW, SERVER)
+
+    def send(self, function: str, body: Optional[Any], priority: int, key: Optional[str] = None):
+        """
+        Grava e envia imediatamente (exceções de rede são propagadas ao chamador)
+
+        Returns:
+            Response do servidor, ou None se a função está bloqueada por 429
+            ou sem orçamento no governador de taxa (a entrada fica para o reenvio)
+        """
+        row_id = self.put(function, body, priority, key)
+        if self.blocked(function):
+            self.release(row_id)
+            return None
+        try:
+            response = self.transport.post(function, body)
+        except RateLimited:
+            self.release(row_id)
+            return None
+        except Exception:
+            self.settle(row_id, function, None)
+            raise
+        self.settle(row_id, function, response)
+        return response
+
+    def wake(self):
+        """Acorda o loop de reenvio (ex: no shutdown, após stop_event)"""
+        self._wake.set()
+
+    def release(self, row_id: int):
+        """Entrega a entrada ao loop de reenvio sem tentar o envio imediato"""
+        with self._lock:
+            self._in_flight.discard(row_id)
+        self._wake.set()
+
+    def replay(self) -> Optional[int]:
+        """
+        Reenvia um lote de entradas pendentes, por prioridade
+
+        Returns:
+            Entradas que saíram da outbox, ou None se o servidor continua inacessível
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, function, body, attempts FROM outbox ORDER BY priority, id LIMIT ?",
+                (self.batch_size + len(self._in_flight),)
+            ).fetchall()
+            rows = [row for row in rows if row[0] not in self._in_flight][:self.batch_size]
+
+        attempted = 0
+        self._next_ready = time.monotonic() + REPLAY_INTERVAL
+        for row_id, function, body, attempts in rows:
+            if self.stop_event.is_set():
+                break
+            if self.blocked(function):
+                continue
+            if attempts >= MAX_ATTEMPTS:
+                with self._lock, self.conn:
+                    self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self.dropped += 1
+                self.logger.warning(f"⚠️  {function} descartado da outbox após {attempts} tentativas")
+                continue
+
+            with self._lock:
+                if row_id in self._in_flight:
+                    continue
+                self._in_flight.add(row_id)
+            try:
+                # Ritmo do governador de taxa: sem orçamento, a entrada fica
+                # para a rodada em que a função for liberada. Uma tentativa
+                # por rodada: as repetições seguem o ritmo deste loop
+                response = self.transport.post(function, body, max_wait=0, retry=False)
+            except RateLimited as e:
+                with self._lock:
+                    self._in_flight.discard(row_id)
+                self._next_ready = min(self._next_ready, time.monotonic() + e.retry_after)
+                continue
+            except Exception as e:
+                self._settle(row_id, function, None)
+                if not self._offline:
+                    self._offline = True
+                    self.logger.warning(f"📮 Servidor inacessível, envios mantidos na outbox ({e.__class__.__name__})")
+                return None
+
+            if self._settle(row_id, function, response):
+                attempted += 1
+                if response.status_code < 400:
+                    self.replayed += 1
+        return attempted
+
+    def run(self):
+        """Loop de reenvio (thread própria)"""
+        self.logger.info(f"📮 Outbox iniciada ({self.db_path})")
+
+        wait = REPLAY_INTERVAL
+        while not self.stop_event.is_set():
+            self._wake.wait(wait)
+            self._wake.clear()
+            if self.stop_event.is_set():
+                break
+            try:
+                attempted = self.replay()
+            except sqlite3.DatabaseError as e:
+                with self._lock:
+                    self._in_flight.clear()
+                    self._rebuild(e)
+                attempted = 0
+
+            if attempted is None:
+                # Sem conectividade: backoff com jitter até MAX_REPLAY_BACKOFF
+                wait = self._backoff.next()
+                continue
+            self._backoff.reset()
+            # Próxima rodada quando a primeira função em espera for liberada
+            wait = max(0.05, min(REPLAY_INTERVAL, self._next_ready - time.monotonic()))
+            if attempted:
+                # Lote entregue: seguir com o próximo sem esperar
+                self._wake.set()
+            elif self._offline and not self.pending_count():
+                self._offline = False
+                self.logger.info(f"📮 Conectividade restabelecida, outbox esvaziada ({self.replayed} reenviados)")
+
+        self.logger.info("📮 Outbox parada")
+
+    def close(self):
+        if self.conn:
+            with self._lock:
+                try:
+                    self.conn.close()
+                except sqlite3.Error as e:
+                    self.logger.error(f"❌ Erro ao fechar outbox: {e}")
+                self.conn = None
@@ -0,0 +1,91 @@
+"""
+Agendamento adaptativo do polling de jobs
+"""
+import time
+import random
+from datetime import datetime
+from typing import Optional
+
+def parse_reset_at(reset_at: Optional[str]) -> Optional[float]:
+    """
+    Converte o resetAt (ISO 8601) retornado em respostas 429 para epoch
+
+    Returns:
+        Timestamp epoch em segundos ou None se ausente/inválido
+    """
+    if not reset_at:
+        return None
+    try:
+        # Python < 3.11 não aceita o sufixo 'Z' em fromisoformat
+        return datetime.fromisoformat(reset_at.replace('Z', '+00:00')).timestamp()
+    except (ValueError, AttributeError):
+        return None
+
+class PollScheduler:
+    """
+    Calcula o intervalo até o próximo poll
+
+    - Lote cheio: o servidor provavelmente tem mais jobs, re-poll imediato
+    - Lote parcial: re-poll após min_interval
+    - Lote vazio: o intervalo cresce (x backoff_factor) até idle_interval
+    - 429: aguarda até o resetAt informado pelo servidor
+    - Long-poll concluído: reconecta após jitter aleatório (evita rajadas sincronizadas)
+    """
+
+    def __init__(self, idle_interval: float, min_interval: float = 1.0, backoff_factor: float = 2.0):
+        self.idle_interval = idle_interval
+        self.min_interval = min(min_interval, idle_interval)
+        self.backoff_factor = backoff_factor
+        self._delay = idle_interval
+        self._blocked_until = 0.0
+
+    def record_rate_limit(self, reset_at: Optional[str]):
+        """Registra um 429; sem resetAt válido, aguarda idle_interval"""
+        reset_ts = parse_reset_at(reset_at)
+        if reset_ts is None:
+            reset_ts = time.time() + self.idle_interval
+        self._blocked_until = max(self._blocked_until, reset_ts)
+        self._delay = self.idle_interval
+
+    def block_for(self, seconds: float):
+        """Adia o próximo poll (orçamento local de poll-jobs esgotado)"""
+        self._blocked_until = max(self._blocked_until, time.time() + seconds)
+
+    def next_delay(self, received: int, batch_limit: int) -> float:
+        """
+        Args:
+            received: Quantidade de jobs recebidos no último poll
+            batch_limit: Tamanho máximo do lote aplicado pelo servidor
+
+        Returns:
+            Segundos até o próximo poll
+        """
+        if received > 0 and received >= batch_limit:
+            self._delay = 0.0
+        elif received > 0:
+            self._delay = self.min_interval
+        else:
+            self._delay = min(
+                self.idle_interval,
+                max(self.min_interval, self._delay * self.backoff_factor)
+            )
+
+        blocked = self._blocked_until - time.time()
+        return max(self._delay, blocked, 0.0)
+
+    def long_poll_delay(self, received: int, batch_limit: int, jitter: float) -> float:
+        """
+        Intervalo após um long-poll concluído normalmente (jobs ou timeout)
+
+        O servidor já aguardou pelos jobs, então o próximo poll sai logo,
+        exceto se houver bloqueio por 429.
+        """
+        if received > 0 and received >= batch_limit:
+            delay = 0.0
+        else:
+            delay = random.uniform(0, jitter)
+        # Um fallback posterior para interval polling recomeça do intervalo mínimo
+        self._delay = self.min_interval
+
+        blocked = self._blocked_until - time.time()
+        return max(delay, blocked, 0.0)
@@ -0,0 +1,163 @@
+"""
+Governador de taxa do lado do agente (token bucket por Edge Function)
+
+Os buckets são semeados com os limites configurados no servidor
+(_shared/rate-limit.ts). O servidor usa janela fixa e, ao estourar,
+bloqueia o agente por vários minutos; por isso o bucket é dimensionado para
+que burst + reposição em uma janela nunca passem do limite. Um 429 zera o
+bucket e bloqueia a função até o resetAt informado.
+"""
+import time
+import logging
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from poll_scheduler import parse_reset_at
+
+# (requisições, janela em segundos) por função, como no servidor
+SERVER_LIMITS: Dict[str, Tuple[int, int]] = {
+    'poll-jobs': (120, 60),
+    'heartbeat': (3, 60),
+    'ack-job': (60, 60),
+    'scan-virus': (10, 60),
+    'submit-system-metrics': (60, 3600),
+    'upload-report': (10, 60),
+    'list-reports': (30, 60),
+    'diagnostics-agent-logs': (120, 3600),
+}
+
+# Bloqueio aplicado a 429 sem resetAt (quotas esgotadas)
+DEFAULT_BLOCK_SECONDS = 60
+
+class RateLimited(Exception):
+    """Requisição não enviada: o orçamento da função está esgotado"""
+
+    def __init__(self, function: str, retry_after: float):
+        super().__init__(f"orçamento de {function} esgotado (liberação em {retry_after:.1f}s)")
+        self.function = function
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Bucket com reposição contínua; tokens podem ficar negativos (reservas)"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        # burst + reposição durante uma janela <= limit
+        self.capacity = max(1, limit // 4)
+        self.rate = (limit - self.capacity) / window if limit > self.capacity else limit / window
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # epoch (resetAt do servidor)
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateGovernor:
+    """
+    Orçamento de requisições por Edge Function, compartilhado pelos transportes
+
+    reserve() é chamado antes de cada requisição e devolve quanto esperar;
+    observe() registra a resposta (429 bloqueia a função até o resetAt).
+    Funções sem limite conhecido (ex: check-agent-updates) não são limitadas.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None, max_wait: float = 10.0):
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._buckets = {
+            function: TokenBucket(int(limit), float(window))
+            for function, (limit, window) in {**SERVER_LIMITS, **(limits or {})}.items()
+        }
+        self.delayed = 0
+        self.refused = 0
+
+    @staticmethod
+    def _base(function: str) -> str:
+        """'ack-job/<id>' → 'ack-job'"""
+        return function.split('/', 1)[0]
+
+    def reserve(self, function: str, max_wait: Optional[float] = None) -> float:
+        """
+        Reserva um token para uma requisição
+
+        Returns:
+            Segundos a aguardar antes de enviar (0 = imediato)
+
+        Raises:
+            RateLimited: a espera passaria de max_wait (nada é reservado)
+        """
+        bucket = self._buckets.get(self._base(function))
+        if bucket is None:
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        with self._lock:
+            now = time.monotonic()
+            bucket.refill(now)
+            wait = max(0.0, bucket.blocked_until - time.time())
+            if bucket.tokens < 1:
+                wait = max(wait, (1 - bucket.tokens) / bucket.rate)
+            if wait > max_wait:
+                self.refused += 1
+                raise RateLimited(self._base(function), wait)
+            bucket.tokens -= 1
+            if wait > 0:
+                self.delayed += 1
+        return wait
+
+    def observe(self, function: str, response):
+        """Registra a resposta do servidor (429 zera o bucket até o resetAt)"""
+        if response.status_code != 429:
+            return
+        bucket = self._buckets.get(self._base(function))
+        if bucket is None:
+            return
+        try:
+            reset_ts = parse_reset_at(response.json().get('resetAt'))
+        except (ValueError, AttributeError):
+            reset_ts = None
+        with self._lock:
+            bucket.blocked_until = max(bucket.blocked_until, reset_ts or time.time() + DEFAULT_BLOCK_SECONDS)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.updated = time.monotonic()
+        self.logger.warning(
+            f"🚦 {self._base(function)} limitado pelo servidor por "
+            f"{bucket.blocked_until - time.time():.0f}s"
+        )
+
+    def blocked_for(self, function: str) -> float:
+        """Segundos até a função ter um token livre (0 = pode enviar agora)"""
+        bucket = self._buckets.get(self._base(function))
+        if bucket is None:
+            return 0.0
+        with self._lock:
+            bucket.refill(time.monotonic())
+            wait = max(0.0, bucket.blocked_until - time.time())
+            if bucket.tokens < 1:
+                wait = max(wait, (1 - bucket.tokens) / bucket.rate)
+        return wait
+
+    def budget(self) -> Dict[str, Dict[str, float]]:
+        """Orçamento restante por função (tokens livres, capacidade e bloqueio)"""
+        result = {}
+        with self._lock:
+            now = time.monotonic()
+            for function, bucket in self._buckets.items():
+                bucket.refill(now)
+                result[function] = {
+                    'tokens': round(max(0.0, bucket.tokens), 2),
+                    'capacity': bucket.capacity,
+                    'per_minute': round(bucket.rate * 60, 2),
+                    'blocked_for': round(max(0.0, bucket.blocked_until - time.time()), 1),
+                }
+        return result
+
+    def summary(self) -> str:
+        blocked = [f for f, b in self.budget().items() if b['blocked_for'] > 0]
+        return (
+            f"{self.delayed} requisições adiadas, {self.refused} recusadas localmente"
+            + (f", bloqueadas: {', '.join(blocked)}" if blocked else "")
+        )
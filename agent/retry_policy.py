@@ -0,0 +1,179 @@
+"""
+Classificação de falhas, backoff com jitter e correção do relógio
+
+As falhas de uma requisição são classificadas (rede, timeout, 429,
+autenticação transitória, relógio fora da janela, autenticação
+permanente, 5xx) e cada classe tem sua própria política de nova tentativa
+com "decorrelated jitter": após um reboot em massa, os agentes se
+espalham no tempo em vez de repetir em sincronia.
+
+O offset do relógio do servidor é aprendido do header Date das respostas
+e aplicado ao timestamp das assinaturas HMAC, de modo que um host com o
+relógio adiantado/atrasado não falhe toda requisição com
+AUTH_TIMESTAMP_OUT_OF_RANGE.
+"""
+import time
+import random
+import logging
+import statistics
+from collections import deque
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Dict, NamedTuple, Optional
+
+# Classes de falha
+OK = 'ok'
+NETWORK = 'network'              # conexão recusada/falhou: o servidor não recebeu nada
+TIMEOUT = 'timeout'              # sem resposta: o servidor pode ter processado
+RATE_LIMITED = 'rate_limited'    # 429 (aguardar o resetAt, não repetir aqui)
+CLOCK_SKEW = 'clock_skew'        # AUTH_TIMESTAMP_OUT_OF_RANGE
+AUTH_TRANSIENT = 'auth_transient'
+AUTH_PERMANENT = 'auth_permanent'
+SERVER = 'server'                # 5xx/408
+CLIENT = 'client'                # demais 4xx: repetir não muda o resultado
+
+class RetryPolicy(NamedTuple):
+    attempts: int  # novas tentativas no transporte (além da primeira)
+    base: float    # segundos
+    cap: float     # segundos
+
+# Novas tentativas imediatas no transporte; falhas persistentes voltam ao
+# chamador (outbox, scheduler do poll, heartbeat), que tem seu próprio ritmo
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    NETWORK: RetryPolicy(attempts=2, base=0.5, cap=8.0),
+    SERVER: RetryPolicy(attempts=2, base=1.0, cap=10.0),
+    AUTH_TRANSIENT: RetryPolicy(attempts=1, base=0.2, cap=2.0),
+    # Reassinada com o offset aprendido do header Date da própria resposta
+    CLOCK_SKEW: RetryPolicy(attempts=1, base=0.0, cap=0.0),
+}
+
+# Códigos de erro estruturados do _shared/hmac.ts
+AUTH_CODES_TRANSIENT = {'AUTH_REPLAY_DETECTED'}  # nonce novo a cada tentativa
+
+def classify_response(response) -> str:
+    """Classe de uma resposta HTTP (OK para 2xx/3xx)"""
+    status = response.status_code
+    if status < 400:
+        return OK
+    if status == 429:
+        return RATE_LIMITED
+    if status in (401, 403):
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        code = data.get('code') if isinstance(data, dict) else None
+        if code == 'AUTH_TIMESTAMP_OUT_OF_RANGE':
+            return CLOCK_SKEW
+        if code in AUTH_CODES_TRANSIENT or (isinstance(data, dict) and data.get('transient')):
+            return AUTH_TRANSIENT
+        return AUTH_PERMANENT
+    if status == 408 or status >= 500:
+        return SERVER
+    return CLIENT
+
+def classify_error(error: BaseException) -> str:
+    """Classe de uma exceção de rede (requests ou aiohttp/asyncio)"""
+    name = type(error).__name__
+    # ReadTimeout/asyncio.TimeoutError/ServerTimeoutError: resposta perdida
+    if 'ReadTimeout' in name or name in ('TimeoutError', 'ServerTimeoutError'):
+        return TIMEOUT
+    return NETWORK
+
+class DecorrelatedJitter:
+    """
+    Backoff "decorrelated jitter": sleep = min(cap, uniform(base, sleep * 3))
+
+    Cresce como o exponencial, mas cada agente sorteia seu próprio intervalo.
+    """
+
+    def __init__(self, base: float, cap: float):
+        self.base = base
+        self.cap = cap
+        self._sleep = base
+
+    def next(self) -> float:
+        self._sleep = min(self.cap, random.uniform(self.base, max(self.base, self._sleep * 3)))
+        return self._sleep
+
+    def reset(self):
+        self._sleep = self.base
+
+class RetryState:
+    """Tentativas de uma única requisição, por classe de falha"""
+
+    def __init__(self, policies: Dict[str, RetryPolicy] = RETRY_POLICIES):
+        self.policies = policies
+        self._attempts: Dict[str, int] = {}
+        self._backoff: Dict[str, DecorrelatedJitter] = {}
+
+    def next_delay(self, kind: str) -> Optional[float]:
+        """
+        Returns:
+            Segundos até a nova tentativa, ou None se a classe não é repetida
+            (ou esgotou as tentativas)
+        """
+        policy = self.policies.get(kind)
+        if policy is None:
+            return None
+        used = self._attempts.get(kind, 0)
+        if used >= policy.attempts:
+            return None
+        self._attempts[kind] = used + 1
+        if kind not in self._backoff:
+            self._backoff[kind] = DecorrelatedJitter(policy.base, policy.cap)
+        return self._backoff[kind].next()
+
+class ServerClock:
+    """
+    Offset (servidor - local) aprendido do header Date das respostas
+
+    O header tem resolução de 1 s; a mediana das últimas amostras só é
+    aplicada quando passa de MIN_OFFSET, para não variar a cada resposta.
+    """
+
+    SAMPLES = 5
+    MIN_OFFSET = 2.0  # segundos
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._samples = deque(maxlen=self.SAMPLES)
+        self._lock = Lock()
+        self.offset = 0.0
+
+    def now(self) -> float:
+        """Epoch estimado do servidor"""
+        return time.time() + self.offset
+
+    def timestamp_ms(self) -> int:
+        """Timestamp para o header X-Timestamp das assinaturas"""
+        return int(self.now() * 1000)
+
+    def observe(self, date_header: Optional[str], sent_at: float, received_at: float):
+        """Registra o Date de uma resposta (sent_at/received_at em epoch local)"""
+        if not date_header:
+            return
+        try:
+            server_ts = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            return
+        # Date é truncado para o segundo: +0.5 s compensa em média
+        sample = server_ts + 0.5 - (sent_at + received_at) / 2
+
+        with self._lock:
+            self._samples.append(sample)
+            median = statistics.median(self._samples)
+            previous = self.offset
+            self.offset = median if abs(median) >= self.MIN_OFFSET else 0.0
+
+        if abs(self.offset - previous) >= self.MIN_OFFSET:
+            self.logger.warning(
+                f"🕒 Relógio local difere do servidor em {self.offset:+.1f}s; "
+                "assinaturas usarão o horário do servidor"
+            )
+
+    def learn(self, date_header: Optional[str], sent_at: float, received_at: float):
+        """Aplica imediatamente o Date de uma resposta AUTH_TIMESTAMP_OUT_OF_RANGE"""
+        with self._lock:
+            self._samples.clear()
+        self.observe(date_header, sent_at, received_at)
@@ -0,0 +1,160 @@
+"""
+Cliente da Edge Function scan-virus
+"""
+import time
+import logging
+from threading import Lock
+from typing import Dict, Any, Optional
+
+from config import AgentConfig
+from http_transport import AgentTransport
+from poll_scheduler import parse_reset_at
+from rate_governor import RateLimited
+from verdict_cache import VerdictCache
+
+# Bloqueio aplicado a 429 sem resetAt (quota mensal/diária esgotada)
+QUOTA_BLOCK_SECONDS = 3600
+
+class ScanClient:
+    """
+    Consulta o veredito de hashes no servidor
+
+    O cache local de vereditos é consultado antes da rede. Enquanto o
+    servidor estiver limitando (429), as consultas são puladas sem
+    bloquear o scan e contabilizadas como adiadas.
+    """
+
+    def __init__(self, config: AgentConfig, transport: AgentTransport, cache: Optional[VerdictCache] = None):
+        self.config = config
+        self.transport = transport
+        self.cache = cache
+        self.logger = logging.getLogger(__name__)
+        self._blocked_until = 0.0
+        # Contadores atualizados também pelas threads do ScanCoalescer
+        self._lock = Lock()
+
+        self.cached = 0
+        self.submitted = 0
+        self.malicious = 0
+        self.unknown = 0
+        self.deferred = 0
+
+    def blocked(self) -> bool:
+        return time.time() < self._blocked_until
+
+    def blocked_until(self) -> float:
+        return self._blocked_until
+
+    def check(self, file_path: str, file_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Envia {filePath, fileHash} ao scan-virus
+
+        Returns:
+            Veredito do servidor, {"unknown": True} se nenhum serviço conhece o
+            hash, ou None se a consulta foi adiada/falhou
+        """
+        verdict = self.cached_verdict(file_path, file_hash)
+        if verdict is not None:
+            return verdict
+
+        if self.blocked():
+            self.count_deferred()
+            return None
+
+        try:
+            response = self.transport.post('scan-virus', {'filePath': file_path, 'fileHash': file_hash})
+        except RateLimited as e:
+            self.block_for(e.retry_after)
+            self.count_deferred()
+            return None
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao consultar scan-virus: {e}")
+            self.count_deferred()
+            return None
+
+        return self.handle_response(file_path, file_hash, response)
+
+    def cached_verdict(self, file_path: str, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Veredito do cache local (já contabilizado), ou None"""
+        if self.cache is None:
+            return None
+        verdict = self.cache.get(file_hash)
+        if verdict is not None:
+            with self._lock:
+                self.cached += 1
+            self.record_verdict(file_path, verdict)
+        return verdict
+
+    def record_server_verdict(self, file_path: str, file_hash: str, verdict: Dict[str, Any]):
+        """Registra um veredito recebido do servidor (cache + contadores)"""
+        with self._lock:
+            self.submitted += 1
+        if self.cache is not None:
+            self.cache.put(file_hash, verdict)
+        self.record_verdict(file_path, verdict)
+
+    def block_for(self, seconds: float):
+        """Pula consultas enquanto o orçamento local do scan-virus está esgotado"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.time() + seconds)
+
+    def count_deferred(self, count: int = 1):
+        with self._lock:
+            self.deferred += count
+
+    def record_verdict(self, file_path: str, verdict: Dict[str, Any]):
+        """Contabiliza o veredito de um arquivo (e alerta se malicioso)"""
+        if verdict.get('unknown'):
+            with self._lock:
+                self.unknown += 1
+        elif verdict.get('isMalicious'):
+            with self._lock:
+                self.malicious += 1
+            self.logger.warning(
+                f"🦠 Arquivo malicioso: {file_path} "
+                f"({verdict.get('positives')}/{verdict.get('totalScans')} detecções)"
+            )
+
+    def handle_response(self, file_path: str, file_hash: str, response) -> Optional[Dict[str, Any]]:
+        """Interpreta a resposta do scan-virus (independente do transporte)"""
+        if response.status_code in (200, 404):
+            verdict = response.json() if response.status_code == 200 else {'unknown': True}
+            self.record_server_verdict(file_path, file_hash, verdict)
+            return verdict
+
+        if response.status_code == 429:
+            self.count_deferred()
+            self.handle_rate_limit(response)
+            return None
+
+        self.count_deferred()
+        self.logger.error(f"❌ scan-virus falhou: {response.status_code} - {response.text[:200]}")
+        return None
+
+    def handle_rate_limit(self, response) -> bool:
+        """
+        Registra um 429 do scan-virus
+
+        Returns:
+            True se é rate limit (resetAt informado), False se é quota esgotada
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        reset_ts = parse_reset_at(data.get('resetAt'))
+        rate_limited = reset_ts is not None
+        if not rate_limited:
+            reset_ts = time.time() + QUOTA_BLOCK_SECONDS
+            self.logger.warning(f"⚠️  Quota de scans esgotada: {data.get('error', '')}")
+        else:
+            self.logger.warning(f"⚠️  Rate limit no scan-virus até {data.get('resetAt')}")
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, reset_ts)
+        return rate_limited
+
+    def summary(self) -> str:
+        return (
+            f"{self.submitted} consultados, {self.cached} do cache, {self.malicious} maliciosos, "
+            f"{self.unknown} desconhecidos, {self.deferred} adiados"
+        )
@@ -0,0 +1,297 @@
+"""
+Agrupamento de consultas ao scan-virus em lotes
+
+Em vez de um request assinado por arquivo, os hashes são acumulados e
+enviados como {"items": [{filePath, fileHash}, ...]}. Um lote sai quando
+atinge scan_batch_max_items, scan_batch_max_bytes ou quando o hash mais
+antigo espera há scan_batch_max_delay segundos.
+
+O servidor consulta os serviços externos para poucos hashes por lote e
+devolve os demais como 'pending'. Esses itens ficam retidos por um backoff
+antes de voltar ao próximo lote, e só são adiados quando o servidor deixa
+de progredir. Hashes adiados não entram no cache de vereditos, então o
+próximo scan (o índice de hashes entrega os arquivos inalterados de novo)
+os consulta outra vez.
+"""
+import json
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Event, Thread, Condition, BoundedSemaphore
+from typing import Dict, List, Set, Tuple
+
+from config import AgentConfig
+from scan_client import ScanClient
+from rate_governor import RateLimited
+
+# Itens devolvidos como 'pending' (servidor não consultou os serviços
+# externos neste lote) voltam após este atraso; lotes sem nenhum veredito
+# novo dobram o atraso até o teto
+PENDING_RETRY_MIN = 5.0
+PENDING_RETRY_MAX = 120.0
+
+# Lotes seguidos sem progresso após os quais um item 'pending' é adiado
+MAX_STALLED_ROUNDS = 5
+
+Batch = List[Tuple[str, List[str]]]  # [(sha256, [caminhos])]
+
+def _item_bytes(file_hash: str, paths: List[str]) -> int:
+    """Tamanho aproximado de um item no body do lote (só o primeiro caminho vai)"""
+    return len(paths[0].encode('utf-8')) + len(file_hash) + 32
+
+class ScanCoalescer:
+    """
+    Coalescedor de hashes para o scan-virus em lote
+
+    No máximo scan_batch_in_flight lotes ficam em voo; com todos ocupados
+    (ou aguardando o resetAt de um 429), submit() bloqueia e segura o scan.
+    Servidores sem suporte a lote (400 para {"items"}) fazem o coalescedor
+    voltar a consultas individuais via ScanClient.check().
+    """
+
+    def __init__(self, config: AgentConfig, client: ScanClient, stop_event: Event):
+        self.config = config
+        self.client = client
+        self.stop_event = stop_event
+        self.logger = logging.getLogger(__name__)
+
+        self.max_items = config.scan_batch_max_items
+        self.max_bytes = config.scan_batch_max_bytes
+        self.max_delay = config.scan_batch_max_delay
+
+        self._cond = Condition()
+        self._pending: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._pending_bytes = 0
+        self._oldest = 0.0
+        # Itens 'pending' aguardando o backoff antes de voltar a _pending
+        self._held: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._held_until = 0.0
+        self._pending_delay = PENDING_RETRY_MIN
+        self._stalled: Dict[str, int] = {}
+
+        self._slots = BoundedSemaphore(config.scan_batch_in_flight)
+        self._senders = ThreadPoolExecutor(
+            max_workers=config.scan_batch_in_flight,
+            thread_name_prefix="ScanBatch"
+        )
+        self._futures: Set[Future] = set()
+        self._closed = False
+        self._quota_exhausted = False
+        self.batch_supported = True
+
+        self.batches_sent = 0
+        self.items_sent = 0
+
+        self._flusher = Thread(target=self._flush_loop, name="ScanBatchFlusher", daemon=True)
+        self._flusher.start()
+
+    def submit(self, file_path: str, file_hash: str):
+        """Enfileira um hash (cache local primeiro); pode bloquear por back-pressure"""
+        if self.client.cached_verdict(file_path, file_hash) is not None:
+            return
+        if not self.batch_supported:
+            self.client.check(file_path, file_hash)
+            return
+
+        batch = None
+        with self._cond:
+            paths = self._pending.get(file_hash)
+            if paths is not None:
+                # Mesmo conteúdo em outro caminho: um único item no lote
+                paths.append(file_path)
+                return
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending[file_hash] = [file_path]
+            self._pending_bytes += _item_bytes(file_hash, [file_path])
+            if self._full_locked():
+                batch = self._take_locked()
+
+        if batch:
+            self._dispatch(batch)
+
+    def _full_locked(self) -> bool:
+        return len(self._pending) >= self.max_items or self._pending_bytes >= self.max_bytes
+
+    def _take_locked(self) -> Batch:
+        """Retira até max_items itens de _pending (os mais antigos primeiro)"""
+        batch: Batch = []
+        while self._pending and len(batch) < self.max_items:
+            file_hash, paths = self._pending.popitem(last=False)
+            self._pending_bytes -= _item_bytes(file_hash, paths)
+            batch.append((file_hash, paths))
+        if not self._pending:
+            self._pending_bytes = 0
+        return batch
+
+    def _release_held_locked(self):
+        """Devolve os itens retidos a _pending, à frente dos novos"""
+        if not self._pending:
+            self._oldest = time.monotonic()
+        merged = self._held
+        for file_hash, paths in self._pending.items():
+            merged.setdefault(file_hash, []).extend(paths)
+        self._pending = merged
+        self._pending_bytes = sum(_item_bytes(h, paths) for h, paths in merged.items())
+        self._held = OrderedDict()
+
+    def _dispatch(self, batch: Batch):
+        # Espera por um slot livre (back-pressure), observando o shutdown
+        while not self._slots.acquire(timeout=0.5):
+            if self.stop_event.is_set():
+                self.client.count_deferred(sum(len(paths) for _, paths in batch))
+                return
+
+        future = self._senders.submit(self._send, batch)
+        with self._cond:
+            self._futures.add(future)
+
+        def done(f: Future):
+            self._slots.release()
+            with self._cond:
+                self._futures.discard(f)
+                self._cond.notify_all()
+        future.add_done_callback(done)
+
+    def _flush_loop(self):
+        tick = max(0.05, self.max_delay / 2)
+        while not self._closed:
+            time.sleep(tick)
+            batch = None
+            with self._cond:
+                now = time.monotonic()
+                if self._held and now >= self._held_until:
+                    self._release_held_locked()
+                if self._pending and (self._full_locked() or now - self._oldest >= self.max_delay):
+                    batch = self._take_locked()
+            if batch:
+                self._dispatch(batch)
+
+    def _wait_unblocked(self) -> bool:
+        """Aguarda o resetAt de um 429; False se o agente está parando"""
+        while self.client.blocked():
+            remaining = self.client.blocked_until() - time.time()
+            if self.stop_event.wait(max(0.0, min(remaining, 5.0))):
+                return False
+        return True
+
+    def _send(self, batch: Batch):
+        total_paths = sum(len(paths) for _, paths in batch)
+        body = json.dumps({'items': [{'filePath': paths[0], 'fileHash': h} for h, paths in batch]})
+
+        while True:
+            if self._quota_exhausted or not self._wait_unblocked():
+                self.client.count_deferred(total_paths)
+                return
+            try:
+                response = self.client.transport.post('scan-virus', body)
+            except RateLimited as e:
+                # Orçamento local esgotado: aguardar (back-pressure) e tentar de novo
+                self.client.block_for(e.retry_after)
+                continue
+            except Exception as e:
+                self.logger.error(f"❌ Erro ao enviar lote ao scan-virus: {e}")
+                self.client.count_deferred(total_paths)
+                return
+
+            if response.status_code == 429:
+                if not self.client.handle_rate_limit(response):
+                    self._quota_exhausted = True
+                continue
+            break
+
+        if response.status_code == 400 and self.batch_supported:
+            # Servidor antigo: apenas {filePath, fileHash}
+            self.logger.warning("⚠️  scan-virus sem suporte a lote, usando consultas individuais")
+            self.batch_supported = False
+            for file_hash, paths in batch:
+                verdict = self.client.check(paths[0], file_hash)
+                for path in paths[1:]:
+                    if verdict is not None:
+                        self.client.record_verdict(path, verdict)
+            return
+
+        if response.status_code != 200:
+            self.logger.error(f"❌ Lote do scan-virus falhou: {response.status_code} - {response.text[:200]}")
+            self.client.count_deferred(total_paths)
+            return
+
+        results = response.json().get('results', [])
+        with self._cond:
+            self.batches_sent += 1
+            self.items_sent += len(batch)
+
+        # Progresso: o servidor resolveu ao menos um hash neste lote
+        progress = any(item.get('status') in ('ok', 'unknown') for item in results)
+        retry: Batch = []
+        for (file_hash, paths), item in zip(batch, results):
+            status = item.get('status')
+            if status == 'pending':
+                with self._cond:
+                    stalled = 0 if progress else self._stalled.get(file_hash, 0) + 1
+                    if stalled < MAX_STALLED_ROUNDS:
+                        self._stalled[file_hash] = stalled
+                        retry.append((file_hash, paths))
+                        continue
+                    self._stalled.pop(file_hash, None)
+                self.client.count_deferred(len(paths))
+                continue
+            if status not in ('ok', 'unknown'):
+                self.client.count_deferred(len(paths))
+                continue
+
+            verdict = {'unknown': True} if status == 'unknown' else {
+                k: item.get(k) for k in ('isMalicious', 'positives', 'totalScans', 'permalink', 'cached')
+            }
+            self.client.record_server_verdict(paths[0], file_hash, verdict)
+            for path in paths[1:]:
+                self.client.record_verdict(path, verdict)
+            with self._cond:
+                self._stalled.pop(file_hash, None)
+
+        if retry:
+            # Sem reenvio imediato: cada lote consome orçamento do scan-virus
+            with self._cond:
+                if progress:
+                    self._pending_delay = PENDING_RETRY_MIN
+                else:
+                    self._pending_delay = min(self._pending_delay * 2, PENDING_RETRY_MAX)
+                self._held_until = time.monotonic() + self._pending_delay
+                for file_hash, paths in retry:
+                    self._held.setdefault(file_hash, []).extend(paths)
+
+    def close(self):
+        """Envia o lote restante e aguarda os lotes em voo e os itens retidos"""
+        waiting_logged = False
+        while True:
+            with self._cond:
+                if self._held and time.monotonic() >= self._held_until:
+                    self._release_held_locked()
+                batch = self._take_locked() if self._pending else None
+                idle = not batch and not self._futures and not self._held
+                held = sum(len(paths) for paths in self._held.values())
+            if batch:
+                self._dispatch(batch)
+            elif idle or self.stop_event.is_set():
+                break
+            else:
+                if held and not waiting_logged:
+                    waiting_logged = True
+                    self.logger.info(f"⏳ Aguardando vereditos de {held} arquivo(s) ainda pendentes no scan-virus")
+                with self._cond:
+                    self._cond.wait(timeout=0.5)
+
+        with self._cond:
+            # Interrompido pelo shutdown: o próximo scan consulta de novo
+            leftover = sum(len(paths) for paths in self._held.values())
+            leftover += sum(len(paths) for paths in self._pending.values())
+            self._held = OrderedDict()
+            self._pending = OrderedDict()
+            self._pending_bytes = 0
+        if leftover:
+            self.client.count_deferred(leftover)
+
+        self._closed = True
+        self._senders.shutdown(wait=True)
+        self.logger.info(f"📦 Lotes enviados ao scan-virus: {self.batches_sent} ({self.items_sent} hashes)")
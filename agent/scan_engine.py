@@ -0,0 +1,402 @@
+"""
+Motor de scan do sistema de arquivos (job 'scan')
+
+O walker lista os diretórios com os.scandir em um pool de threads (o
+scandir libera o GIL nas syscalls, então diretórios em discos lentos ou de
+rede são listados em paralelo) e entrega os arquivos em lotes a um pool de
+processos que calcula o SHA256. Nenhum ponto do pipeline mantém a lista
+completa de arquivos em memória: o walker é um gerador e o número de lotes
+em voo é limitado. Com o HashIndex, arquivos cuja tupla de stat não mudou
+desde o último scan não são relidos.
+"""
+import os
+import stat
+import time
+import fnmatch
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from threading import Event
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from config import AgentConfig
+from hash_index import HashIndex
+
+# Limites de um lote enviado aos processos hasher
+BATCH_MAX_FILES = 64
+BATCH_MAX_BYTES = 64 * 1024 * 1024
+
+# Lotes em voo por worker (mantém os processos ocupados sem acumular resultados)
+IN_FLIGHT_PER_WORKER = 2
+
+# Threads do walker e diretórios em listagem simultânea
+WALKER_THREADS = 4
+WALKER_IN_FLIGHT = WALKER_THREADS * 2
+
+class FileEntry(NamedTuple):
+    """Arquivo elegível encontrado pelo walker (campos na ordem do HashIndex)"""
+    path: str
+    dev: int
+    ino: int
+    size: int
+    mtime_ns: int
+
+class HashResult(NamedTuple):
+    """Resultado do hash de um arquivo (sha256 None em caso de erro)"""
+    path: str
+    size: int
+    sha256: Optional[str]
+    error: Optional[str]
+    cached: bool = False  # hash reaproveitado do índice
+
+@dataclass
+class ScanSpec:
+    """Parâmetros de um job de scan"""
+    roots: List[str]
+    include: List[str] = field(default_factory=list)  # globs; vazio = todos
+    exclude: List[str] = field(default_factory=list)
+    recursive: bool = True
+    max_file_size: int = 0  # bytes; 0 = sem limite
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any], config: AgentConfig) -> "ScanSpec":
+        """
+        Monta a especificação a partir do payload do job
+
+        Formato aceito:
+        {
+            "path": "/dir" | "paths": ["/a", "/b"],
+            "recursive": true,
+            "extensions": [".exe", ".dll"],   # atalho para include "*.exe"
+            "include": ["*.ps1"],
+            "exclude": ["*/node_modules/*"],
+            "max_file_size_mb": 100
+        }
+        """
+        roots = payload.get('paths') or ([payload['path']] if payload.get('path') else [])
+        if not roots:
+            raise ValueError("payload de scan requer 'path' ou 'paths'")
+
+        include = list(payload.get('include') or [])
+        for ext in payload.get('extensions') or []:
+            include.append(f"*{ext}" if ext.startswith('.') else f"*.{ext}")
+
+        max_mb = payload.get('max_file_size_mb', config.scan_max_file_size_mb)
+        return cls(
+            roots=[os.path.abspath(os.path.expanduser(r)) for r in roots],
+            include=[p.lower() for p in include],
+            exclude=list(payload.get('exclude') or []),
+            recursive=bool(payload.get('recursive', True)),
+            max_file_size=int(max_mb * 1024 * 1024) if max_mb else 0
+        )
+
+    def excludes_dir(self, path: str, name: str) -> bool:
+        return _matches(self.exclude, path, name)
+
+    def accepts_file(self, path: str, name: str) -> bool:
+        """Aplica exclude e include (include sem diferenciar maiúsculas)"""
+        if self.exclude and _matches(self.exclude, path, name):
+            return False
+        return not self.include or _matches(self.include, path.lower(), name.lower())
+
+@dataclass
+class ScanStats:
+    """Contadores e throughput de um scan"""
+    started: float = field(default_factory=time.monotonic)
+    files_seen: int = 0
+    files_skipped: int = 0
+    files_hashed: int = 0
+    bytes_hashed: int = 0
+    files_cached: int = 0
+    bytes_cached: int = 0
+    errors: int = 0
+
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started, 1e-6)
+
+    def summary(self) -> str:
+        elapsed = self.elapsed()
+        return (
+            f"{self.files_hashed} arquivos hasheados, {self.bytes_hashed / 1048576:.1f} MB em {elapsed:.1f}s "
+            f"({self.files_hashed / elapsed:.1f} arquivos/s, {self.bytes_hashed / 1048576 / elapsed:.1f} MB/s), "
+            f"{self.files_cached} inalterados ({self.bytes_cached / 1048576:.1f} MB não relidos), "
+            f"{self.files_skipped} ignorados, {self.errors} erros"
+        )
+
+def _matches(patterns: List[str], path: str, name: str) -> bool:
+    return any(fnmatch.fnmatchcase(name, p) or fnmatch.fnmatchcase(path, p) for p in patterns)
+
+class _DirListing(NamedTuple):
+    """Resultado da listagem de um diretório (executa nas threads do walker)"""
+    key: Optional[Tuple[int, int]]  # (dev, ino) do diretório; None se inacessível
+    files: List[FileEntry]
+    subdirs: List[str]
+    seen: int
+    skipped: int
+    errors: int
+
+def _list_dir(spec: ScanSpec, path: str) -> _DirListing:
+    files: List[FileEntry] = []
+    subdirs: List[str] = []
+    seen = skipped = errors = 0
+    try:
+        st = os.stat(path, follow_symlinks=False)
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if spec.recursive and not spec.excludes_dir(entry.path, entry.name):
+                            subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+
+                    seen += 1
+                    if not spec.accepts_file(entry.path, entry.name):
+                        skipped += 1
+                        continue
+
+                    entry_st = entry.stat(follow_symlinks=False)
+                    if spec.max_file_size and entry_st.st_size > spec.max_file_size:
+                        skipped += 1
+                        continue
+                    # No Windows o stat do scandir não traz st_ino; inode() traz
+                    files.append(FileEntry(entry.path, entry_st.st_dev, entry.inode(), entry_st.st_size, entry_st.st_mtime_ns))
+                except OSError:
+                    errors += 1
+    except OSError as e:
+        logging.getLogger(__name__).debug("Sem acesso a %s: %s", path, e)
+        return _DirListing(None, [], [], 0, 0, 1)
+    return _DirListing((st.st_dev, st.st_ino), files, subdirs, seen, skipped, errors)
+
+def walk_files(spec: ScanSpec, stats: ScanStats, stop_event: Event) -> Iterator[FileEntry]:
+    """
+    Percorre as raízes do scan sem seguir symlinks
+
+    As raízes são resolvidas (uma raiz que é symlink é escaneada pelo destino);
+    abaixo delas nenhum symlink é seguido. Os diretórios são listados em
+    paralelo por WALKER_THREADS threads e os arquivos saem na ordem em que as
+    listagens terminam. Diretórios excluídos não são visitados; cada inode de
+    diretório é visitado uma única vez (protege contra bind mounts em loop).
+    """
+    visited: Set[Tuple[int, int]] = set()
+    pending: List[str] = []
+    logger = logging.getLogger(__name__)
+
+    for root in spec.roots:
+        resolved = os.path.realpath(root)
+        try:
+            st = os.stat(resolved)
+        except OSError as e:
+            logger.debug("Ignorando %s: %s", root, e)
+            stats.errors += 1
+            continue
+
+        if stat.S_ISREG(st.st_mode):
+            # Raiz apontando direto para um arquivo (filtros já aplicados por quem a listou)
+            stats.files_seen += 1
+            if spec.max_file_size and st.st_size > spec.max_file_size:
+                stats.files_skipped += 1
+                continue
+            yield FileEntry(resolved, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        elif stat.S_ISDIR(st.st_mode):
+            pending.append(resolved)
+
+    in_flight: Dict[Future, str] = {}
+    pool = ThreadPoolExecutor(max_workers=WALKER_THREADS, thread_name_prefix='scan-walker')
+    try:
+        while (pending or in_flight) and not stop_event.is_set():
+            while pending and len(in_flight) < WALKER_IN_FLIGHT:
+                path = pending.pop()
+                in_flight[pool.submit(_list_dir, spec, path)] = path
+
+            done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                listing = future.result()
+                stats.errors += listing.errors
+                # Mesmo inode listado por outro caminho: descarta a listagem
+                if listing.key is None or listing.key in visited:
+                    continue
+                visited.add(listing.key)
+
+                stats.files_seen += listing.seen
+                stats.files_skipped += listing.skipped
+                pending.extend(reversed(listing.subdirs))
+                for entry in listing.files:
+                    yield entry
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def hash_files(batch: List[FileEntry], buffer_size: int) -> List[HashResult]:
+    """
+    Calcula o SHA256 de um lote de arquivos (executa nos processos do pool)
+
+    Um único buffer é reutilizado via readinto para todo o lote.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    results = []
+    for entry in batch:
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with open(entry.path, 'rb', buffering=0) as f:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    digest.update(view[:n])
+                    size += n
+            results.append(HashResult(entry.path, size, digest.hexdigest(), None))
+        except OSError as e:
+            results.append(HashResult(entry.path, entry.size, None, str(e)))
+    return results
+
+def _batches(entries: Iterator[FileEntry]) -> Iterator[List[FileEntry]]:
+    batch: List[FileEntry] = []
+    batch_bytes = 0
+    for entry in entries:
+        batch.append(entry)
+        batch_bytes += entry.size
+        if len(batch) >= BATCH_MAX_FILES or batch_bytes >= BATCH_MAX_BYTES:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+def _mp_context():
+    # fork em um processo com threads (heartbeat, poller) pode herdar locks
+    # presos; forkserver/spawn iniciam os hashers limpos
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def check_worker_pool(timeout: float = 60):
+    """Inicia um hasher e aguarda uma tarefa (falha se o executável não sobe subprocessos)"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=_mp_context()) as pool:
+        pool.submit(abs, -1).result(timeout=timeout)
+
+class ScanEngine:
+    """Executa um scan: walker → índice de hashes → pool de hashers → callback por arquivo"""
+
+    def __init__(self, config: AgentConfig, stop_event: Event, index: Optional[HashIndex] = None):
+        self.config = config
+        self.stop_event = stop_event
+        self.index = index
+        self.logger = logging.getLogger(__name__)
+        self.workers = config.scan_workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ScanEngine":
+        # Mantém o pool de hashers vivo entre vários run() (ex: watcher)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(wait=True)
+        self._pool = None
+
+    def run(
+        self,
+        spec: ScanSpec,
+        on_result: Callable[[HashResult], None],
+        verbose: bool = True
+    ) -> ScanStats:
+        """
+        Executa o scan até o fim ou até stop_event
+
+        on_result é chamado na thread do job para cada arquivo com hash
+        (calculado ou reaproveitado do índice), na ordem de conclusão.
+        Com verbose=False início e resumo vão para o nível DEBUG.
+        """
+        stats = ScanStats()
+        index = self.index
+        max_in_flight = self.workers * IN_FLIGHT_PER_WORKER
+        in_flight: Dict[Future, List[FileEntry]] = {}
+        next_report = time.monotonic() + self.config.scan_progress_interval
+
+        log = self.logger.info if verbose else self.logger.debug
+        log(
+            f"🔍 Scan iniciado: {', '.join(spec.roots[:5])}{' ...' if len(spec.roots) > 5 else ''} "
+            f"({self.workers} hashers, include: {spec.include or '*'}, exclude: {spec.exclude or '-'})"
+        )
+
+        def maybe_report():
+            nonlocal next_report
+            if time.monotonic() >= next_report:
+                self._report_progress(stats)
+                next_report = time.monotonic() + self.config.scan_progress_interval
+
+        def uncached(entries: Iterator[FileEntry]) -> Iterator[FileEntry]:
+            # Arquivos com a mesma tupla de stat reaproveitam o hash indexado
+            for entry in entries:
+                sha256 = index.lookup(*entry) if index else None
+                if sha256 is None:
+                    yield entry
+                    continue
+                stats.files_cached += 1
+                stats.bytes_cached += entry.size
+                on_result(HashResult(entry.path, entry.size, sha256, None, cached=True))
+                maybe_report()
+
+        def collect(done: Set[Future]):
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    self.logger.error(f"❌ Falha em lote de hash: {e}")
+                    stats.errors += len(batch)
+                    continue
+                for entry, result in zip(batch, results):
+                    if result.sha256 is None:
+                        stats.errors += 1
+                        self.logger.debug("Erro ao ler %s: %s", result.path, result.error)
+                        continue
+                    stats.files_hashed += 1
+                    stats.bytes_hashed += result.size
+                    # Tamanho lido diferente do stat: arquivo mudou durante a leitura
+                    if index and result.size == entry.size:
+                        index.record(*entry, result.sha256)
+                    on_result(result)
+
+        own_pool = self._pool is None
+        pool = self._pool or ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+        try:
+            for batch in _batches(uncached(walk_files(spec, stats, self.stop_event))):
+                if self.stop_event.is_set():
+                    break
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[pool.submit(hash_files, batch, self.config.scan_buffer_size)] = batch
+                maybe_report()
+
+            while in_flight and not self.stop_event.is_set():
+                done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                collect(done)
+                maybe_report()
+        finally:
+            # Lotes ainda não iniciados são descartados; os em execução
+            # terminam antes do shutdown do pool
+            for future in in_flight:
+                future.cancel()
+            if own_pool:
+                pool.shutdown(wait=True)
+
+        if index:
+            index.flush()
+
+        log(f"📊 Scan concluído: {stats.summary()}")
+        return stats
+
+    def _report_progress(self, stats: ScanStats):
+        elapsed = stats.elapsed()
+        done = stats.files_hashed + stats.files_cached
+        self.logger.info(
+            f"  → {done}/{stats.files_seen} arquivos ({stats.files_cached} do índice), "
+            f"{stats.bytes_hashed / 1048576:.0f} MB lidos "
+            f"({done / elapsed:.0f} arquivos/s, {stats.bytes_hashed / 1048576 / elapsed:.1f} MB/s)"
+        )
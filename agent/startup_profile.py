@@ -0,0 +1,144 @@
+"""
+Perfil de inicialização do agente (--startup-profile)
+
+Mede o tempo de import de cada módulo (equivalente ao python -X importtime,
+mas funciona também no executável PyInstaller, que não aceita opções -X) e
+os marcos da inicialização até o primeiro heartbeat aceito.
+
+Instalado no topo de main.py, antes dos demais imports. Os tempos são
+relativos à instalação (interpretador já carregado); o tempo total do
+processo, incluindo a extração do executável onefile, é medido de fora
+por tools/bench_startup.py.
+"""
+import sys
+import time
+import threading
+import importlib.abc
+from typing import Any, Dict, List, Optional, Tuple
+
+# Módulos listados no relatório (os de maior tempo cumulativo)
+TOP_IMPORTS = 15
+
+class _TimedLoader(importlib.abc.Loader):
+    """Delega ao loader original medindo create_module + exec_module"""
+
+    def __init__(self, loader, profiler: 'StartupProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+        self._started: Optional[float] = None
+
+    def create_module(self, spec):
+        # Extensões C fazem o trabalho (dlopen, PyInit) aqui, não no exec_module
+        self._started = self._profiler._enter()
+        try:
+            return self._loader.create_module(spec)
+        except BaseException:
+            self._profiler._exit(spec.name, self._started)
+            raise
+
+    def exec_module(self, module):
+        started = self._started if self._started is not None else self._profiler._enter()
+        self._started = None
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__, started)
+            # Após o import o módulo volta a expor o loader original
+            # (importlib.resources, pkgutil, inspect...)
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    """Finder de sys.meta_path que cronometra imports e registra marcos"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.milestones: Dict[str, float] = {}
+        # módulo -> (tempo próprio, tempo cumulativo) em segundos
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        # Soma dos imports de nível superior (sem contar imports aninhados duas vezes)
+        self.import_total = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def install(cls) -> 'StartupProfiler':
+        profiler = cls()
+        sys.meta_path.insert(0, profiler)
+        return profiler
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _enter(self) -> float:
+        stack = self._stack()
+        stack.append(0.0)
+        return time.perf_counter()
+
+    def _exit(self, name: str, started: float):
+        elapsed = time.perf_counter() - started
+        stack = self._stack()
+        children = stack.pop()
+        with self._lock:
+            self.imports[name] = (elapsed - children, elapsed)
+            if stack:
+                stack[-1] += elapsed
+            else:
+                self.import_total += elapsed
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def mark(self, name: str):
+        """Registra um marco da inicialização (apenas a primeira ocorrência)"""
+        self.milestones.setdefault(name, time.perf_counter() - self.started)
+
+    def elapsed_ms(self, name: str) -> Optional[float]:
+        value = self.milestones.get(name)
+        return None if value is None else round(value * 1000, 1)
+
+    def report(self, top: int = TOP_IMPORTS) -> Dict[str, Any]:
+        with self._lock:
+            imports = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)
+            total = self.import_total
+        return {
+            "milestones_ms": {name: round(value * 1000, 1) for name, value in self.milestones.items()},
+            "imports_ms": round(total * 1000, 1),
+            "modules": len(imports),
+            "top_imports": [
+                {"module": name, "self_ms": round(own * 1000, 1), "cumulative_ms": round(cumulative * 1000, 1)}
+                for name, (own, cumulative) in imports[:top]
+            ],
+        }
+
+    def log_report(self, logger, report: Dict[str, Any]):
+        logger.info(
+            f"⏱️  Perfil de inicialização: {report['modules']} módulos importados em "
+            f"{report['imports_ms']:.0f} ms"
+        )
+        for name, value in report['milestones_ms'].items():
+            logger.info(f"  → {name:<16} {value:8.1f} ms")
+        logger.info("  Imports mais lentos (cumulativo / próprio):")
+        for entry in report['top_imports']:
+            logger.info(f"  → {entry['module']:<32} {entry['cumulative_ms']:8.1f} ms {entry['self_ms']:8.1f} ms")
@@ -0,0 +1,42 @@
+"""
+Auto-update: bundles onedir não trocam o próprio executável
+"""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from auto_updater import AutoUpdater  # noqa: E402
+
+class OnedirBundleTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.install = Path(tmp.name) / 'cybershield-agent'
+        self.exe = self.install / 'cybershield-agent'
+
+    def frozen(self, meipass: Path):
+        return mock.patch.multiple(sys, frozen=True, _MEIPASS=str(meipass), executable=str(self.exe), create=True)
+
+    def test_detects_onedir_layouts(self):
+        for meipass in (self.install / '_internal', self.install):
+            with self.subTest(meipass=meipass.name), self.frozen(meipass):
+                self.assertTrue(AutoUpdater._is_onedir_bundle())
+
+    def test_onefile_extracts_elsewhere(self):
+        with self.frozen(Path(tempfile.gettempdir()) / '_MEI12345'):
+            self.assertFalse(AutoUpdater._is_onedir_bundle())
+        self.assertFalse(AutoUpdater._is_onedir_bundle())
+
+    def test_onedir_skips_update_check(self):
+        with self.frozen(self.install / '_internal'):
+            updater = AutoUpdater(mock.Mock(), mock.Mock(), argv=[])
+        with mock.patch.object(updater, 'check_for_updates') as check:
+            self.assertFalse(updater.update_if_available())
+        check.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Outbox: falhas de rede não consomem as tentativas de um ACK
+"""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Event
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config import AgentConfig  # noqa: E402
+from outbox import MAX_ATTEMPTS, PRIORITY_ACK, Outbox  # noqa: E402
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return {}
+
+class FailingTransport:
+    """Servidor inacessível até `online` ser definido"""
+
+    def __init__(self):
+        self.online = False
+        self.calls = 0
+
+    def post(self, function, body, **kwargs):
+        self.calls += 1
+        if not self.online:
+            raise ConnectionError("servidor inacessível")
+        return FakeResponse(200)
+
+class OutboxReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        config = AgentConfig(
+            agent_name='agent-test', agent_token='t' * 32, hmac_secret='ab' * 32,
+            server_url='http://stand-in', supabase_anon_key='anon', data_dir=tmp.name
+        )
+        self.transport = FailingTransport()
+        self.outbox = Outbox(config, self.transport, Event())
+        self.outbox.open()
+        self.addCleanup(self.outbox.close)
+
+    def test_ack_survives_long_outage(self):
+        row_id = self.outbox.put('ack-job/1', {'status': 'done'}, PRIORITY_ACK, key='ack:1')
+        self.outbox.release(row_id)
+
+        for _ in range(MAX_ATTEMPTS * 2):
+            self.assertIsNone(self.outbox.replay())
+        self.assertEqual(self.transport.calls, MAX_ATTEMPTS * 2)
+        self.assertEqual(self.outbox.pending_count(), 1)
+        self.assertEqual(self.outbox.dropped, 0)
+
+        self.transport.online = True
+        self.assertEqual(self.outbox.replay(), 1)
+        self.assertEqual(self.outbox.pending_count(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
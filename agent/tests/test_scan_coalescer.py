@@ -0,0 +1,84 @@
+"""
+Lotes do scan-virus: itens 'pending' retidos por backoff até o veredito
+"""
+import sys
+import json
+import time
+import unittest
+from pathlib import Path
+from threading import Event, Lock
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import scan_coalescer  # noqa: E402
+from config import AgentConfig  # noqa: E402
+from scan_client import ScanClient  # noqa: E402
+from scan_coalescer import ScanCoalescer  # noqa: E402
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self.text = json.dumps(data)
+        self._data = data
+
+    def json(self):
+        return self._data
+
+class LimitedLookupTransport:
+    """scan-virus que resolve no máximo `per_batch` hashes por lote"""
+
+    def __init__(self, per_batch: int):
+        self.per_batch = per_batch
+        self.sent = []  # (instante, hashes do lote)
+        self._lock = Lock()
+
+    def post(self, function, body, **kwargs):
+        items = json.loads(body)['items']
+        with self._lock:
+            self.sent.append((time.monotonic(), [item['fileHash'] for item in items]))
+        results = []
+        for i, item in enumerate(items):
+            status = 'ok' if i < self.per_batch else 'pending'
+            results.append({'filePath': item['filePath'], 'fileHash': item['fileHash'], 'status': status,
+                            'isMalicious': False, 'positives': 0, 'totalScans': 60})
+        return FakeResponse({'results': results})
+
+class ScanCoalescerPendingTest(unittest.TestCase):
+
+    def coalescer(self, per_batch: int):
+        config = AgentConfig(
+            agent_name='agent-test', agent_token='t' * 32, hmac_secret='ab' * 32,
+            server_url='http://stand-in', supabase_anon_key='anon',
+            scan_batch_max_delay=0.05, scan_batch_in_flight=1
+        )
+        transport = LimitedLookupTransport(per_batch)
+        client = ScanClient(config, transport)
+        return ScanCoalescer(config, client, Event()), client, transport
+
+    @mock.patch.object(scan_coalescer, 'PENDING_RETRY_MIN', 0.2)
+    def test_pending_items_wait_and_resolve(self):
+        coalescer, client, transport = self.coalescer(per_batch=4)
+        hashes = [f"{i:064x}" for i in range(30)]
+        for h in hashes:
+            coalescer.submit(f"/data/{h[-4:]}.bin", h)
+        coalescer.close()
+
+        # Mais lotes que MAX_STALLED_ROUNDS: nenhum hash é adiado enquanto há progresso
+        self.assertGreater(len(transport.sent), scan_coalescer.MAX_STALLED_ROUNDS)
+        self.assertEqual(client.submitted, len(hashes))
+        self.assertEqual(client.deferred, 0)
+        resent = [b[0] - a[0] for a, b in zip(transport.sent, transport.sent[1:])]
+        self.assertGreaterEqual(min(resent), 0.2)
+
+    @mock.patch.object(scan_coalescer, 'PENDING_RETRY_MIN', 0.02)
+    def test_no_progress_defers(self):
+        coalescer, client, transport = self.coalescer(per_batch=0)
+        coalescer.submit("/data/a.bin", "a" * 64)
+        coalescer.close()
+
+        self.assertEqual(len(transport.sent), scan_coalescer.MAX_STALLED_ROUNDS)
+        self.assertEqual(client.submitted, 0)
+        self.assertEqual(client.deferred, 1)
+
+if __name__ == "__main__":
+    unittest.main()
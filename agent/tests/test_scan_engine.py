@@ -0,0 +1,62 @@
+"""
+Walker do scan: listagem paralela, raízes symlink e loops de diretório
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Event
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from scan_engine import ScanSpec, ScanStats, walk_files  # noqa: E402
+
+@unittest.skipIf(sys.platform == 'win32', "symlinks exigem privilégio no Windows")
+class WalkFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base = Path(os.path.realpath(tmp.name))
+        self.tree = self.base / "tree"
+        for d in range(12):
+            for f in range(5):
+                path = self.tree / f"d{d}" / "sub" / f"f{f}.bin"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(b"x" * (d + f))
+        (self.tree / "top.txt").write_text("top")
+        self.expected = {str(p) for p in self.tree.rglob("*") if p.is_file()}
+
+    def walk(self, roots, **kwargs):
+        stats = ScanStats()
+        paths = [entry.path for entry in walk_files(ScanSpec(roots=roots, **kwargs), stats, Event())]
+        return paths, stats
+
+    def test_walks_every_file_once(self):
+        paths, stats = self.walk([str(self.tree)])
+        self.assertEqual(len(paths), len(self.expected))
+        self.assertEqual(set(paths), self.expected)
+        self.assertEqual(stats.files_seen, len(self.expected))
+        self.assertEqual(stats.errors, 0)
+
+    def test_symlink_root_is_resolved(self):
+        link = self.base / "link"
+        link.symlink_to(self.tree, target_is_directory=True)
+        paths, _ = self.walk([str(link)])
+        self.assertEqual(set(paths), self.expected)
+
+    def test_nested_symlinks_are_not_followed(self):
+        (self.tree / "d0" / "loop").symlink_to(self.tree, target_is_directory=True)
+        paths, _ = self.walk([str(self.tree)])
+        self.assertEqual(set(paths), self.expected)
+
+    def test_overlapping_roots_visit_directories_once(self):
+        paths, _ = self.walk([str(self.tree), str(self.tree / "d3")])
+        self.assertEqual(len(paths), len(self.expected))
+
+    def test_excluded_directories_are_skipped(self):
+        paths, _ = self.walk([str(self.tree)], exclude=["sub"])
+        self.assertEqual(paths, [str(self.tree / "top.txt")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Cache de updates: renovação do lock por tempo e liberação só pelo dono
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import update_cache  # noqa: E402
+from update_cache import ArtifactCache, LOCK_REFRESH_SECONDS  # noqa: E402
+
+SHA256 = "ab" * 32
+
+class ArtifactCacheLockTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = ArtifactCache(Path(tmp.name))
+
+    def test_release_keeps_lock_taken_over_by_another_agent(self):
+        lock = self.cache.claim(SHA256)
+        self.assertIsNotNone(lock)
+        # Lock tomado como abandonado e reivindicado por outro host
+        lock.write_text("outro-host 4242\n")
+        self.cache.release(lock)
+        self.assertTrue(lock.exists())
+
+    def test_release_removes_own_lock(self):
+        lock = self.cache.claim(SHA256)
+        self.cache.release(lock)
+        self.assertFalse(lock.exists())
+
+    def test_touch_refreshes_on_time_basis(self):
+        lock = self.cache.claim(SHA256)
+        os.utime(lock, (0, 0))
+        with mock.patch.object(update_cache.time, 'monotonic') as monotonic:
+            start = self.cache._touched[lock]
+            monotonic.return_value = start + 1
+            self.cache.touch(lock)
+            self.assertEqual(lock.stat().st_mtime, 0)
+
+            monotonic.return_value = start + LOCK_REFRESH_SECONDS
+            self.cache.touch(lock)
+            self.assertGreater(lock.stat().st_mtime, 0)
+
+if __name__ == "__main__":
+    unittest.main()
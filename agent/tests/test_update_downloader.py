@@ -0,0 +1,76 @@
+"""
+Download segmentado: SHA256 do prefixo contíguo com segmentos fora de ordem
+"""
+import sys
+import time
+import hashlib
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from update_downloader import UpdateDownloader, DOWNLOAD_CHUNK_SIZE  # noqa: E402
+
+class FakeRangeResponse:
+    """Resposta 206 entregue em pedaços, com atraso por pedaço"""
+
+    def __init__(self, data: bytes, start: int, end: int, delay: float):
+        self.status_code = 206
+        self.headers = {'Content-Range': f"bytes {start}-{end}/{len(data)}", 'ETag': '"v1"'}
+        self._body = data[start:end + 1]
+        self._delay = delay
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self._body), chunk_size):
+            time.sleep(self._delay)
+            yield self._body[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeRangeTransport:
+    """Servidor com Range em que o primeiro segmento termina bem antes dos demais"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def download(self, url, timeout=None, headers=None):
+        start, _, end = headers['Range'][len('bytes='):].partition('-')
+        start, end = int(start), int(end)
+        # Demais segmentos lentos: o hash alcança o meio deles (offset não
+        # alinhado ao bloco) em várias passagens, com o resto ainda zerado
+        delay = 0.0 if start == 0 else 0.25
+        return FakeRangeResponse(self.data, start, end, delay)
+
+class SegmentedDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.data = hashlib.sha256(b'seed').digest() * ((10 * 1024 * 1024 + 12345) // 32 + 1)
+        self.data = self.data[:10 * 1024 * 1024 + 12345]
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def fetch(self, segments: int) -> bytes:
+        downloader = UpdateDownloader(
+            FakeRangeTransport(self.data),
+            Path(self.tmp.name) / f"seg{segments}",
+            segments=segments
+        )
+        path = downloader.fetch('http://stand-in/agent', self.sha256, len(self.data), 'agent.bin')
+        return path.read_bytes()
+
+    def test_segments_complete_out_of_order(self):
+        self.assertGreater(len(self.data), 4 * DOWNLOAD_CHUNK_SIZE)
+        for segments in (2, 3, 4):
+            with self.subTest(segments=segments):
+                self.assertEqual(self.fetch(segments), self.data)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Cache de vereditos: gravação concorrente, nova tentativa após falha e
+arquivo persistido com formato inesperado
+"""
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import verdict_cache  # noqa: E402
+from verdict_cache import VerdictCache  # noqa: E402
+
+TTLS = {'clean': 3600, 'malicious': 3600, 'unknown': 600}
+
+class VerdictCacheSaveTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.path = self.dir / 'verdicts.json'
+
+    def cache(self) -> VerdictCache:
+        return VerdictCache(1000, TTLS, str(self.path))
+
+    def test_failed_write_is_retried(self):
+        cache = self.cache()
+        cache.put('a' * 64, {'isMalicious': False, 'positives': 0})
+        with mock.patch.object(verdict_cache.os, 'replace', side_effect=OSError("disco cheio")):
+            cache.save()
+        self.assertFalse(self.path.exists())
+
+        cache.save()
+        reloaded = self.cache()
+        reloaded.load()
+        self.assertIsNotNone(reloaded.get('a' * 64))
+        self.assertEqual([p.name for p in self.dir.iterdir()], ['verdicts.json'])
+
+    def test_concurrent_saves_leave_a_valid_file(self):
+        cache = self.cache()
+        errors = []
+
+        def writer(n: int):
+            try:
+                for i in range(50):
+                    cache.put(f"{n:02x}{i:062x}", {'isMalicious': False, 'positives': 0})
+                    cache.save()
+            except Exception as e:  # pragma: no cover - falha do teste
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        cache.save()
+
+        self.assertEqual(errors, [])
+        reloaded = self.cache()
+        reloaded.load()
+        self.assertEqual(len(reloaded), 200)
+
+    def test_load_skips_malformed_entries(self):
+        good = ['b' * 64, 4102444800, {'isMalicious': True}]
+        self.path.write_text(json.dumps({'version': 1, 'entries': [good, ['x'], 'y', ['c' * 64, 'z', {}]]}))
+        cache = self.cache()
+        cache.load()
+        self.assertEqual(len(cache), 1)
+
+        self.path.write_text(json.dumps(['not', 'a', 'dict']))
+        cache = self.cache()
+        cache.load()
+        self.assertEqual(len(cache), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark de assinatura HMAC: generate_hmac_headers x Signer pré-chaveado
+
+Uso (a partir do diretório agent/):
+    python tools/bench_hmac.py --count 50000
+    python tools/bench_hmac.py --body-size 1048576 --count 200
+
+Mede bodies pequenos (heartbeat/ACK), o custo por requisição e, para bodies
+grandes, a assinatura em pedaços (sign_chunks) sem montar o body como str.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from hmac_utils import Signer, generate_hmac_headers  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+REPEAT = 5
+
+def timed(label: str, count: int, fn) -> float:
+    """Melhor de REPEAT rodadas (menos sensível a ruído da máquina)"""
+    elapsed = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{label:>28}: {count / elapsed:>10,.0f} assinaturas/s ({elapsed / count * 1e6:7.1f} µs cada)")
+    return elapsed
+
+def peak_memory(fn) -> int:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de assinatura HMAC")
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--body-size', type=int, default=0, help='Tamanho do body grande (bytes); 0 = só bodies pequenos')
+    args = parser.parse_args()
+
+    secret = os.urandom(32).hex()
+    signer = Signer(secret)
+    small = json.dumps({"os_type": "Linux", "os_version": "#1 SMP", "hostname": "bench-host"})
+
+    print(f"Body pequeno ({len(small)} bytes):")
+    base = timed("generate_hmac_headers", args.count, lambda: generate_hmac_headers(secret, small))
+    small_bytes = small.encode('utf-8')
+    fast = timed("Signer.sign", args.count, lambda: signer.sign(small_bytes))
+    print(f"{'speedup':>28}: {base / fast:.2f}x")
+
+    if args.body_size:
+        data = os.urandom(args.body_size)
+        text = data.hex()[:args.body_size]  # generate_hmac_headers exige str
+        chunks = [text.encode()[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+        count = max(1, args.count // 1000)
+
+        print(f"\nBody grande ({args.body_size:,} bytes, {count} assinaturas):")
+        base = timed("generate_hmac_headers", count, lambda: generate_hmac_headers(secret, text))
+        fast = timed("Signer.sign_chunks", count, lambda: signer.sign_chunks(iter(chunks)))
+        print(f"{'speedup':>28}: {base / fast:.2f}x")
+
+        # Memória extra por assinatura (o body em si já existe nos dois casos)
+        extra_base = peak_memory(lambda: generate_hmac_headers(secret, text))
+        extra_fast = peak_memory(lambda: signer.sign_chunks(iter(chunks)))
+        print(f"{'pico de memória':>28}: {extra_base / 1024:,.0f} KiB x {extra_fast / 1024:,.0f} KiB")
+
+if __name__ == "__main__":
+    main()
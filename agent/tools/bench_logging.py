@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark de logging: escrita síncrona x fila (QueueHandler) com disco lento
+
+Uso (a partir do diretório agent/):
+    python tools/bench_logging.py --disk-latency-ms 5 --count 2000
+
+Mede a latência de cada chamada logger.info() na thread que loga (a do
+heartbeat/poller no agente), com um handler que simula um disco lento
+(sleep por registro gravado). Com a fila, a chamada só enfileira; com a
+política "drop" e a fila cheia, registros DEBUG/INFO são descartados em
+vez de segurar a thread.
+"""
+import sys
+import time
+import queue
+import logging
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from logger_config import LOG_FORMAT, DATE_FORMAT, AgentQueueHandler, AgentQueueListener  # noqa: E402
+
+class SlowFileHandler(logging.FileHandler):
+    """FileHandler com latência artificial por registro (disco lento, rotação)"""
+
+    def __init__(self, path: str, latency: float):
+        super().__init__(path, encoding='utf-8')
+        self.latency = latency
+
+    def emit(self, record):
+        time.sleep(self.latency)
+        super().emit(record)
+
+def run(mode: str, args, log_dir: Path) -> None:
+    handler = SlowFileHandler(str(log_dir / f"{mode}.log"), args.disk_latency_ms / 1000)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    logger = logging.getLogger(f"bench.{mode}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    listener = None
+    if mode == 'sync':
+        logger.addHandler(handler)
+    else:
+        queue_handler = AgentQueueHandler(queue.Queue(maxsize=args.queue_size), block=(mode == 'block'))
+        listener = AgentQueueListener(queue_handler.queue, handler)
+        listener.start()
+        logger.addHandler(queue_handler)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.count):
+        t0 = time.perf_counter()
+        logger.info("💓 Heartbeat %d enviado (%s)", i, "bench")
+        latencies.append(time.perf_counter() - t0)
+        if args.interval_ms:
+            time.sleep(args.interval_ms / 1000)
+    caller = time.perf_counter() - start
+
+    if listener:
+        listener.stop()
+    logger.handlers.clear()
+    handler.close()
+    written = sum(1 for _ in open(log_dir / f"{mode}.log", encoding='utf-8'))
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    dropped = f", {queue_handler.dropped_total} descartados" if listener else ""
+    print(
+        f"{mode:>6}: thread que loga {caller:6.2f}s | por chamada mediana "
+        f"{statistics.median(latencies) * 1e6:8.1f} µs, p99 {p99 * 1e6:8.1f} µs, "
+        f"máx {latencies[-1] * 1e3:6.1f} ms | {written} gravados{dropped}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de logging síncrono x fila")
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--disk-latency-ms', type=float, default=5.0)
+    parser.add_argument('--interval-ms', type=float, default=0.0,
+                        help='Pausa entre chamadas (0 = rajada)')
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--mode', choices=['sync', 'drop', 'block', 'all'], default='all')
+    args = parser.parse_args()
+
+    modes = ['sync', 'drop', 'block'] if args.mode == 'all' else [args.mode]
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in modes:
+            run(mode, args, Path(tmp))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark de envio de hashes ao scan-virus: um request por hash x lotes
+
+Uso (a partir do diretório agent/, com o stand-in rodando):
+    python tools/stand_in_server.py --hmac-secret <64 hex> --latency-ms 20
+    python tools/bench_scan_submit.py --hmac-secret <64 hex> --count 5000
+"""
+import sys
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from threading import Event
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config import AgentConfig  # noqa: E402
+from http_transport import AgentTransport  # noqa: E402
+from scan_client import ScanClient  # noqa: E402
+from scan_coalescer import ScanCoalescer  # noqa: E402
+
+def fake_hashes(count: int, seed: str):
+    for i in range(count):
+        yield f"/bench/{seed}/file-{i}.bin", hashlib.sha256(f"{seed}:{i}".encode()).hexdigest()
+
+def run(mode: str, config: AgentConfig, count: int) -> float:
+    transport = AgentTransport(config)
+    client = ScanClient(config, transport)  # sem cache: mede só a rede
+    start = time.perf_counter()
+
+    if mode == 'single':
+        for path, digest in fake_hashes(count, f"{mode}-{start}"):
+            client.check(path, digest)
+    else:
+        coalescer = ScanCoalescer(config, client, Event())
+        for path, digest in fake_hashes(count, f"{mode}-{start}"):
+            coalescer.submit(path, digest)
+        coalescer.close()
+
+    elapsed = time.perf_counter() - start
+    requests = transport.stats()['requests']
+    transport.close()
+    print(
+        f"{mode:>6}: {count} hashes em {elapsed:.2f}s = {count / elapsed:,.0f} hashes/s "
+        f"({requests} requests, {client.submitted} vereditos, {client.deferred} adiados)"
+    )
+    return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de envio ao scan-virus")
+    parser.add_argument('--server', default='http://127.0.0.1:8787')
+    parser.add_argument('--hmac-secret', required=True)
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--mode', choices=['single', 'batch', 'both'], default='both')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--in-flight', type=int, default=2)
+    args = parser.parse_args()
+
+    config = AgentConfig(
+        agent_name='bench',
+        agent_token='bench-token',
+        hmac_secret=args.hmac_secret,
+        server_url=args.server,
+        supabase_anon_key='bench',
+        scan_batch_max_items=args.batch_size,
+        scan_batch_in_flight=args.in_flight,
+        verdict_cache_size=0
+    )
+
+    modes = ['single', 'batch'] if args.mode == 'both' else [args.mode]
+    rates = {mode: run(mode, config, args.count) for mode in modes}
+    if len(rates) == 2:
+        print(f"speedup: {rates['batch'] / rates['single']:.1f}x")
+
+if __name__ == "__main__":
+    main()
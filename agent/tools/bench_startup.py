@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inicialização: tempo até o primeiro heartbeat aceito
+
+Uso (a partir do diretório agent/, com o stand-in rodando):
+    python tools/stand_in_server.py --hmac-secret <64 hex>
+    python tools/bench_startup.py --hmac-secret <64 hex> --runs 10
+    python tools/bench_startup.py --hmac-secret <64 hex> \\
+        --cmd "python main.py" --cmd "dist/cybershield-agent" \\
+        --cmd "dist/cybershield-agent/cybershield-agent"
+
+Cada comando é executado com --startup-profile (o agente sai após o
+primeiro heartbeat). O tempo é medido de fora, do spawn até o relatório
+chegar no stdout, e inclui o que o perfil interno não vê: carga do
+interpretador e, no build onefile, a extração do bundle. "--version" mede
+só a inicialização do processo (sem rede).
+"""
+import sys
+import json
+import time
+import shlex
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+
+def run_version(cmd: List[str], workdir: Path) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd + ['--version'], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def run_profile(cmd: List[str], workdir: Path, runtime: str, timeout: float) -> Optional[Dict]:
+    """Executa o agente com --startup-profile; None se não houve heartbeat"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd + ['--config', 'agent_config.json', '--runtime', runtime, '--startup-profile', '--log-level', 'WARNING'],
+        cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    report = None
+    try:
+        for line in proc.stdout:
+            if line.startswith('{'):
+                report = json.loads(line)
+                report['wall_ms'] = (time.perf_counter() - start) * 1000
+                break
+        proc.wait(timeout=timeout)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    if report is None or report.get('first_heartbeat_ms') is None:
+        return None
+    return report
+
+def summary(values: List[float]) -> str:
+    return f"{statistics.median(values):7.0f} ms (min {min(values):.0f}, max {max(values):.0f})"
+
+def bench(label: str, cmd: List[str], workdir: Path, args) -> None:
+    # Uma execução de aquecimento: cache de disco e pycs compilados
+    run_version(cmd, workdir)
+    versions = [run_version(cmd, workdir) * 1000 for _ in range(args.runs)]
+
+    reports = []
+    for _ in range(args.runs):
+        report = run_profile(cmd, workdir, args.runtime, args.timeout)
+        if report is None:
+            sys.exit(f"❌ {label}: nenhum heartbeat aceito (stand-in rodando? --hmac-secret confere?)")
+        reports.append(report)
+
+    print(f"\n{label} ({args.runs} execuções, runtime {args.runtime})")
+    print(f"  --version:                 {summary(versions)}")
+    print(f"  spawn → 1º heartbeat:      {summary([r['wall_ms'] for r in reports])}")
+    print(f"  main.py → 1º heartbeat:    {summary([r['first_heartbeat_ms'] for r in reports])}")
+    print(f"  imports:                   {summary([r['imports_ms'] for r in reports])} "
+          f"({reports[-1]['modules']} módulos)")
+    slowest = ", ".join(f"{e['module']} {e['cumulative_ms']:.0f}" for e in reports[-1]['top_imports'][:5])
+    print(f"  imports mais lentos (ms):  {slowest}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização do agente")
+    parser.add_argument('--server', default='http://127.0.0.1:8787')
+    parser.add_argument('--hmac-secret', required=True)
+    parser.add_argument('--cmd', action='append',
+                        help='Comando que inicia o agente (repetível; padrão: python main.py)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    commands = args.cmd or [f"{shlex.quote(sys.executable)} main.py"]
+    # O agente roda em um diretório temporário (logs/ e data/ não vão para agent/)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        (workdir / 'agent_config.json').write_text(json.dumps({
+            'agent_name': 'bench-startup',
+            'agent_token': 'bench-token',
+            'hmac_secret': args.hmac_secret,
+            'server_url': args.server,
+            'supabase_anon_key': 'bench',
+        }))
+        for command in commands:
+            # Caminhos relativos ao diretório agent/ (como nos exemplos de uso)
+            cmd = [str(AGENT_DIR / part) if (AGENT_DIR / part).exists() else part for part in shlex.split(command)]
+            bench(command, cmd, workdir, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Gera patches csdelta1 entre executáveis do agente (ver delta_patch.py)
+
+Uso (a partir do diretório agent/):
+    python tools/make_update_patch.py --to dist/cybershield-agent \\
+        --from releases/1.1.0/cybershield-agent --from releases/1.0.0/cybershield-agent \\
+        --out-dir patches/
+
+Para cada --from é gravado <sha256 da origem>.csdelta e impressa a linha
+para a tabela agent_version_patches (from_sha256, sha256, size_bytes).
+O patch é validado aplicando-o antes de ser publicado.
+
+Algoritmo no estilo rsync: os blocos alinhados da origem são indexados
+pelo adler32 e o alvo é percorrido com o adler32 "rolante"; blocos iguais
+viram cópias (estendidas até onde os bytes coincidirem), o resto inserções.
+"""
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from delta_patch import PATCH_FORMAT, PatchWriter, apply_patch  # noqa: E402
+
+BLOCK_SIZE = 2048
+ADLER_MOD = 65521
+# Candidatos por hash fraco (blocos repetidos, ex: padding, não ajudam)
+MAX_CANDIDATES = 8
+
+def match_length(source: bytes, s: int, target: bytes, t: int, known: int) -> int:
+    """Tamanho do trecho igual a partir de source[s] e target[t] (>= known)"""
+    length = known
+    step = 64 * 1024
+    limit = min(len(source) - s, len(target) - t)
+    while step:
+        while length + step <= limit and source[s + length:s + length + step] == target[t + length:t + length + step]:
+            length += step
+        step //= 2
+    return length
+
+def diff(source: bytes, target: bytes, writer: PatchWriter, block: int = BLOCK_SIZE):
+    index = {}
+    for offset in range(0, len(source) - block + 1, block):
+        candidates = index.setdefault(zlib.adler32(source[offset:offset + block]), [])
+        if len(candidates) < MAX_CANDIDATES:
+            candidates.append(offset)
+
+    n = len(target)
+    literal = 0  # início dos bytes ainda não emitidos
+    p = 0
+    if n >= block:
+        weak = zlib.adler32(target[0:block])
+        a, b = weak & 0xFFFF, weak >> 16
+        while True:
+            candidates = index.get((b << 16) | a)
+            if candidates:
+                window = target[p:p + block]
+                match = next((off for off in candidates if source[off:off + block] == window), None)
+                if match is not None:
+                    length = match_length(source, match, target, p, block)
+                    if literal < p:
+                        writer.insert(target[literal:p])
+                    writer.copy(match, length)
+                    p += length
+                    literal = p
+                    if p + block > n:
+                        break
+                    weak = zlib.adler32(target[p:p + block])
+                    a, b = weak & 0xFFFF, weak >> 16
+                    continue
+            if p + block >= n:
+                break
+            out, new = target[p], target[p + block]
+            a = (a - out + new) % ADLER_MOD
+            b = (b - block * out + a - 1) % ADLER_MOD
+            p += 1
+    if literal < n:
+        writer.insert(target[literal:n])
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera patches csdelta1 do executável do agente")
+    parser.add_argument('--to', required=True, type=Path, help='Executável novo')
+    parser.add_argument('--from', dest='sources', required=True, action='append', type=Path,
+                        help='Executável instalado (repetível)')
+    parser.add_argument('--out-dir', type=Path, default=Path('.'))
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+
+    target = args.to.read_bytes()
+    target_sha256 = hashlib.sha256(target).hexdigest()
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+
+    for source_path in args.sources:
+        source = source_path.read_bytes()
+        source_sha256 = hashlib.sha256(source).hexdigest()
+        patch_path = args.out_dir / f"{source_sha256}.csdelta"
+
+        started = time.perf_counter()
+        with open(patch_path, 'wb') as f:
+            writer = PatchWriter(f, len(target), source_sha256)
+            diff(source, target, writer, args.block_size)
+            writer.close()
+        elapsed = time.perf_counter() - started
+
+        # Nunca publicar um patch que não reproduz o alvo
+        with tempfile.TemporaryDirectory() as tmp:
+            digest, _ = apply_patch(source_path, patch_path, Path(tmp) / 'check')
+        if digest != target_sha256:
+            patch_path.unlink()
+            sys.exit(f"❌ {source_path}: patch não reproduz o alvo")
+
+        patch_bytes = patch_path.read_bytes()
+        size = len(patch_bytes)
+        print(
+            f"✅ {source_path} → {patch_path}: {size / 1024:,.0f} KiB "
+            f"({size / len(target) * 100:.1f}% do executável; copiado {writer.copied / 1024:,.0f} KiB, "
+            f"inserido {writer.inserted / 1024:,.0f} KiB) em {elapsed:.1f}s",
+            file=sys.stderr
+        )
+        print(json.dumps({
+            'from_sha256': source_sha256,
+            'to_sha256': target_sha256,
+            'format': PATCH_FORMAT,
+            'sha256': hashlib.sha256(patch_bytes).hexdigest(),
+            'size_bytes': size,
+            'file': patch_path.name,
+        }))
+
+if __name__ == "__main__":
+    main()
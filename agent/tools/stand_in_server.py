@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Servidor local que simula as Edge Functions usadas pelo agente
+
+Uso (a partir do diretório agent/):
+    python tools/stand_in_server.py --port 8787 --hmac-secret <64 hex>
+
+Configure o agente com "server_url": "http://127.0.0.1:8787" e o mesmo
+hmac_secret. Jobs são enfileirados via:
+    curl -X POST http://127.0.0.1:8787/__admin/jobs -d '{"count": 10, "type": "custom"}'
+
+Com --release <executável> --release-version X.Y.Z o check-agent-updates
+anuncia a versão, servida em /__files/ (com suporte a Range). Patches de
+tools/make_update_patch.py em --patch-dir são anunciados quando o
+current_sha256 do agente tiver um <sha256>.csdelta correspondente.
+"""
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from hmac_utils import Signer  # noqa: E402
+from compression import SUPPORTED_ENCODINGS, UNSUPPORTED_ENCODING_CODE, decompress  # noqa: E402
+
+DEFAULT_BATCH_LIMIT = 3
+MAX_BATCH_LIMIT = 25
+MAX_LONG_POLL_SECONDS = 25
+MAX_SCAN_BATCH_ITEMS = 100
+
+# Funções que aceitam body comprimido (anunciado via Accept-Encoding, como no servidor)
+COMPRESSED_FUNCTIONS = {'submit-system-metrics', 'scan-virus', 'upload-report', 'diagnostics-agent-logs'}
+
+# Janela aceita para X-Timestamp (como no _shared/hmac.ts)
+MAX_TIMESTAMP_SKEW_MS = 5 * 60 * 1000
+
+# SHA256 do arquivo de teste EICAR (único hash "malicioso" do stand-in)
+EICAR_SHA256 = '275a021bbfb6489e54d471899f7db9d1663fc695ec2fe2a2c4538aabf651fd0f'
+
+class StandInState:
+    """Estado compartilhado entre as requisições"""
+
+    def __init__(
+        self,
+        hmac_secret: str,
+        long_poll: bool,
+        latency: float = 0.0,
+        clock_offset: float = 0.0,
+        accept_encoding: str = '',
+        release: Path = None,
+        release_version: str = None,
+        patch_dir: Path = None
+    ):
+        self.signer = Signer(hmac_secret)
+        self.long_poll = long_poll
+        self.latency = latency
+        # Relógio do "servidor" deslocado do relógio local (teste de clock skew)
+        self.clock_offset = clock_offset
+        self.cond = threading.Condition()
+        self.queued = deque()
+        self.delivered = {}
+        self.acked = set()
+        self.requests = Counter()
+        self.accept_encoding = accept_encoding
+        # Bytes por função: recebidos na rede x body decodificado
+        self.bytes_wire = Counter()
+        self.bytes_body = Counter()
+        self.os_info_hash = None
+        self.last_metrics = None
+        self.last_log_batch = None
+        # Atualização anunciada no check-agent-updates (arquivos servidos em /__files/)
+        self.release = release
+        self.release_version = release_version
+        self.release_sha256 = hashlib.sha256(release.read_bytes()).hexdigest() if release else None
+        self.patch_dir = patch_dir
+        self.files = {release.name: release} if release else {}
+
+    def enqueue(self, count: int, job_type: str, payload: dict):
+        with self.cond:
+            for _ in range(count):
+                self.queued.append({
+                    'id': str(uuid.uuid4()),
+                    'type': job_type,
+                    'payload': payload,
+                    'approved': True,
+                })
+            self.cond.notify_all()
+
+    def take(self, limit: int, wait: float) -> list:
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while not self.queued and time.monotonic() < deadline:
+                self.cond.wait(timeout=deadline - time.monotonic())
+            jobs = [self.queued.popleft() for _ in range(min(limit, len(self.queued)))]
+            for job in jobs:
+                self.delivered[job['id']] = job
+            return jobs
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers e body saem em writes separados
+    state: StandInState = None
+    _function: str = None  # Edge Function da requisição atual
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def date_time_string(self, timestamp=None):
+        # Header Date segundo o relógio (deslocado) do stand-in
+        return formatdate(time.time() + self.state.clock_offset, usegmt=True)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status: int, data, headers: dict = None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if self.state.accept_encoding and self._function in COMPRESSED_FUNCTIONS:
+            self.send_header('Accept-Encoding', self.state.accept_encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authenticate(self, body: bytes) -> bool:
+        try:
+            timestamp = int(self.headers.get('X-Timestamp', ''))
+        except ValueError:
+            timestamp = 0
+        now_ms = (time.time() + self.state.clock_offset) * 1000
+        if abs(now_ms - timestamp) > MAX_TIMESTAMP_SKEW_MS:
+            self._reply(401, {
+                'error': 'unauthorized',
+                'code': 'AUTH_TIMESTAMP_OUT_OF_RANGE',
+                'message': f"Timestamp expirado (skew: {abs(now_ms - timestamp) / 1000:.1f}s, máx: 300s)",
+                'transient': True,
+            })
+            return False
+
+        valid = self.state.signer.verify(
+            self.headers.get('X-HMAC-Signature', ''),
+            self.headers.get('X-Timestamp', ''),
+            self.headers.get('X-Nonce', ''),
+            body
+        )
+        if not valid:
+            self._reply(401, {'error': 'unauthorized', 'code': 'AUTH_INVALID_SIGNATURE', 'transient': False})
+        return valid
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _decode_body(self, body: bytes):
+        """Body decodificado conforme o Content-Encoding (None = resposta de erro já enviada)"""
+        encoding = self.headers.get('Content-Encoding', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return body
+        accepted = {e.strip() for e in self.state.accept_encoding.split(',')}
+        if self._function not in COMPRESSED_FUNCTIONS or encoding not in accepted:
+            self._reply(415, {'error': 'unsupported_media_type', 'code': UNSUPPORTED_ENCODING_CODE})
+            return None
+        try:
+            return decompress(body, encoding)
+        except (OSError, ValueError, EOFError) as e:
+            self._reply(400, {'error': f'body {encoding} inválido: {e}'})
+            return None
+
+    def _dispatch(self, method: str):
+        self._function = None
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self._read_body()
+
+        if url.path.startswith('/__files/') and method == 'GET':
+            self._serve_file(url.path[len('/__files/'):])
+            return
+        if url.path == '/__admin/jobs' and method == 'POST':
+            spec = json.loads(body or b'{}')
+            self.state.enqueue(int(spec.get('count', 1)), spec.get('type', 'custom'), spec.get('payload', {}))
+            self._reply(200, {'ok': True, 'queued': len(self.state.queued)})
+            return
+        if url.path == '/__admin/stats':
+            self._reply(200, {
+                'requests': dict(self.state.requests),
+                'queued': len(self.state.queued),
+                'delivered': len(self.state.delivered),
+                'acked': len(self.state.acked),
+                'bytes_wire': dict(self.state.bytes_wire),
+                'bytes_body': dict(self.state.bytes_body),
+                'last_metrics': self.state.last_metrics,
+                'last_log_batch': self.state.last_log_batch,
+            })
+            return
+
+        prefix = '/functions/v1/'
+        if not url.path.startswith(prefix):
+            self._reply(404, {'error': 'not found'})
+            return
+        function, _, rest = url.path[len(prefix):].partition('/')
+        self._function = function
+        self.state.requests[function] += 1
+
+        # A assinatura cobre os bytes recebidos (comprimidos, se for o caso)
+        if not self._authenticate(body):
+            return
+        self.state.bytes_wire[function] += len(body)
+        body = self._decode_body(body)
+        if body is None:
+            return
+        self.state.bytes_body[function] += len(body)
+
+        handler = getattr(self, f"fn_{function.replace('-', '_')}", None)
+        if handler is None:
+            self._reply(404, {'error': f'função {function} não simulada'})
+            return
+        if self.state.latency:
+            # Custo fixo por request (replay check, rate limit, consultas ao banco)
+            time.sleep(self.state.latency)
+        handler(method, query, body, rest)
+
+    def fn_heartbeat(self, method, query, body, rest):
+        self._reply(200, {'ok': True, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())})
+
+    def fn_poll_jobs(self, method, query, body, rest):
+        limit = int(query.get('limit', [DEFAULT_BATCH_LIMIT])[0])
+        limit = max(1, min(limit, MAX_BATCH_LIMIT))
+        wait = 0
+        if self.state.long_poll:
+            wait = max(0, min(int(query.get('wait', [0])[0]), MAX_LONG_POLL_SECONDS))
+
+        # Heartbeat combinado (POST com {"heartbeat": {...}})
+        heartbeat = json.loads(body).get('heartbeat') if body else None
+        os_info_required = False
+        if heartbeat:
+            self.state.requests['combined-heartbeat'] += 1
+            if heartbeat.get('os_info'):
+                self.state.os_info_hash = heartbeat.get('os_info_hash')
+            elif heartbeat.get('os_info_hash') != self.state.os_info_hash:
+                os_info_required = True
+
+        jobs = self.state.take(limit, wait)
+        headers = {'X-Batch-Limit': str(limit)}
+        if self.state.long_poll:
+            headers['X-Long-Poll'] = str(wait)
+        if os_info_required:
+            headers['X-OS-Info-Required'] = '1'
+        self._reply(200, jobs, headers)
+
+    def fn_ack_job(self, method, query, body, rest):
+        job_id = rest or json.loads(body or b'{}').get('job_id')
+        if job_id not in self.state.delivered:
+            self._reply(404, {'error': 'Job não encontrado'})
+            return
+        self.state.acked.add(job_id)
+        self._reply(200, {'ok': True})
+
+    def fn_scan_virus(self, method, query, body, rest):
+        data = json.loads(body or b'{}')
+        if isinstance(data.get('items'), list):
+            items = data['items']
+            if not 1 <= len(items) <= MAX_SCAN_BATCH_ITEMS:
+                self._reply(400, {'error': f'items deve ter entre 1 e {MAX_SCAN_BATCH_ITEMS} entradas'})
+                return
+            self.state.requests['scan-virus-items'] += len(items)
+            self._reply(200, {'results': [self._scan_item(item) for item in items]})
+            return
+        if not data.get('filePath') or not data.get('fileHash'):
+            self._reply(400, {'error': 'filePath e fileHash são obrigatórios'})
+            return
+        if data['fileHash'] != EICAR_SHA256:
+            self._reply(404, {'error': 'Arquivo não encontrado em nenhum serviço de scan'})
+            return
+        self._reply(200, {'isMalicious': True, 'positives': 60, 'totalScans': 70, 'scannerUsed': 'stand-in'})
+
+    def _scan_item(self, item: dict) -> dict:
+        result = {'filePath': item.get('filePath'), 'fileHash': item.get('fileHash')}
+        if not item.get('filePath') or not item.get('fileHash'):
+            return {**result, 'status': 'invalid'}
+        if item['fileHash'] != EICAR_SHA256:
+            return {**result, 'status': 'unknown'}
+        return {**result, 'status': 'ok', 'isMalicious': True, 'positives': 60, 'totalScans': 70}
+
+    def fn_submit_system_metrics(self, method, query, body, rest):
+        metrics = json.loads(body or b'{}')
+        self.state.last_metrics = metrics
+        aggregates = metrics.get('aggregates') or {}
+        # Mesmo critério do servidor: p95 da janela quando houver agregados
+        alerts = sum(1 for key, limit in (('cpu_usage_percent', 90), ('memory_usage_percent', 85),
+                                          ('disk_usage_percent', 90))
+                     if (aggregates.get(key, {}).get('p95', metrics.get(key)) or 0) > limit)
+        self._reply(200, {'success': True, 'alerts_generated': alerts})
+
+    def fn_diagnostics_agent_logs(self, method, query, body, rest):
+        data = json.loads(body or b'{}')
+        logs = data.get('logs')
+        logs = logs if isinstance(logs, list) else [logs]
+        self.state.requests[f"diagnostics-agent-logs-{data.get('log_type')}"] += len(logs)
+        # Resumo do último lote (primeira/última linha para conferir a ordem)
+        self.state.last_log_batch = {
+            **{key: value for key, value in data.items() if key != 'logs'},
+            'lines': len(logs),
+            'first': logs[0] if logs else None,
+            'last': logs[-1] if logs else None,
+        }
+        self._reply(200, {'ok': True, 'message': 'Logs received'})
+
+    def fn_check_agent_updates(self, method, query, body, rest):
+        state = self.state
+        if not state.release:
+            self._reply(200, {'has_update': False, 'message': 'No updates available'})
+            return
+        base_url = f"http://{self.headers.get('Host')}/__files"
+        current = json.loads(body or b'{}').get('current_sha256')
+
+        patch = None
+        patch_file = state.patch_dir / f"{current}.csdelta" if state.patch_dir and current else None
+        if patch_file and patch_file.exists() and current != state.release_sha256:
+            data = patch_file.read_bytes()
+            state.files[patch_file.name] = patch_file
+            patch = {
+                'format': 'csdelta1',
+                'from_sha256': current,
+                'download_url': f"{base_url}/{patch_file.name}",
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'size_bytes': len(data),
+            }
+
+        self._reply(200, {
+            'has_update': True,
+            'version': state.release_version,
+            'platform': 'linux',
+            'sha256': state.release_sha256,
+            'size_bytes': state.release.stat().st_size,
+            'download_url': f"{base_url}/{state.release.name}",
+            'release_notes': 'stand-in',
+            'patch': patch,
+        })
+
+    def _serve_file(self, name: str):
+        """GET de um arquivo anunciado, com Range (bytes=N- ou N-M)"""
+        path = self.state.files.get(name)
+        if path is None:
+            self._reply(404, {'error': 'not found'})
+            return
+        data = path.read_bytes()
+        self.state.requests['__files'] += 1
+        start, end = 0, len(data) - 1
+        status = 200
+        spec = self.headers.get('Range', '')
+        if spec.startswith('bytes='):
+            first, _, last = spec[len('bytes='):].partition('-')
+            start = int(first)
+            end = min(int(last), end) if last else end
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(data)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{hashlib.sha256(data).hexdigest()[:16]}"')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in local das Edge Functions do CyberShield")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--hmac-secret', required=True, help='Mesmo hmac_secret do agent_config.json')
+    parser.add_argument('--no-long-poll', action='store_true', help='Simular servidor sem suporte a long-poll')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latência simulada por request (ms)')
+    parser.add_argument('--clock-offset', type=float, default=0,
+                        help='Deslocamento do relógio do servidor em segundos (simula clock skew do agente)')
+    parser.add_argument('--accept-encoding', default=', '.join(SUPPORTED_ENCODINGS),
+                        help="Codificações de body aceitas (ex: 'gzip'; vazio = sem compressão)")
+    parser.add_argument('--release', type=Path, help='Executável anunciado pelo check-agent-updates')
+    parser.add_argument('--release-version', default='99.0.0', help='Versão anunciada com --release')
+    parser.add_argument('--patch-dir', type=Path, help='Patches <sha256 da origem>.csdelta (tools/make_update_patch.py)')
+    args = parser.parse_args()
+
+    StandInHandler.state = StandInState(
+        args.hmac_secret,
+        long_poll=not args.no_long_poll,
+        latency=args.latency_ms / 1000,
+        clock_offset=args.clock_offset,
+        accept_encoding=args.accept_encoding,
+        release=args.release,
+        release_version=args.release_version,
+        patch_dir=args.patch_dir
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StandInHandler)
+    server.daemon_threads = True
+
+    print(f"🧪 Stand-in server em http://{args.host}:{args.port} (long-poll: {not args.no_long_poll})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = StandInHandler.state
+        print(f"📊 Requests por função: {dict(state.requests)}")
+        for function in sorted(state.bytes_wire):
+            wire, body = state.bytes_wire[function], state.bytes_body[function]
+            saved = (1 - wire / body) * 100 if body else 0.0
+            print(f"🗜️  {function}: {wire:,} bytes na rede / {body:,} bytes de body ({saved:.0f}% economia)")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
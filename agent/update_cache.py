@@ -0,0 +1,175 @@
+"""
+Cache compartilhado de artefatos de atualização (mesmo host ou LAN)
+
+Um diretório (local ou compartilhamento de rede) com os artefatos já
+verificados, nomeados pelo sha256. Quando uma release sai, o primeiro
+agente do site a reivindicar o artefato (<sha256>.lock) baixa da internet
+e publica no cache; os demais aguardam e copiam do cache. A cópia é
+sempre verificada contra o sha256: o cache é apenas uma fonte de bytes.
+
+Falhas de acesso ao diretório nunca impedem a atualização: o agente
+volta ao download direto.
+"""
+import os
+import time
+import uuid
+import shutil
+import socket
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+CHUNK_SIZE = 1024 * 1024
+# Lock sem renovação há mais tempo que isso é de um agente que morreu
+LOCK_STALE_SECONDS = 120
+# Intervalo de renovação do lock durante o download (por tempo, não por bytes:
+# em um uplink lento poucos MB levam mais que LOCK_STALE_SECONDS)
+LOCK_REFRESH_SECONDS = 30
+WAIT_POLL_SECONDS = 5
+# Artefatos mantidos no diretório (os mais recentes)
+MAX_ENTRIES = 6
+
+def _owner() -> str:
+    """Conteúdo do lock: identifica o agente que reivindicou o download"""
+    return f"{socket.gethostname()} {os.getpid()}\n"
+
+class ArtifactCache:
+    """Artefatos verificados por sha256, com reivindicação do download por lock"""
+
+    def __init__(self, directory: Path, max_wait: float = 600):
+        self.directory = directory
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+        self._touched: Dict[Path, float] = {}
+
+    def _entry(self, sha256: str) -> Path:
+        return self.directory / sha256.lower()
+
+    def _lock(self, sha256: str) -> Path:
+        return self.directory / f"{sha256.lower()}.lock"
+
+    def get(self, sha256: str, size: int, dest: Path) -> bool:
+        """Copia o artefato do cache para dest, verificando tamanho e sha256"""
+        entry = self._entry(sha256)
+        try:
+            if not entry.exists() or entry.stat().st_size != size:
+                return False
+            digest = hashlib.sha256()
+            tmp = dest.with_name(f"{dest.name}.cache")
+            with open(entry, 'rb') as src, open(tmp, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != sha256.lower():
+                tmp.unlink(missing_ok=True)
+                self.logger.warning(f"⚠️  Cache de updates: {entry.name} corrompido, removendo")
+                entry.unlink(missing_ok=True)
+                return False
+            os.replace(tmp, dest)
+            self.logger.info(f"📦 Artefato {sha256[:12]} obtido do cache ({self.directory})")
+            return True
+        except OSError as e:
+            self.logger.warning(f"⚠️  Cache de updates indisponível: {e}")
+            return False
+
+    def claim(self, sha256: str) -> Optional[Path]:
+        """
+        Reivindica o download do artefato para este agente
+
+        Returns:
+            Path do lock (liberar com release) ou None se outro agente já
+            está baixando
+        """
+        lock = self._lock(sha256)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if lock.exists() and time.time() - lock.stat().st_mtime > LOCK_STALE_SECONDS:
+                self.logger.info(f"🔓 Lock abandonado de {lock.name}, assumindo o download")
+                lock.unlink(missing_ok=True)
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        except OSError as e:
+            self.logger.warning(f"⚠️  Cache de updates indisponível: {e}")
+            return None
+        with os.fdopen(fd, 'w') as f:
+            f.write(_owner())
+        self._touched[lock] = time.monotonic()
+        return lock
+
+    def touch(self, lock: Path):
+        """
+        Renova o lock durante o download (evita que seja tomado como abandonado)
+
+        Pode ser chamado a cada pedaço recebido: o mtime só é atualizado a
+        cada LOCK_REFRESH_SECONDS.
+        """
+        now = time.monotonic()
+        if now - self._touched.get(lock, 0.0) < LOCK_REFRESH_SECONDS:
+            return
+        self._touched[lock] = now
+        try:
+            os.utime(lock)
+        except OSError:
+            pass
+
+    def release(self, lock: Path):
+        """Remove o lock, se ainda for deste agente (pode ter sido tomado como abandonado)"""
+        self._touched.pop(lock, None)
+        try:
+            if lock.read_text() != _owner():
+                self.logger.info(f"🔒 Lock {lock.name} assumido por outro agente, mantido")
+                return
+            lock.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def wait(self, sha256: str, size: int) -> bool:
+        """
+        Aguarda outro agente publicar o artefato
+
+        Returns:
+            True se o artefato apareceu; False se o lock sumiu/ficou
+            abandonado sem publicação ou max_wait expirou
+        """
+        entry, lock = self._entry(sha256), self._lock(sha256)
+        self.logger.info(f"⏳ Outro agente está baixando {sha256[:12]}, aguardando o cache (até {self.max_wait:.0f}s)")
+        deadline = time.monotonic() + self.max_wait
+        while time.monotonic() < deadline:
+            try:
+                if entry.exists() and entry.stat().st_size == size:
+                    return True
+                if not lock.exists() or time.time() - lock.stat().st_mtime > LOCK_STALE_SECONDS:
+                    return False
+            except OSError:
+                return False
+            time.sleep(WAIT_POLL_SECONDS)
+        return False
+
+    def put(self, path: Path, sha256: str):
+        """Publica um artefato já verificado (cópia atômica para o diretório)"""
+        entry = self._entry(sha256)
+        tmp = self.directory / f".{entry.name}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, entry)
+            self.logger.info(f"📦 Artefato {sha256[:12]} publicado no cache ({self.directory})")
+            self._prune()
+        except OSError as e:
+            self.logger.warning(f"⚠️  Falha ao publicar no cache de updates: {e}")
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def _prune(self):
+        """Mantém apenas os MAX_ENTRIES artefatos mais recentes"""
+        entries = [
+            p for p in self.directory.iterdir()
+            if len(p.name) == 64 and all(c in '0123456789abcdef' for c in p.name)
+        ]
+        entries.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in entries[MAX_ENTRIES:]:
+            old.unlink(missing_ok=True)
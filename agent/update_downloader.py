@@ -0,0 +1,474 @@
+"""
+Download de atualizações em passagem única, com retomada
+
+O SHA256 é calculado enquanto os pedaços (1 MB) chegam da rede, sem reler
+o arquivo no fim. O destino é pré-alocado com o tamanho anunciado e os
+bytes já recebidos ficam em disco (<nome>.part + <nome>.part.json): uma
+queda de conexão, ou um reinício do agente, retoma o download com
+HTTP Range de onde parou.
+
+Artefatos grandes são baixados em segmentos Range paralelos; o SHA256
+acompanha o prefixo contíguo já gravado (lido de volta do cache de
+páginas enquanto os demais segmentos chegam). Com um ArtifactCache, o
+artefato vem do cache do site quando outro agente já o baixou.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from retry_policy import DecorrelatedJitter
+from update_cache import ArtifactCache
+
+MB = 1024 * 1024
+
+DOWNLOAD_CHUNK_SIZE = 1 * MB
+# Bytes recebidos entre gravações do estado da retomada
+STATE_SAVE_BYTES = 8 * MB
+# Segundos entre logs de progresso
+PROGRESS_INTERVAL = 5.0
+# Segmentos menores que isso não compensam uma conexão extra
+SEGMENT_MIN_BYTES = 4 * MB
+
+class DownloadError(Exception):
+    """Falha definitiva (tamanho ou hash divergente): o parcial é descartado"""
+
+def _parse_content_range(header: str) -> Tuple[int, str]:
+    """'bytes 100-199/1000' → (100, '1000')"""
+    try:
+        span, _, total = header.split(' ', 1)[1].partition('/')
+        return int(span.split('-', 1)[0]), total
+    except (IndexError, ValueError):
+        raise DownloadError(f"Content-Range inválido: {header!r}")
+
+class _Segment:
+    """Intervalo [start, end] do artefato e bytes já gravados dele"""
+
+    def __init__(self, start: int, end: int, done: int = 0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    @property
+    def position(self) -> int:
+        return self.start + self.done
+
+    @property
+    def complete(self) -> bool:
+        return self.done == self.size
+
+class _Transfer:
+    """Progresso de um download (bytes em disco e SHA256 acumulado)"""
+
+    def __init__(self):
+        self.offset = 0  # download único: bytes gravados (e hasheados)
+        self.segments: Optional[List[_Segment]] = None  # download segmentado
+        self.hashed = 0  # download segmentado: prefixo já hasheado
+        self.hasher = hashlib.sha256()
+        self.validator: Optional[str] = None  # ETag/Last-Modified para If-Range
+        self.received = 0  # bytes recebidos da rede nesta execução
+        self.last_log = time.monotonic()
+
+    @property
+    def downloaded(self) -> int:
+        if self.segments is not None:
+            return sum(segment.done for segment in self.segments)
+        return self.offset
+
+    def restart(self):
+        self.offset = 0
+        self.segments = None
+        self.hashed = 0
+        self.hasher = hashlib.sha256()
+        self.validator = None
+
+class UpdateDownloader:
+    """Baixa um artefato verificando tamanho e SHA256 em uma única passagem"""
+
+    def __init__(
+        self,
+        transport,
+        download_dir: Path,
+        max_resumes: int = 3,
+        timeout: float = 300,
+        segments: int = 1,
+        cache: Optional[ArtifactCache] = None
+    ):
+        self.transport = transport
+        self.download_dir = download_dir
+        self.max_resumes = max_resumes
+        self.timeout = timeout
+        self.segments = segments
+        self.cache = cache
+        self.logger = logging.getLogger(__name__)
+
+    def fetch(self, url: str, sha256: str, size: int, name: str) -> Path:
+        """
+        Obtém o artefato em download_dir/name (do cache do site ou de url)
+
+        Returns:
+            Path do arquivo verificado
+
+        Raises:
+            DownloadError: tamanho ou SHA256 divergente (parcial descartado)
+            requests.RequestException: falha de rede após max_resumes
+                retomadas (parcial mantido para a próxima tentativa)
+        """
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        target = self.download_dir / name
+        if self.cache is None:
+            return self._download(url, sha256, size, target)
+
+        if self.cache.get(sha256, size, target):
+            return target
+        lock = self.cache.claim(sha256)
+        if lock is None:
+            # Outro agente do site está baixando: só ele usa o link de internet
+            if self.cache.wait(sha256, size) and self.cache.get(sha256, size, target):
+                return target
+            lock = self.cache.claim(sha256)
+        try:
+            path = self._download(url, sha256, size, target, lock)
+            self.cache.put(path, sha256)
+            return path
+        finally:
+            if lock:
+                self.cache.release(lock)
+
+    def _download(self, url: str, sha256: str, size: int, target: Path, lock: Optional[Path] = None) -> Path:
+        part = target.with_name(f"{target.name}.part")
+        state_path = target.with_name(f"{target.name}.part.json")
+
+        transfer = self._resume_state(part, state_path, url, sha256, size)
+        backoff = DecorrelatedJitter(1.0, 30.0)
+        resumes = 0
+        started = time.monotonic()
+        segments = min(self.segments, size // SEGMENT_MIN_BYTES)
+
+        while True:
+            try:
+                if transfer.segments is not None or (
+                    transfer.offset == 0 and segments > 1 and
+                    self._plan_segments(url, part, transfer, size, segments)
+                ):
+                    self._download_segments(url, part, state_path, transfer, sha256, size, lock)
+                else:
+                    self._stream(url, part, state_path, transfer, sha256, size, lock)
+                break
+            except DownloadError:
+                self._discard(part, state_path)
+                raise
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                resumes += 1
+                if resumes > self.max_resumes:
+                    raise
+                delay = backoff.next()
+                self.logger.warning(
+                    f"⚠️  Download interrompido em {transfer.downloaded / MB:.1f}/{size / MB:.1f} MB "
+                    f"({e.__class__.__name__}), retomando em {delay:.0f}s"
+                )
+                time.sleep(delay)
+
+        digest = transfer.hasher.hexdigest()
+        if digest.lower() != sha256.lower():
+            self._discard(part, state_path)
+            raise DownloadError(f"SHA256 inválido (esperado {sha256}, obtido {digest})")
+
+        os.replace(part, target)
+        state_path.unlink(missing_ok=True)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        mode = f", {len(transfer.segments)} segmentos" if transfer.segments else ""
+        self.logger.info(
+            f"✅ Download concluído: {size / MB:.1f} MB "
+            f"({transfer.received / MB:.1f} MB recebidos{mode}) em {elapsed:.1f}s "
+            f"({transfer.received / MB / elapsed:.2f} MB/s), SHA256 OK"
+        )
+        return target
+
+    def _resume_state(self, part: Path, state_path: Path, url: str, sha256: str, size: int) -> _Transfer:
+        """Retoma um parcial do mesmo artefato (re-hasheando o trecho em disco)"""
+        transfer = _Transfer()
+        try:
+            state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            state = None
+
+        if not state or not part.exists() or state.get('sha256') != sha256 or state.get('size') != size:
+            self._discard(part, state_path)
+            return transfer
+        transfer.validator = state.get('validator') if state.get('url') == url else None
+
+        if state.get('segments'):
+            # O SHA256 é refeito pelo prefixo contíguo durante o download
+            segments = [_Segment(*map(int, item)) for item in state['segments']]
+            if segments[0].start != 0 or segments[-1].end != size - 1 or any(
+                not 0 <= s.done <= s.size for s in segments
+            ) or part.stat().st_size != size:
+                self._discard(part, state_path)
+                return _Transfer()
+            transfer.segments = segments
+            self.logger.info(
+                f"📥 Retomando download de {transfer.downloaded / MB:.1f}/{size / MB:.1f} MB "
+                f"({len(segments)} segmentos)"
+            )
+            return transfer
+
+        offset = int(state.get('downloaded', 0))
+        if not 0 < offset <= size:
+            self._discard(part, state_path)
+            return _Transfer()
+
+        # O estado do SHA256 não é serializável: refazer o hash do trecho local
+        with open(part, 'rb') as f:
+            remaining = offset
+            while remaining:
+                chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                transfer.hasher.update(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            self._discard(part, state_path)
+            return _Transfer()
+
+        transfer.offset = offset
+        self.logger.info(f"📥 Retomando download de {offset / MB:.1f}/{size / MB:.1f} MB")
+        return transfer
+
+    def _stream(
+        self, url: str, part: Path, state_path: Path, transfer: _Transfer,
+        sha256: str, size: int, lock: Optional[Path] = None
+    ):
+        # Sem gzip de transporte: offsets e tamanhos referem-se aos bytes do artefato
+        headers: Dict[str, str] = {'Accept-Encoding': 'identity'}
+        if transfer.offset:
+            headers['Range'] = f"bytes={transfer.offset}-"
+            if transfer.validator:
+                # Artefato trocado no servidor: resposta 200 com o arquivo inteiro
+                headers['If-Range'] = transfer.validator
+
+        response = self.transport.download(url, timeout=self.timeout, headers=headers)
+        with response:
+            if response.status_code == 416 and transfer.offset == size:
+                return  # parcial já completo
+            response.raise_for_status()
+            self._check_response(response, transfer, size)
+
+            transfer.validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+            mode = 'r+b' if part.exists() else 'w+b'
+            with open(part, mode) as f:
+                if transfer.offset == 0:
+                    self._preallocate(f, size)
+                f.seek(transfer.offset)
+                saved = transfer.offset
+                try:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if transfer.offset + len(chunk) > size:
+                            raise DownloadError(f"servidor enviou mais que os {size} bytes anunciados")
+                        f.write(chunk)
+                        transfer.hasher.update(chunk)
+                        transfer.offset += len(chunk)
+                        transfer.received += len(chunk)
+
+                        if transfer.offset - saved >= STATE_SAVE_BYTES:
+                            f.flush()
+                            self._save_state(state_path, url, sha256, size, transfer)
+                            saved = transfer.offset
+                        if lock:
+                            # Renovação por tempo (ArtifactCache.touch limita a frequência)
+                            self.cache.touch(lock)
+                        self._log_progress(transfer, size)
+                finally:
+                    # Bytes gravados até aqui ficam para a retomada
+                    f.flush()
+                    self._save_state(state_path, url, sha256, size, transfer)
+
+        if transfer.offset != size:
+            raise requests.ConnectionError(f"conexão encerrada em {transfer.offset} de {size} bytes")
+
+    def _check_response(self, response, transfer: _Transfer, size: int):
+        """Valida Content-Range/Content-Length antes de gravar qualquer byte"""
+        if response.status_code == 206:
+            start, total = _parse_content_range(response.headers.get('Content-Range', ''))
+            if total != '*' and int(total) != size:
+                raise DownloadError(f"tamanho no servidor ({total}) difere do anunciado ({size})")
+            if start != transfer.offset:
+                raise DownloadError(f"Content-Range começa em {start}, esperado {transfer.offset}")
+            return
+
+        if transfer.offset:
+            self.logger.info("📥 Servidor não retomou o download (Range ignorado ou arquivo alterado), reiniciando")
+            transfer.restart()
+        length = response.headers.get('Content-Length')
+        if length is not None and int(length) != size:
+            raise DownloadError(f"Content-Length {length} difere do tamanho anunciado ({size})")
+
+    def _plan_segments(self, url: str, part: Path, transfer: _Transfer, size: int, count: int) -> bool:
+        """
+        Divide o artefato em segmentos se o servidor atende Range
+
+        Returns:
+            False se o servidor ignorou o Range (usar download único)
+        """
+        headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={size - 1}-{size - 1}"}
+        with self.transport.download(url, timeout=self.timeout, headers=headers) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                self.logger.info("📥 Servidor não atende Range, download em conexão única")
+                return False
+            _, total = _parse_content_range(response.headers.get('Content-Range', ''))
+            if total != '*' and int(total) != size:
+                raise DownloadError(f"tamanho no servidor ({total}) difere do anunciado ({size})")
+            transfer.validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+        with open(part, 'w+b') as f:
+            self._preallocate(f, size)
+        step = -(-size // count)  # divisão arredondada para cima
+        transfer.segments = [
+            _Segment(start, min(start + step, size) - 1) for start in range(0, size, step)
+        ]
+        transfer.hashed = 0
+        transfer.hasher = hashlib.sha256()
+        return True
+
+    def _download_segments(
+        self, url: str, part: Path, state_path: Path, transfer: _Transfer,
+        sha256: str, size: int, lock: Optional[Path] = None
+    ):
+        """Baixa os segmentos pendentes em paralelo, hasheando o prefixo contíguo"""
+        pending = [segment for segment in transfer.segments if not segment.complete]
+        base = transfer.downloaded
+        abort = threading.Event()
+        errors: List[BaseException] = []
+
+        # Sem buffer: um read-ahead além do prefixo pronto guardaria bytes ainda
+        # não gravados (zeros) e a passagem seguinte os hashearia
+        with open(part, 'rb', buffering=0) as reader:
+            if pending:
+                with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='update-dl') as pool:
+                    futures = [
+                        pool.submit(self._fetch_segment, url, part, segment, transfer.validator, size, abort)
+                        for segment in pending
+                    ]
+                    try:
+                        remaining = set(futures)
+                        while remaining:
+                            done, remaining = wait(remaining, timeout=0.5)
+                            for future in done:
+                                if future.exception():
+                                    errors.append(future.exception())
+                                    if isinstance(future.exception(), DownloadError):
+                                        abort.set()
+                            self._hash_ready(reader, transfer)
+                            self._save_state(state_path, url, sha256, size, transfer)
+                            if lock:
+                                self.cache.touch(lock)
+                            self._log_progress(transfer, size)
+                    finally:
+                        abort.set()
+            self._hash_ready(reader, transfer)
+
+        transfer.received += transfer.downloaded - base
+        self._save_state(state_path, url, sha256, size, transfer)
+        if errors:
+            # Falha definitiva tem precedência; falhas de rede são retomadas
+            raise next((e for e in errors if isinstance(e, DownloadError)), errors[0])
+
+    def _fetch_segment(
+        self, url: str, part: Path, segment: _Segment, validator: Optional[str],
+        size: int, abort: threading.Event
+    ):
+        headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={segment.position}-{segment.end}"}
+        if validator:
+            headers['If-Range'] = validator
+        with self.transport.download(url, timeout=self.timeout, headers=headers) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise DownloadError("servidor respondeu sem Range (artefato alterado durante o download?)")
+            start, total = _parse_content_range(response.headers.get('Content-Range', ''))
+            if start != segment.position or (total != '*' and int(total) != size):
+                raise DownloadError(f"Content-Range inesperado: {response.headers.get('Content-Range')!r}")
+
+            with open(part, 'r+b') as f:
+                f.seek(segment.position)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if abort.is_set():
+                        return
+                    if segment.done + len(chunk) > segment.size:
+                        raise DownloadError(f"servidor enviou mais que os {segment.size} bytes do segmento")
+                    f.write(chunk)
+                    # Visível para o leitor do hash antes de contar como gravado
+                    f.flush()
+                    segment.done += len(chunk)
+
+        if not segment.complete:
+            raise requests.ConnectionError(f"segmento encerrado em {segment.position} de {segment.end + 1} bytes")
+
+    @staticmethod
+    def _hash_ready(reader, transfer: _Transfer):
+        """Avança o SHA256 sobre o prefixo contíguo já gravado"""
+        for segment in transfer.segments:
+            ready = segment.position
+            if transfer.hashed < ready:
+                reader.seek(transfer.hashed)
+                while transfer.hashed < ready:
+                    chunk = reader.read(min(DOWNLOAD_CHUNK_SIZE, ready - transfer.hashed))
+                    if not chunk:
+                        return
+                    transfer.hasher.update(chunk)
+                    transfer.hashed += len(chunk)
+            if not segment.complete:
+                return
+
+    def _log_progress(self, transfer: _Transfer, size: int):
+        now = time.monotonic()
+        if now - transfer.last_log >= PROGRESS_INTERVAL:
+            transfer.last_log = now
+            downloaded = transfer.downloaded
+            self.logger.info(
+                f"📥 Download: {downloaded / size * 100:.1f}% "
+                f"({downloaded / MB:.1f}/{size / MB:.1f} MB)"
+            )
+
+    @staticmethod
+    def _preallocate(f, size: int):
+        """Reserva o espaço do arquivo (falta de disco aparece antes do download)"""
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError as e:
+                if e.errno == 28:  # ENOSPC
+                    raise DownloadError(f"espaço insuficiente para {size} bytes")
+        f.truncate(size)
+
+    @staticmethod
+    def _save_state(state_path: Path, url: str, sha256: str, size: int, transfer: _Transfer):
+        state: Dict[str, Any] = {
+            'url': url,
+            'sha256': sha256,
+            'size': size,
+            'downloaded': transfer.offset,
+            'validator': transfer.validator,
+        }
+        if transfer.segments is not None:
+            state['segments'] = [[s.start, s.end, s.done] for s in transfer.segments]
+        tmp = state_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, state_path)
+
+    @staticmethod
+    def _discard(part: Path, state_path: Path):
+        part.unlink(missing_ok=True)
+        state_path.unlink(missing_ok=True)
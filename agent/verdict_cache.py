@@ -0,0 +1,176 @@
+"""
+Cache local de vereditos do scan-virus (por SHA256)
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+
+# Campos do veredito mantidos em cache ('scans' traz o resultado de cada
+# engine e é descartado para manter a memória previsível)
+CACHED_FIELDS = ('isMalicious', 'positives', 'totalScans', 'permalink', 'unknown')
+
+def verdict_kind(verdict: Dict[str, Any]) -> str:
+    """'malicious', 'unknown' ou 'clean'"""
+    if verdict.get('unknown'):
+        return 'unknown'
+    return 'malicious' if verdict.get('isMalicious') else 'clean'
+
+def _valid_entry(item: Any) -> bool:
+    """[sha256, expires_at, veredito] como gravado por save()"""
+    return (
+        isinstance(item, list) and len(item) == 3
+        and isinstance(item[0], str)
+        and isinstance(item[1], (int, float)) and not isinstance(item[1], bool)
+        and isinstance(item[2], dict)
+    )
+
+class VerdictCache:
+    """
+    Cache LRU de vereditos com TTL por tipo (limpo, malicioso, desconhecido)
+
+    Seguro para uso concorrente por vários jobs de scan. Com persist_path,
+    o conteúdo é salvo em JSON e recarregado (sem as entradas expiradas)
+    na próxima inicialização.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttls: Dict[str, int],
+        persist_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.logger = logging.getLogger(__name__)
+
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = Lock()
+        # save() é chamado por threads diferentes (jobs de scan, watcher)
+        self._save_lock = Lock()
+        self._dirty = False
+        self._version = 0  # incrementado a cada put()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Veredito em cache ainda válido, ou None"""
+        with self._lock:
+            item = self._entries.get(sha256)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, verdict = item
+            if expires_at <= time.time():
+                del self._entries[sha256]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sha256)
+            self.hits += 1
+            return dict(verdict, cached=True)
+
+    def put(self, sha256: str, verdict: Dict[str, Any]):
+        """Armazena um veredito com o TTL do seu tipo"""
+        kind = verdict_kind(verdict)
+        entry = {k: verdict[k] for k in CACHED_FIELDS if k in verdict}
+        with self._lock:
+            self._entries[sha256] = (time.time() + self.ttls[kind], entry)
+            self._entries.move_to_end(sha256)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+            self._version += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """Carrega o cache persistido (entradas expiradas são descartadas)"""
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"⚠️  Cache de vereditos ignorado ({e})")
+            return
+
+        entries = data.get('entries') if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            self.logger.warning("⚠️  Cache de vereditos ignorado (formato inválido)")
+            return
+
+        now = time.time()
+        invalid = 0
+        with self._lock:
+            # Arquivo salvo do menos para o mais recente: a ordem LRU é preservada
+            for item in entries:
+                if not _valid_entry(item):
+                    invalid += 1
+                    continue
+                sha256, expires_at, verdict = item
+                if expires_at > now:
+                    self._entries[sha256] = (expires_at, verdict)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if invalid:
+            self.logger.warning(f"⚠️  Cache de vereditos: {invalid} entrada(s) inválida(s) ignorada(s)")
+        self.logger.info(f"📦 Cache de vereditos carregado: {len(self._entries)} entradas")
+
+    def save(self):
+        """
+        Grava o cache de forma atômica (arquivo temporário + rename)
+
+        Uma gravação por vez; o cache só deixa de estar sujo quando o rename
+        conclui e nenhum put() aconteceu desde o snapshot (falhas tentam de
+        novo no próximo save()).
+        """
+        if not self.persist_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = [[sha, exp, verdict] for sha, (exp, verdict) in self._entries.items()]
+                version = self._version
+
+            tmp_path = None
+            try:
+                self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix=f".{self.persist_path.name}.", suffix='.tmp', dir=self.persist_path.parent
+                )
+                with open(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'entries': entries}, f, separators=(',', ':'))
+                os.replace(tmp_path, self.persist_path)
+            except OSError as e:
+                self.logger.error(f"❌ Erro ao salvar cache de vereditos: {e}")
+                if tmp_path:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                return
+
+            with self._lock:
+                if self._version == version:
+                    self._dirty = False
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        return (
+            f"{len(self._entries)} entradas, {self.hits} hits / {self.misses} misses "
+            f"({ratio:.0f}%), {self.expired} expiradas, {self.evictions} descartadas"
+        )
@@ -0,0 +1,7 @@
+"""
+Versão do agente
+
+Módulo sem dependências: auto_updater e ferramentas leem a versão sem
+importar main.py (que importaria o agente inteiro uma segunda vez).
+"""
+AGENT_VERSION = "1.0.0"
@@ -142,6 +142,7 @@ export type Database = {
       agent_system_metrics: {
         Row: {
           agent_id: string
+          aggregates: Json | null
           collected_at: string
           cpu_cores: number | null
           cpu_name: string | null
@@ -164,6 +165,7 @@ export type Database = {
         }
         Insert: {
           agent_id: string
+          aggregates?: Json | null
           collected_at?: string
           cpu_cores?: number | null
           cpu_name?: string | null
@@ -186,6 +188,7 @@ export type Database = {
         }
         Update: {
           agent_id?: string
+          aggregates?: Json | null
           collected_at?: string
           cpu_cores?: number | null
           cpu_name?: string | null
@@ -303,6 +306,47 @@ export type Database = {
           },
         ]
       }
+      agent_version_patches: {
+        Row: {
+          created_at: string | null
+          download_url: string
+          format: string
+          from_sha256: string
+          id: string
+          sha256: string
+          size_bytes: number
+          to_version_id: string
+        }
+        Insert: {
+          created_at?: string | null
+          download_url: string
+          format?: string
+          from_sha256: string
+          id?: string
+          sha256: string
+          size_bytes: number
+          to_version_id: string
+        }
+        Update: {
+          created_at?: string | null
+          download_url?: string
+          format?: string
+          from_sha256?: string
+          id?: string
+          sha256?: string
+          size_bytes?: number
+          to_version_id?: string
+        }
+        Relationships: [
+          {
+            foreignKeyName: "agent_version_patches_to_version_id_fkey"
+            columns: ["to_version_id"]
+            isOneToOne: false
+            referencedRelation: "agent_versions"
+            referencedColumns: ["id"]
+          },
+        ]
+      }
       agent_versions: {
         Row: {
           created_at: string | null
@@ -347,6 +391,7 @@ export type Database = {
           hostname: string | null
           id: string
           last_heartbeat: string | null
+          os_info_hash: string | null
           os_type: string | null
           os_version: string | null
           payload_hash: string | null
@@ -360,6 +405,7 @@ export type Database = {
           hostname?: string | null
           id?: string
           last_heartbeat?: string | null
+          os_info_hash?: string | null
           os_type?: string | null
           os_version?: string | null
           payload_hash?: string | null
@@ -373,6 +419,7 @@ export type Database = {
           hostname?: string | null
           id?: string
           last_heartbeat?: string | null
+          os_info_hash?: string | null
           os_type?: string | null
           os_version?: string | null
           payload_hash?: string | null
@@ -1,11 +1,12 @@
 import { SupabaseClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0';
+import { decodeRequestBody, RequestEncodingError } from './request-encoding.ts';
 
 export interface HmacVerificationResult {
   valid: boolean;
   errorCode?: string;
   errorMessage?: string;
   transient?: boolean;
-  rawBody?: string;  // Body lido durante a verificação
+  rawBody?: string;  // Body lido durante a verificação (já descomprimido)
 }
 
 /**
@@ -63,21 +64,25 @@ export async function verifyHmacSignature(
     };
   }
 
-  // Construir payload para verificação
-  let body = '';
+  // Bytes exatamente como recebidos: com Content-Encoding, a assinatura
+  // cobre o body comprimido
+  let rawBytes = new Uint8Array(0);
   try {
     const clonedRequest = request.clone();
-    body = await clonedRequest.text();
+    rawBytes = new Uint8Array(await clonedRequest.arrayBuffer());
   } catch {
-    body = '';
+    rawBytes = new Uint8Array(0);
   }
 
-  const payload = `${timestamp}:${nonce}:${body}`;
+  // Construir payload para verificação: "{timestamp}:{nonce}:" + body
+  const encoder = new TextEncoder();
+  const prefix = encoder.encode(`${timestamp}:${nonce}:`);
+  const messageData = new Uint8Array(prefix.length + rawBytes.length);
+  messageData.set(prefix, 0);
+  messageData.set(rawBytes, prefix.length);
 
   // Verificar assinatura HMAC
-  const encoder = new TextEncoder();
   const keyData = encoder.encode(hmacSecret);
-  const messageData = encoder.encode(payload);
 
   const cryptoKey = await crypto.subtle.importKey(
     'raw',
@@ -101,6 +106,21 @@ export async function verifyHmacSignature(
     };
   }
 
+  // Descomprimir só depois de autenticar
+  let body: string;
+  try {
+    const decoded = await decodeRequestBody(rawBytes, request.headers.get('Content-Encoding'));
+    body = new TextDecoder().decode(decoded);
+  } catch (error) {
+    if (!(error instanceof RequestEncodingError)) throw error;
+    return {
+      valid: false,
+      errorCode: error.code,
+      errorMessage: error.message,
+      transient: false
+    };
+  }
+
   // Armazenar assinatura usada
   await supabase.from('hmac_signatures').insert({
     signature,
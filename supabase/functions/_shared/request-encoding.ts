@@ -0,0 +1,119 @@
+/**
+ * Bodies de requisição comprimidos (Content-Encoding) enviados pelo agente
+ *
+ * Funções que aceitam bodies comprimidos anunciam as codificações no header
+ * Accept-Encoding das respostas (RFC 7694); o agente só comprime depois de
+ * ver o anúncio. A assinatura HMAC cobre os bytes comprimidos: verifique
+ * antes de descomprimir (ver hmac.ts).
+ */
+
+// zstd ainda não tem DecompressionStream no runtime das Edge Functions
+export const ACCEPTED_REQUEST_ENCODINGS = ['gzip'];
+
+export const requestEncodingHeaders = {
+  'Accept-Encoding': ACCEPTED_REQUEST_ENCODINGS.join(', '),
+};
+
+// Limite do body descomprimido (proteção contra "zip bombs")
+const MAX_DECODED_BYTES = 16 * 1024 * 1024;
+
+export class RequestEncodingError extends Error {
+  constructor(message: string, public code: string, public status: number) {
+    super(message);
+  }
+}
+
+/**
+ * Decodifica o body conforme o Content-Encoding (identity/ausente = sem alteração)
+ */
+export async function decodeRequestBody(
+  raw: Uint8Array,
+  contentEncoding: string | null
+): Promise<Uint8Array> {
+  const encoding = (contentEncoding || '').trim().toLowerCase();
+  if (!encoding || encoding === 'identity') {
+    return raw;
+  }
+  if (!ACCEPTED_REQUEST_ENCODINGS.includes(encoding)) {
+    throw new RequestEncodingError(
+      `Content-Encoding não suportado: ${encoding}`,
+      'UNSUPPORTED_CONTENT_ENCODING',
+      415
+    );
+  }
+
+  const stream = new Blob([raw]).stream().pipeThrough(
+    new DecompressionStream(encoding as CompressionFormat)
+  );
+  const reader = stream.getReader();
+  const chunks: Uint8Array[] = [];
+  let total = 0;
+  try {
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      total += value.length;
+      if (total > MAX_DECODED_BYTES) {
+        await reader.cancel();
+        throw new RequestEncodingError(
+          `Body descomprimido excede ${MAX_DECODED_BYTES} bytes`,
+          'BODY_TOO_LARGE',
+          413
+        );
+      }
+      chunks.push(value);
+    }
+  } catch (error) {
+    if (error instanceof RequestEncodingError) throw error;
+    throw new RequestEncodingError(`Body ${encoding} inválido`, 'INVALID_BODY_ENCODING', 400);
+  }
+
+  const decoded = new Uint8Array(total);
+  let offset = 0;
+  for (const chunk of chunks) {
+    decoded.set(chunk, offset);
+    offset += chunk.length;
+  }
+  return decoded;
+}
+
+/**
+ * Body da requisição como texto, já descomprimido
+ */
+export async function readRequestText(request: Request): Promise<string> {
+  const raw = new Uint8Array(await request.arrayBuffer());
+  const decoded = await decodeRequestBody(raw, request.headers.get('Content-Encoding'));
+  return new TextDecoder().decode(decoded);
+}
+
+/**
+ * Body multipart/form-data da requisição, já descomprimido
+ */
+export async function readRequestFormData(request: Request): Promise<FormData> {
+  const raw = new Uint8Array(await request.arrayBuffer());
+  const decoded = await decodeRequestBody(raw, request.headers.get('Content-Encoding'));
+  // O boundary vem do Content-Type original
+  return await new Response(decoded, {
+    headers: { 'Content-Type': request.headers.get('Content-Type') || '' },
+  }).formData();
+}
+
+/**
+ * Resposta de erro para RequestEncodingError
+ */
+export function createEncodingErrorResponse(
+  error: RequestEncodingError,
+  corsHeaders: Record<string, string>
+) {
+  return new Response(
+    JSON.stringify({
+      error: error.message,
+      code: error.code,
+      accepted: ACCEPTED_REQUEST_ENCODINGS,
+    }),
+    {
+      status: error.status,
+      headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
+    }
+  );
+}
@@ -6,6 +6,11 @@ import { verifyHmacSignature } from '../_shared/hmac.ts';
  * Edge Function para agentes verificarem updates disponíveis
  * Autenticação: X-Agent-Token + HMAC
  * Retorna versão latest baseada no platform do agente
+ *
+ * Se o agente informar o SHA256 do executável instalado (current_sha256) e
+ * existir um patch binário dessa origem para a versão latest, a resposta
+ * inclui "patch": o agente aplica o patch localmente e confere o resultado
+ * com o sha256 completo, voltando ao download_url em qualquer divergência.
  */
 
 Deno.serve(async (req) => {
@@ -150,7 +155,35 @@ Deno.serve(async (req) => {
 
     console.log(`[${requestId}] Latest version found: ${latestVersion.version}`);
 
-    // 6. Retornar informações da versão
+    // 6. Patch binário a partir do executável instalado (opcional)
+    let currentSha256: string | null = null;
+    try {
+      const body = JSON.parse(hmacResult.rawBody || '{}');
+      if (typeof body.current_sha256 === 'string' && /^[0-9a-f]{64}$/i.test(body.current_sha256)) {
+        currentSha256 = body.current_sha256.toLowerCase();
+      }
+    } catch {
+      // Body antigo/vazio: apenas download completo
+    }
+
+    let patch = null;
+    if (currentSha256 && currentSha256 !== latestVersion.sha256.toLowerCase()) {
+      const { data: patchRow, error: patchError } = await supabase
+        .from('agent_version_patches')
+        .select('format, download_url, sha256, size_bytes')
+        .eq('to_version_id', latestVersion.id)
+        .eq('from_sha256', currentSha256)
+        .maybeSingle();
+
+      if (patchError) {
+        console.warn(`[${requestId}] Patch lookup failed:`, patchError);
+      } else if (patchRow && patchRow.size_bytes < latestVersion.size_bytes) {
+        patch = { ...patchRow, from_sha256: currentSha256 };
+        console.log(`[${requestId}] Delta patch available: ${patchRow.size_bytes} bytes`);
+      }
+    }
+
+    // 7. Retornar informações da versão
     return new Response(
       JSON.stringify({
         has_update: true,
@@ -160,6 +193,7 @@ Deno.serve(async (req) => {
         size_bytes: latestVersion.size_bytes,
         download_url: latestVersion.download_url,
         release_notes: latestVersion.release_notes,
+        patch,
         requestId
       }),
       {
@@ -1,7 +1,28 @@
 import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0'
 import { corsHeaders } from '../_shared/cors.ts'
+import { verifyHmacSignature } from '../_shared/hmac.ts'
+import {
+  createEncodingErrorResponse,
+  readRequestText,
+  RequestEncodingError,
+  requestEncodingHeaders,
+} from '../_shared/request-encoding.ts'
+import { checkRateLimit } from '../_shared/rate-limit.ts'
 import { logger } from '../_shared/logger.ts'
 
+// Lote de linhas enviado pelo log shipper do agente (ou pelo instalador, com uma só linha)
+interface AgentLogBatch {
+  logs: string[] | string
+  log_type?: string
+  severity?: string
+  timestamp?: string
+  line_count?: number
+  agent_version?: string
+  // Job ship_logs: janela pedida e job de origem
+  minutes?: number
+  job_id?: string
+}
+
 Deno.serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders })
@@ -16,14 +37,14 @@ Deno.serve(async (req) => {
     if (!agentToken) {
       return new Response(
         JSON.stringify({ error: 'Agent token required' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 401 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
       )
     }
 
     // Buscar agente pelo token
     const { data: token } = await supabase
       .from('agent_tokens')
-      .select('agent_id, agents!inner(id, agent_name, tenant_id)')
+      .select('agent_id, agents!inner(id, agent_name, tenant_id, hmac_secret)')
       .eq('token', agentToken)
       .eq('is_active', true)
       .maybeSingle()
@@ -31,7 +52,7 @@ Deno.serve(async (req) => {
     if (!token?.agents) {
       return new Response(
         JSON.stringify({ error: 'Invalid token' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 401 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
       )
     }
 
@@ -39,10 +60,60 @@ Deno.serve(async (req) => {
       id: string
       agent_name: string
       tenant_id: string
+      hmac_secret: string | null
+    }
+
+    // Lotes do log shipper chegam assinados; a telemetria de crash do script
+    // Windows (sem assinatura) continua aceita, limitada a uma entrada
+    const signed = req.headers.has('X-HMAC-Signature')
+    let rawBody: string | undefined
+    if (agent.hmac_secret && signed) {
+      const hmacResult = await verifyHmacSignature(supabase, req, agent.agent_name, agent.hmac_secret)
+      if (!hmacResult.valid) {
+        return new Response(
+          JSON.stringify({
+            error: 'unauthorized',
+            code: hmacResult.errorCode,
+            message: hmacResult.errorMessage,
+            transient: hmacResult.transient
+          }),
+          { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
+        )
+      }
+      rawBody = hmacResult.rawBody
+    }
+
+    // Rate limiting: 120 lotes/hora (envio contínuo + jobs ship_logs)
+    const rateLimitResult = await checkRateLimit(supabase, `logs:${agent.agent_name}`, 'diagnostics-agent-logs', {
+      maxRequests: 120,
+      windowMinutes: 60,
+      blockMinutes: 10,
+    })
+    if (!rateLimitResult.allowed) {
+      return new Response(
+        JSON.stringify({ error: 'Rate limit exceeded', resetAt: rateLimitResult.resetAt }),
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 429 }
+      )
     }
 
-    const body = await req.json()
+    // Body já verificado e descomprimido pelo HMAC, se configurado (lotes chegam em gzip)
+    let body: AgentLogBatch
+    try {
+      body = JSON.parse(rawBody ?? await readRequestText(req))
+    } catch (error) {
+      if (error instanceof RequestEncodingError) {
+        return createEncodingErrorResponse(error, corsHeaders)
+      }
+      throw error
+    }
     const { logs, log_type, severity, timestamp } = body
+    const lines = Array.isArray(logs) ? logs : [logs]
+    if (agent.hmac_secret && !signed && lines.length > 1) {
+      return new Response(
+        JSON.stringify({ error: 'unauthorized', message: 'Log batches must be HMAC-signed' }),
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
+      )
+    }
 
     // Salvar logs em installation_analytics para rastreamento
     const { error: insertError } = await supabase
@@ -57,7 +128,11 @@ Deno.serve(async (req) => {
         metadata: {
           log_type,
           severity,
-          logs: Array.isArray(logs) ? logs : [logs],
+          logs: lines,
+          line_count: lines.length,
+          signed,
+          agent_version: body.agent_version ?? null,
+          ...(body.job_id ? { job_id: body.job_id, minutes: body.minutes } : {}),
           uploaded_at: timestamp || new Date().toISOString()
         }
       })
@@ -66,13 +141,14 @@ Deno.serve(async (req) => {
       logger.error('Failed to save agent logs', insertError)
       return new Response(
         JSON.stringify({ error: 'Failed to save logs' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 500 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 500 }
       )
     }
 
     logger.info('Agent logs received', { 
       agentName: agent.agent_name, 
       logType: log_type,
+      lines: lines.length,
       severity 
     })
 
@@ -82,13 +158,13 @@ Deno.serve(async (req) => {
         message: 'Logs received',
         agent: agent.agent_name 
       }),
-      { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 200 }
+      { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 200 }
     )
   } catch (error) {
     logger.error('Error in diagnostics-agent-logs', error)
     return new Response(
       JSON.stringify({ error: 'Internal server error' }),
-      { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 500 }
+      { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 500 }
     )
   }
 })
@@ -1,9 +1,116 @@
-import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0'
+import { createClient, SupabaseClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0'
 import { AgentTokenSchema } from '../_shared/validation.ts'
 import { handleException, corsHeaders } from '../_shared/error-handler.ts'
 import { verifyHmacSignature } from '../_shared/hmac.ts'
 import { checkRateLimit } from '../_shared/rate-limit.ts'
 
+// Tamanho de lote padrão (clientes legados) e teto aceito via ?limit=
+const DEFAULT_BATCH_LIMIT = 3
+const MAX_BATCH_LIMIT = 25
+
+function resolveBatchLimit(req: Request): number {
+  const requested = parseInt(new URL(req.url).searchParams.get('limit') ?? '', 10)
+  if (!Number.isFinite(requested) || requested < 1) {
+    return DEFAULT_BATCH_LIMIT
+  }
+  return Math.min(requested, MAX_BATCH_LIMIT)
+}
+
+// Long-poll (?wait=N): segura a requisição até chegar job ou esgotar N segundos.
+// O job enfileirado acorda a requisição via Realtime (INSERT/UPDATE em jobs);
+// consultas de segurança com back-off cobrem eventos perdidos e a janela antes
+// do canal conectar. Custo por poll ocioso de 25s: 6 consultas (2s, 6s, 14s,
+// 24s, 25s + a inicial) e 25s de wall-time da função, contra 1 consulta a cada
+// poll_interval sem long-poll; o ganho é a entrega imediata do job.
+const MAX_LONG_POLL_SECONDS = 25
+const LONG_POLL_FALLBACK_FIRST_MS = 2000
+const LONG_POLL_FALLBACK_MAX_MS = 10000
+
+function resolveLongPollWait(req: Request): number {
+  const requested = parseInt(new URL(req.url).searchParams.get('wait') ?? '', 10)
+  if (!Number.isFinite(requested) || requested < 1) {
+    return 0
+  }
+  return Math.min(requested, MAX_LONG_POLL_SECONDS)
+}
+
+// Heartbeat combinado: POST com {"heartbeat": {...}} dispensa o POST em /heartbeat
+interface CombinedHeartbeat {
+  os_info_hash?: string
+  os_info?: {
+    os_type?: string
+    os_version?: string
+    hostname?: string
+  }
+}
+
+function parseCombinedHeartbeat(rawBody?: string): CombinedHeartbeat | null {
+  if (!rawBody) {
+    return null
+  }
+  try {
+    const parsed = JSON.parse(rawBody)
+    return parsed?.heartbeat && typeof parsed.heartbeat === 'object' ? parsed.heartbeat : null
+  } catch {
+    return null
+  }
+}
+
+interface JobWakeup {
+  wait(ms: number, signal: AbortSignal): Promise<void>
+  close(): Promise<unknown>
+}
+
+// Canal Realtime com os jobs do agente; wait() retorna no primeiro job enfileirado,
+// no timeout ou quando o agente desconecta
+function subscribeQueuedJobs(supabase: SupabaseClient, agentName: string): JobWakeup {
+  let pending = false
+  let wake = () => { pending = true }
+  const onChange = (payload: { new?: { status?: string } }) => {
+    if (payload.new?.status === 'queued') {
+      wake()
+    }
+  }
+  const filter = { schema: 'public', table: 'jobs', filter: `agent_name=eq.${agentName}` }
+  const channel = supabase
+    .channel(`poll-jobs:${agentName}:${crypto.randomUUID()}`)
+    .on('postgres_changes', { event: 'INSERT', ...filter }, onChange)
+    .on('postgres_changes', { event: 'UPDATE', ...filter }, onChange)
+    .subscribe()
+
+  return {
+    wait(ms: number, signal: AbortSignal): Promise<void> {
+      if (pending || signal.aborted) {
+        pending = false
+        return Promise.resolve()
+      }
+      return new Promise(resolve => {
+        const done = () => {
+          clearTimeout(timer)
+          signal.removeEventListener('abort', done)
+          pending = false
+          wake = () => { pending = true }
+          resolve()
+        }
+        const timer = setTimeout(done, ms)
+        signal.addEventListener('abort', done)
+        wake = done
+      })
+    },
+    close: () => supabase.removeChannel(channel),
+  }
+}
+
+function fetchQueuedJobs(supabase: SupabaseClient, agentName: string, limit: number) {
+  return supabase
+    .from('jobs')
+    .select('*')
+    .eq('agent_name', agentName)
+    .eq('status', 'queued')
+    .order('created_at', { ascending: true })
+    .limit(limit)
+}
+
 Deno.serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders })
@@ -35,7 +142,7 @@ Deno.serve(async (req) => {
     // Buscar agente pelo token na tabela dedicada
     const { data: token } = await supabase
       .from('agent_tokens')
-      .select('agent_id, agents!inner(agent_name, hmac_secret)')
+      .select('agent_id, agents!inner(agent_name, hmac_secret, os_info_hash)')
       .eq('token', agentToken)
       .eq('is_active', true)
       .order('created_at', { ascending: false })
@@ -99,11 +206,29 @@ Deno.serve(async (req) => {
 
     console.log('[poll-jobs] Agente polling:', agent.agent_name)
 
+    // Heartbeat combinado: OS info completo só chega no primeiro contato ou quando muda
+    const heartbeat = parseCombinedHeartbeat(hmacResult.rawBody)
+    const agentUpdate: Record<string, string> = { last_heartbeat: new Date().toISOString() }
+    let osInfoRequired = false
+
+    if (heartbeat) {
+      agentUpdate.status = 'active'
+      if (heartbeat.os_info) {
+        if (heartbeat.os_info.os_type) agentUpdate.os_type = heartbeat.os_info.os_type
+        if (heartbeat.os_info.os_version) agentUpdate.os_version = heartbeat.os_info.os_version
+        if (heartbeat.os_info.hostname) agentUpdate.hostname = heartbeat.os_info.hostname
+        if (heartbeat.os_info_hash) agentUpdate.os_info_hash = heartbeat.os_info_hash
+      } else if (heartbeat.os_info_hash !== agent.os_info_hash) {
+        // Hash desconhecido: pedir ao agente o OS info completo no próximo poll
+        osInfoRequired = true
+      }
+    }
+
     // Atualizar heartbeat e last_used_at do token
     await Promise.all([
       supabase
         .from('agents')
-        .update({ last_heartbeat: new Date().toISOString() })
+        .update(agentUpdate)
         .eq('agent_name', agent.agent_name),
       supabase
         .from('agent_tokens')
@@ -111,15 +236,33 @@ Deno.serve(async (req) => {
         .eq('token', agentToken)
     ])
 
-    console.log('[poll-jobs] Fetching jobs for agent:', agent.agent_name)
-    // Buscar jobs pendentes (máx 3)
-    const { data: jobs, error: jobsError } = await supabase
-      .from('jobs')
-      .select('*')
-      .eq('agent_name', agent.agent_name)
-      .eq('status', 'queued')
-      .order('created_at', { ascending: true })
-      .limit(3)
+    // Lote solicitado pelo agente (?limit=N), limitado a MAX_BATCH_LIMIT
+    const batchLimit = resolveBatchLimit(req)
+    const longPollWait = resolveLongPollWait(req)
+    const longPollDeadline = Date.now() + longPollWait * 1000
+
+    console.log('[poll-jobs] Fetching jobs for agent:', agent.agent_name, 'limit:', batchLimit, 'wait:', longPollWait)
+    // Buscar jobs pendentes (máx batchLimit)
+    let { data: jobs, error: jobsError } = await fetchQueuedJobs(supabase, agent.agent_name, batchLimit)
+
+    // Long-poll: aguardar o aviso do Realtime (ou a consulta de segurança) até
+    // chegar job, esgotar o wait ou o agente desconectar
+    if (!jobsError && (jobs?.length ?? 0) === 0 && longPollWait > 0) {
+      const wakeup = subscribeQueuedJobs(supabase, agent.agent_name)
+      let fallbackMs = LONG_POLL_FALLBACK_FIRST_MS
+      try {
+        while (!jobsError && (jobs?.length ?? 0) === 0 && Date.now() < longPollDeadline && !req.signal.aborted) {
+          await wakeup.wait(Math.min(fallbackMs, longPollDeadline - Date.now()), req.signal)
+          fallbackMs = Math.min(fallbackMs * 2, LONG_POLL_FALLBACK_MAX_MS)
+          if (req.signal.aborted) {
+            break
+          }
+          ;({ data: jobs, error: jobsError } = await fetchQueuedJobs(supabase, agent.agent_name, batchLimit))
+        }
+      } finally {
+        await wakeup.close()
+      }
+    }
 
     if (jobsError) {
       console.error('[poll-jobs] Error fetching jobs:', jobsError)
@@ -200,10 +343,23 @@ Deno.serve(async (req) => {
       approved: j.approved
     }))
 
+    // X-Batch-Limit permite ao agente saber se o lote veio cheio (drain mode)
+    // X-Long-Poll confirma ao agente que o modo long-poll é suportado
+    // X-OS-Info-Required pede o OS info completo no próximo heartbeat combinado
+    const responseHeaders: Record<string, string> = {
+      ...corsHeaders,
+      'Content-Type': 'application/json',
+      'X-Batch-Limit': String(batchLimit),
+      'X-Long-Poll': String(longPollWait)
+    }
+    if (osInfoRequired) {
+      responseHeaders['X-OS-Info-Required'] = '1'
+    }
+
     return new Response(
       JSON.stringify(jobsResponse),
       {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: responseHeaders,
         status: 200
       }
     )
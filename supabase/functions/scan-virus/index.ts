@@ -1,15 +1,50 @@
-import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0';
+import { createClient, SupabaseClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0';
 import { handleException, corsHeaders } from '../_shared/error-handler.ts';
 import { AgentTokenSchema } from '../_shared/validation.ts';
 import { verifyHmacSignature } from '../_shared/hmac.ts';
+import {
+  createEncodingErrorResponse,
+  readRequestText,
+  RequestEncodingError,
+  requestEncodingHeaders,
+} from '../_shared/request-encoding.ts';
 import { checkRateLimit } from '../_shared/rate-limit.ts';
 import { checkQuotaAvailable } from '../_shared/quota.ts';
 
+// Runtime das Edge Functions: mantém a instância viva até as promises
+// registradas terminarem, mesmo após a resposta
+declare const EdgeRuntime: { waitUntil(promise: Promise<unknown>): void } | undefined;
+
 interface ScanRequest {
   filePath: string;
   fileHash: string;
 }
 
+// Variante em lote: um único request assinado/limitado para vários hashes
+interface BatchScanRequest {
+  items: ScanRequest[];
+}
+
+interface BatchItemResult {
+  filePath: string;
+  fileHash: string;
+  status: 'ok' | 'unknown' | 'pending' | 'invalid';
+  cached?: boolean;
+  isMalicious?: boolean;
+  positives?: number;
+  totalScans?: number;
+  permalink?: string;
+  scannedAt?: string;
+}
+
+const MAX_BATCH_ITEMS = 100;
+// Consultas externas (Hybrid Analysis/VirusTotal) por lote; o restante volta
+// como 'pending' para o agente reenviar depois
+const MAX_EXTERNAL_LOOKUPS_PER_BATCH = 4;
+// Orçamento das consultas externas de um lote, abaixo do timeout de 30 s do
+// agente; consultas que não terminam a tempo voltam como 'pending'
+const BATCH_LOOKUP_BUDGET_MS = 20_000;
+
 interface ScanResult {
   isMalicious: boolean;
   positives: number;
@@ -119,6 +154,310 @@ async function scanWithVirusTotal(fileHash: string, apiKey: string): Promise<Sca
   }
 }
 
+interface AgentInfo {
+  agent_name: string;
+  tenant_id: string;
+}
+
+interface ScanKeys {
+  hybridAnalysisApiKey?: string;
+  virusTotalApiKey?: string;
+}
+
+// Quotas mensal e diária; retorna a resposta 429 ou null se há quota
+async function checkScanQuotas(supabase: SupabaseClient, agent: AgentInfo): Promise<Response | null> {
+  const quotaCheck = await checkQuotaAvailable(supabase, agent.tenant_id, 'max_scans_per_month');
+  
+  if (!quotaCheck.allowed) {
+    console.log(`[${agent.agent_name}] Scan quota exceeded: ${quotaCheck.current}/${quotaCheck.limit}`);
+    return new Response(
+      JSON.stringify({ 
+        error: quotaCheck.error || 'Quota de scans excedida',
+        quotaUsed: quotaCheck.current,
+        quotaLimit: quotaCheck.limit
+      }),
+      { status: 429, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const dailyQuotaCheck = await checkQuotaAvailable(supabase, agent.tenant_id, 'advanced_scans_daily');
+  
+  if (!dailyQuotaCheck.allowed) {
+    console.log(`[${agent.agent_name}] Daily advanced scan quota exceeded: ${dailyQuotaCheck.current}/${dailyQuotaCheck.limit}`);
+    return new Response(
+      JSON.stringify({ 
+        error: 'Limite diário de scans avançados atingido',
+        message: 'Você atingiu o limite de scans avançados do dia. Faça upgrade para o plano Pro para scans ilimitados.',
+        quotaUsed: dailyQuotaCheck.current,
+        quotaLimit: dailyQuotaCheck.limit
+      }),
+      { status: 429, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  return null;
+}
+
+// Consultas externas que cabem nas quotas mensal e diária (no máximo `wanted`)
+async function availableScanQuota(supabase: SupabaseClient, agent: AgentInfo, wanted: number): Promise<number> {
+  let available = wanted;
+  for (const featureKey of ['max_scans_per_month', 'advanced_scans_daily']) {
+    const quotaCheck = await checkQuotaAvailable(supabase, agent.tenant_id, featureKey);
+    if (!quotaCheck.allowed) return 0;
+    if (quotaCheck.limit != null && quotaCheck.current != null) {
+      available = Math.min(available, quotaCheck.limit - quotaCheck.current);
+    }
+  }
+  return Math.max(0, available);
+}
+
+async function updateAdvancedScanQuota(supabase: SupabaseClient, agent: AgentInfo, delta: number): Promise<void> {
+  await supabase.rpc('update_quota_usage', {
+    p_tenant_id: agent.tenant_id,
+    p_feature_key: 'advanced_scans_daily',
+    p_delta: delta
+  });
+}
+
+// Scans das últimas 24h para os hashes informados (o mais recente por hash)
+async function findRecentScans(supabase: SupabaseClient, hashes: string[]): Promise<Map<string, any>> {
+  const { data } = await supabase
+    .from('virus_scans')
+    .select('file_hash, is_malicious, positives, total_scans, virustotal_permalink, scanned_at')
+    .in('file_hash', hashes)
+    .gte('scanned_at', new Date(Date.now() - 24 * 60 * 60 * 1000).toISOString())
+    .order('scanned_at', { ascending: false });
+
+  const byHash = new Map<string, any>();
+  for (const row of data || []) {
+    if (!byHash.has(row.file_hash)) byHash.set(row.file_hash, row);
+  }
+  return byHash;
+}
+
+// Consulta Hybrid Analysis (fallback VirusTotal), grava o resultado,
+// incrementa a quota diária (se não foi reservada) e dispara a quarentena automática
+async function scanAndStore(
+  supabase: SupabaseClient,
+  agent: AgentInfo,
+  filePath: string,
+  fileHash: string,
+  keys: ScanKeys,
+  quotaReserved = false
+): Promise<ScanResult | null> {
+  // Try Hybrid Analysis first (primary scanner)
+  let scanResult: ScanResult | null = null;
+  
+  if (keys.hybridAnalysisApiKey) {
+    console.log(`[${agent.agent_name}] Trying Hybrid Analysis first...`);
+    scanResult = await scanWithHybridAnalysis(fileHash, keys.hybridAnalysisApiKey);
+  }
+  
+  // Fallback to VirusTotal if Hybrid Analysis failed or not configured
+  if (!scanResult && keys.virusTotalApiKey) {
+    console.log(`[${agent.agent_name}] Falling back to VirusTotal...`);
+    scanResult = await scanWithVirusTotal(fileHash, keys.virusTotalApiKey);
+  }
+
+  if (!scanResult) return null;
+
+  // Save scan result
+  const { data: scanRecord, error: scanError } = await supabase
+    .from('virus_scans')
+    .insert({
+      agent_name: agent.agent_name,
+      tenant_id: agent.tenant_id,
+      file_hash: fileHash,
+      file_path: filePath,
+      scan_result: scanResult.scans,
+      is_malicious: scanResult.isMalicious,
+      positives: scanResult.positives,
+      total_scans: scanResult.totalScans,
+      virustotal_permalink: scanResult.permalink,
+    })
+    .select()
+    .order('scanned_at', { ascending: false })
+    .limit(1)
+    .maybeSingle();
+
+  if (scanError) {
+    console.error('[SCAN-VIRUS] Error storing scan result:', scanError);
+  }
+
+  // Increment daily scan quota usage
+  if (!quotaReserved) {
+    await updateAdvancedScanQuota(supabase, agent, 1);
+    console.log(`[${agent.agent_name}] Advanced scan quota incremented`);
+  }
+
+  // Auto-quarantine if malicious and enabled
+  if (scanResult.isMalicious && scanRecord) {
+    console.log(`[SCAN-VIRUS] Malware detected by ${scanResult.scannerUsed}, triggering auto-quarantine`);
+    
+    try {
+      const internalSecret = Deno.env.get('INTERNAL_FUNCTION_SECRET');
+      
+      await supabase.functions.invoke('auto-quarantine', {
+        headers: {
+          'X-Internal-Secret': internalSecret || '',
+        },
+        body: {
+          virus_scan_id: scanRecord.id,
+          agent_name: agent.agent_name,
+          file_path: filePath,
+          file_hash: fileHash,
+          positives: scanResult.positives,
+          total_scans: scanResult.totalScans
+        }
+      });
+    } catch (quarantineError) {
+      console.error('[SCAN-VIRUS] Auto-quarantine failed:', quarantineError);
+      // Don't fail the scan if quarantine fails
+    }
+  }
+
+  return scanResult;
+}
+
+// Lote {items: [{filePath, fileHash}]}: resultados na mesma ordem dos itens
+async function handleBatch(
+  supabase: SupabaseClient,
+  agent: AgentInfo,
+  items: ScanRequest[],
+  keys: ScanKeys
+): Promise<Response> {
+  if (items.length === 0 || items.length > MAX_BATCH_ITEMS) {
+    return new Response(
+      JSON.stringify({ error: `items deve ter entre 1 e ${MAX_BATCH_ITEMS} entradas` }),
+      { status: 400, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const quotaResponse = await checkScanQuotas(supabase, agent);
+  if (quotaResponse) return quotaResponse;
+
+  const validHashes = [...new Set(
+    items
+      .filter((item) => typeof item?.filePath === 'string' && typeof item?.fileHash === 'string' && item.filePath && item.fileHash)
+      .map((item) => item.fileHash)
+  )];
+  const recent = validHashes.length ? await findRecentScans(supabase, validHashes) : new Map();
+
+  // Hashes sem scan recente: consulta externa limitada por lote
+  const candidates = new Map<string, string>();
+  for (const item of items) {
+    const hash = item?.fileHash;
+    if (typeof hash !== 'string' || typeof item.filePath !== 'string' || !hash || !item.filePath) continue;
+    if (recent.has(hash) || candidates.has(hash)) continue;
+    if (candidates.size >= MAX_EXTERNAL_LOOKUPS_PER_BATCH) break;
+    candidates.set(hash, item.filePath);
+  }
+
+  // Cada consulta precisa de quota própria: reserva a diária antes de consultar
+  // (a mensal é incrementada pelo trigger ao gravar em virus_scans) e devolve a
+  // reserva das consultas sem resultado
+  const granted = candidates.size ? await availableScanQuota(supabase, agent, candidates.size) : 0;
+  const lookups = [...candidates].slice(0, granted);
+  if (lookups.length) await updateAdvancedScanQuota(supabase, agent, lookups.length);
+
+  // Consultas em paralelo dentro do orçamento; as atrasadas ficam registradas
+  // no EdgeRuntime.waitUntil, terminam de gravar em virus_scans (ou devolvem a
+  // reserva) após a resposta e o reenvio do agente as encontra no cache
+  const fresh = new Map<string, ScanResult | null>();
+  let budgetTimer: number | undefined;
+  const budget = new Promise<'timeout'>((resolve) => {
+    budgetTimer = setTimeout(() => resolve('timeout'), BATCH_LOOKUP_BUDGET_MS);
+  });
+  // Reserva ainda não devolvida, por consulta (evita devolver duas vezes)
+  const reserved = lookups.map(() => true);
+  const pendingLookups = lookups.map(([hash, filePath], index) =>
+    scanAndStore(supabase, agent, filePath, hash, keys, true)
+      .catch((error) => {
+        console.error(`[${agent.agent_name}] External lookup failed for ${hash}:`, error);
+        return null;
+      })
+      .then(async (scanResult) => {
+        if (!scanResult && reserved[index]) {
+          reserved[index] = false;
+          await updateAdvancedScanQuota(supabase, agent, -1);
+        }
+        return scanResult;
+      })
+  );
+  const outcomes = await Promise.all(pendingLookups.map((lookup) => Promise.race([lookup, budget])));
+  clearTimeout(budgetTimer);
+
+  const unfinished: number[] = [];
+  lookups.forEach(([hash], index) => {
+    const outcome = outcomes[index];
+    if (outcome === 'timeout') {
+      unfinished.push(index);
+    } else {
+      fresh.set(hash, outcome);
+    }
+  });
+  if (unfinished.length) {
+    if (typeof EdgeRuntime !== 'undefined') {
+      EdgeRuntime.waitUntil(Promise.allSettled(unfinished.map((index) => pendingLookups[index])));
+    } else {
+      // Sem waitUntil nada garante que as consultas terminem: devolver a
+      // reserva agora (um resultado gravado depois não é cobrado)
+      const refunds = unfinished.filter((index) => reserved[index]);
+      refunds.forEach((index) => { reserved[index] = false; });
+      if (refunds.length) await updateAdvancedScanQuota(supabase, agent, -refunds.length);
+    }
+  }
+
+  const results: BatchItemResult[] = items.map((item) => {
+    const filePath = item?.filePath;
+    const fileHash = item?.fileHash;
+    if (typeof filePath !== 'string' || typeof fileHash !== 'string' || !filePath || !fileHash) {
+      return { filePath, fileHash, status: 'invalid' };
+    }
+
+    const row = recent.get(fileHash);
+    if (row) {
+      return {
+        filePath,
+        fileHash,
+        status: 'ok',
+        cached: true,
+        isMalicious: row.is_malicious,
+        positives: row.positives,
+        totalScans: row.total_scans,
+        permalink: row.virustotal_permalink,
+        scannedAt: row.scanned_at,
+      };
+    }
+
+    if (!fresh.has(fileHash)) {
+      return { filePath, fileHash, status: 'pending' };
+    }
+
+    const scanResult = fresh.get(fileHash);
+    if (!scanResult) {
+      return { filePath, fileHash, status: 'unknown' };
+    }
+    return {
+      filePath,
+      fileHash,
+      status: 'ok',
+      isMalicious: scanResult.isMalicious,
+      positives: scanResult.positives,
+      totalScans: scanResult.totalScans,
+      permalink: scanResult.permalink,
+      scannedAt: scanResult.scanDate,
+    };
+  });
+
+  console.log(`[${agent.agent_name}] Batch scan: ${items.length} itens, ${recent.size} em cache, ${lookups.length} consultas externas (${unfinished.length} fora do orçamento, ${candidates.size - lookups.length} sem quota)`);
+
+  return new Response(
+    JSON.stringify({ results }),
+    { status: 200, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
+  );
+}
+
 Deno.serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
@@ -135,7 +474,7 @@ Deno.serve(async (req) => {
     if (!hybridAnalysisApiKey && !virusTotalApiKey) {
       return new Response(
         JSON.stringify({ error: 'Nenhum serviço de scan configurado' }),
-        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 500, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
@@ -146,7 +485,7 @@ Deno.serve(async (req) => {
     if (!agentToken) {
       return new Response(
         JSON.stringify({ error: 'Token do agente necessário' }),
-        { status: 401, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 401, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
@@ -154,7 +493,7 @@ Deno.serve(async (req) => {
     if (!tokenValidation.success) {
       return new Response(
         JSON.stringify({ error: 'Formato de token inválido' }),
-        { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 400, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
@@ -171,7 +510,7 @@ Deno.serve(async (req) => {
     if (!token?.agents) {
       return new Response(
         JSON.stringify({ error: 'Token inválido' }),
-        { status: 401, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 401, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
@@ -182,11 +521,12 @@ Deno.serve(async (req) => {
       console.error(`[${requestId}] Agent ${agent.agent_name} has no tenant_id`);
       return new Response(
         JSON.stringify({ error: 'Configuração inválida do agente' }),
-        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 500, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
     // Verificar HMAC se configurado
+    let rawBody: string | undefined;
     if (agent.hmac_secret) {
       const hmacResult = await verifyHmacSignature(supabase, req, agent.agent_name, agent.hmac_secret);
       if (!hmacResult.valid) {
@@ -197,9 +537,10 @@ Deno.serve(async (req) => {
             message: hmacResult.errorMessage,
             transient: hmacResult.transient
           }),
-          { status: 401, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+          { status: 401, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
         );
       }
+      rawBody = hmacResult.rawBody;
     }
 
     // Rate limiting
@@ -215,7 +556,7 @@ Deno.serve(async (req) => {
           error: 'Rate limit excedido',
           resetAt: rateLimitResult.resetAt 
         }),
-        { status: 429, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 429, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
@@ -225,58 +566,38 @@ Deno.serve(async (req) => {
       .update({ last_used_at: new Date().toISOString() })
       .eq('token', agentToken);
 
-    // Parse do body
-    const { filePath, fileHash }: ScanRequest = await req.json();
+    // Parse do body (já verificado e descomprimido pelo HMAC, se configurado)
+    let body;
+    try {
+      body = JSON.parse(rawBody ?? await readRequestText(req));
+    } catch (error) {
+      if (error instanceof RequestEncodingError) {
+        return createEncodingErrorResponse(error, corsHeaders);
+      }
+      throw error;
+    }
+    const scanKeys = { hybridAnalysisApiKey, virusTotalApiKey };
+
+    if (Array.isArray((body as BatchScanRequest)?.items)) {
+      return await handleBatch(supabase, agent, (body as BatchScanRequest).items, scanKeys);
+    }
+
+    const { filePath, fileHash }: ScanRequest = body;
 
     if (!filePath || !fileHash) {
       return new Response(
         JSON.stringify({ error: 'filePath e fileHash são obrigatórios' }),
-        { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 400, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
     console.log(`[${agent.agent_name}] Scanning file: ${filePath} (${fileHash})`);
 
-    // Check scan quota before proceeding
-    const quotaCheck = await checkQuotaAvailable(supabase, agent.tenant_id, 'max_scans_per_month');
-    
-    if (!quotaCheck.allowed) {
-      console.log(`[${agent.agent_name}] Scan quota exceeded: ${quotaCheck.current}/${quotaCheck.limit}`);
-      return new Response(
-        JSON.stringify({ 
-          error: quotaCheck.error || 'Quota de scans excedida',
-          quotaUsed: quotaCheck.current,
-          quotaLimit: quotaCheck.limit
-        }),
-        { status: 429, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
-      );
-    }
-
-    // Check daily advanced scans quota
-    const dailyQuotaCheck = await checkQuotaAvailable(supabase, agent.tenant_id, 'advanced_scans_daily');
-    
-    if (!dailyQuotaCheck.allowed) {
-      console.log(`[${agent.agent_name}] Daily advanced scan quota exceeded: ${dailyQuotaCheck.current}/${dailyQuotaCheck.limit}`);
-      return new Response(
-        JSON.stringify({ 
-          error: 'Limite diário de scans avançados atingido',
-          message: 'Você atingiu o limite de scans avançados do dia. Faça upgrade para o plano Pro para scans ilimitados.',
-          quotaUsed: dailyQuotaCheck.current,
-          quotaLimit: dailyQuotaCheck.limit
-        }),
-        { status: 429, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
-      );
-    }
+    const quotaResponse = await checkScanQuotas(supabase, agent);
+    if (quotaResponse) return quotaResponse;
 
     // Verificar scan existente recente (últimas 24h)
-    const { data: existingScan } = await supabase
-      .from('virus_scans')
-      .select('*')
-      .eq('file_hash', fileHash)
-      .gte('scanned_at', new Date(Date.now() - 24 * 60 * 60 * 1000).toISOString())
-      .order('scanned_at', { ascending: false })
-      .limit(1)
-      .maybeSingle();
+    const existingScan = (await findRecentScans(supabase, [fileHash])).get(fileHash);
 
     if (existingScan) {
       return new Response(
@@ -288,23 +609,11 @@ Deno.serve(async (req) => {
           permalink: existingScan.virustotal_permalink,
           scannedAt: existingScan.scanned_at,
         }),
-        { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 200, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
-    // Try Hybrid Analysis first (primary scanner)
-    let scanResult: ScanResult | null = null;
-    
-    if (hybridAnalysisApiKey) {
-      console.log(`[${agent.agent_name}] Trying Hybrid Analysis first...`);
-      scanResult = await scanWithHybridAnalysis(fileHash, hybridAnalysisApiKey);
-    }
-    
-    // Fallback to VirusTotal if Hybrid Analysis failed or not configured
-    if (!scanResult && virusTotalApiKey) {
-      console.log(`[${agent.agent_name}] Falling back to VirusTotal...`);
-      scanResult = await scanWithVirusTotal(fileHash, virusTotalApiKey);
-    }
+    const scanResult = await scanAndStore(supabase, agent, filePath, fileHash, scanKeys);
     
     // If both failed, return error
     if (!scanResult) {
@@ -313,67 +622,10 @@ Deno.serve(async (req) => {
           error: 'Arquivo não encontrado em nenhum serviço de scan',
           message: 'Envie o arquivo para análise ou tente novamente mais tarde' 
         }),
-        { status: 404, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 404, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       );
     }
 
-    // Save scan result
-    const { data: scanRecord, error: scanError } = await supabase
-      .from('virus_scans')
-      .insert({
-        agent_name: agent.agent_name,
-        tenant_id: agent.tenant_id,
-        file_hash: fileHash,
-        file_path: filePath,
-        scan_result: scanResult.scans,
-        is_malicious: scanResult.isMalicious,
-        positives: scanResult.positives,
-        total_scans: scanResult.totalScans,
-        virustotal_permalink: scanResult.permalink,
-      })
-      .select()
-      .order('scanned_at', { ascending: false })
-      .limit(1)
-      .maybeSingle();
-
-    if (scanError) {
-      console.error('[SCAN-VIRUS] Error storing scan result:', scanError);
-    }
-
-    // Increment daily scan quota usage
-    await supabase.rpc('update_quota_usage', {
-      p_tenant_id: agent.tenant_id,
-      p_feature_key: 'advanced_scans_daily',
-      p_delta: 1
-    });
-    console.log(`[${agent.agent_name}] Advanced scan quota incremented`);
-
-    // Auto-quarantine if malicious and enabled
-    if (scanResult.isMalicious && scanRecord) {
-      console.log(`[SCAN-VIRUS] Malware detected by ${scanResult.scannerUsed}, triggering auto-quarantine`);
-      
-      try {
-        const internalSecret = Deno.env.get('INTERNAL_FUNCTION_SECRET');
-        
-        await supabase.functions.invoke('auto-quarantine', {
-          headers: {
-            'X-Internal-Secret': internalSecret || '',
-          },
-          body: {
-            virus_scan_id: scanRecord.id,
-            agent_name: agent.agent_name,
-            file_path: filePath,
-            file_hash: fileHash,
-            positives: scanResult.positives,
-            total_scans: scanResult.totalScans
-          }
-        });
-      } catch (quarantineError) {
-        console.error('[SCAN-VIRUS] Auto-quarantine failed:', quarantineError);
-        // Don't fail the scan if quarantine fails
-      }
-    }
-
     return new Response(
       JSON.stringify({
         isMalicious: scanResult.isMalicious,
@@ -384,7 +636,7 @@ Deno.serve(async (req) => {
         scans: scanResult.scans,
         scannerUsed: scanResult.scannerUsed,
       }),
-      { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      { status: 200, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
     );
   } catch (error) {
     return handleException(error, requestId, 'scan-virus');
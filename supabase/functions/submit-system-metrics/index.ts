@@ -1,12 +1,27 @@
 import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0';
 import { corsHeaders } from '../_shared/cors.ts';
 import { verifyHmacSignature } from '../_shared/hmac.ts';
+import {
+  createEncodingErrorResponse,
+  readRequestText,
+  RequestEncodingError,
+  requestEncodingHeaders,
+} from '../_shared/request-encoding.ts';
 import { checkRateLimit } from '../_shared/rate-limit.ts';
 import { logger } from '../_shared/logger.ts';
 
 const SUPABASE_URL = Deno.env.get('SUPABASE_URL')!;
 const SUPABASE_SERVICE_ROLE_KEY = Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')!;
 
+// Agregado de uma janela de amostras de alta frequência do agente
+interface MetricAggregate {
+  min: number;
+  max: number;
+  mean: number;
+  p95: number;
+  samples: number;
+}
+
 interface SystemMetrics {
   cpu_usage_percent?: number;
   cpu_name?: string;
@@ -23,6 +38,16 @@ interface SystemMetrics {
   network_bytes_received?: number;
   uptime_seconds?: number;
   last_boot_time?: string;
+  aggregates?: Record<string, MetricAggregate>;
+  // Instante da coleta no agente (envios reenviados da outbox chegam atrasados)
+  collected_at?: string;
+}
+
+// Valor usado nos alertas: p95 da janela quando o agente envia agregados
+// (picos entre envios), senão o snapshot
+function alertValue(metrics: SystemMetrics, key: 'cpu_usage_percent' | 'memory_usage_percent' | 'disk_usage_percent'): number | undefined {
+  const p95 = metrics.aggregates?.[key]?.p95;
+  return typeof p95 === 'number' ? p95 : metrics[key];
 }
 
 Deno.serve(async (req) => {
@@ -38,7 +63,7 @@ Deno.serve(async (req) => {
     if (!agentToken) {
       return new Response(JSON.stringify({ error: 'Missing agent token' }), {
         status: 401,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
       });
     }
 
@@ -66,13 +91,14 @@ Deno.serve(async (req) => {
       logger.warn('Invalid agent token');
       return new Response(JSON.stringify({ error: 'Invalid agent token' }), {
         status: 401,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
       });
     }
 
     const agent = tokenData.agents as any;
 
     // Validar HMAC se configurado
+    let rawBody: string | undefined;
     if (agent.hmac_secret) {
       const hmacResult = await verifyHmacSignature(supabase, req, agent.agent_name, agent.hmac_secret);
       if (!hmacResult.valid) {
@@ -85,10 +111,11 @@ Deno.serve(async (req) => {
           }), 
           {
             status: 401,
-            headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+            headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
           }
         );
       }
+      rawBody = hmacResult.rawBody;
     }
 
     // Rate limiting: 60 req/hora (1 a cada minuto)
@@ -107,14 +134,22 @@ Deno.serve(async (req) => {
         }), 
         {
           status: 429,
-          headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+          headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
         }
       );
     }
 
     logger.debug('Parsing metrics request');
-    // Parse métricas
-    const metrics: SystemMetrics = await req.json();
+    // Parse métricas (body já verificado e descomprimido pelo HMAC, se configurado)
+    let metrics: SystemMetrics;
+    try {
+      metrics = JSON.parse(rawBody ?? await readRequestText(req));
+    } catch (error) {
+      if (error instanceof RequestEncodingError) {
+        return createEncodingErrorResponse(error, corsHeaders);
+      }
+      throw error;
+    }
     logger.debug('Received metrics', {
       cpu: metrics.cpu_usage_percent,
       memory: metrics.memory_usage_percent,
@@ -143,13 +178,15 @@ Deno.serve(async (req) => {
         network_bytes_received: metrics.network_bytes_received,
         uptime_seconds: metrics.uptime_seconds,
         last_boot_time: metrics.last_boot_time ? new Date(metrics.last_boot_time).toISOString() : null,
+        aggregates: metrics.aggregates ?? null,
+        ...(metrics.collected_at ? { collected_at: new Date(metrics.collected_at).toISOString() } : {}),
       });
 
     if (insertError) {
       logger.error('Failed to insert metrics', insertError);
       return new Response(JSON.stringify({ error: 'Failed to store metrics' }), {
         status: 500,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
       });
     }
     
@@ -159,7 +196,12 @@ Deno.serve(async (req) => {
     // Gerar alertas se thresholds ultrapassados
     const alerts = [];
 
-    if (metrics.cpu_usage_percent && metrics.cpu_usage_percent > 90) {
+    const cpuUsage = alertValue(metrics, 'cpu_usage_percent');
+    const memoryUsage = alertValue(metrics, 'memory_usage_percent');
+    const diskUsage = alertValue(metrics, 'disk_usage_percent');
+    const window = metrics.aggregates ? ' (p95 da janela)' : '';
+
+    if (cpuUsage && cpuUsage > 90) {
       logger.info('High CPU usage detected');
       alerts.push({
         tenant_id: agent.tenant_id,
@@ -167,12 +209,12 @@ Deno.serve(async (req) => {
         alert_type: 'high_cpu',
         severity: 'critical',
         title: `CPU Crítico: ${agent.agent_name}`,
-        message: `Uso de CPU em ${metrics.cpu_usage_percent.toFixed(1)}% (limite: 90%)`,
-        details: { cpu_usage: metrics.cpu_usage_percent },
+        message: `Uso de CPU em ${cpuUsage.toFixed(1)}%${window} (limite: 90%)`,
+        details: { cpu_usage: cpuUsage, aggregate: metrics.aggregates?.cpu_usage_percent ?? null },
       });
     }
 
-    if (metrics.memory_usage_percent && metrics.memory_usage_percent > 85) {
+    if (memoryUsage && memoryUsage > 85) {
       logger.info('High memory usage detected');
       alerts.push({
         tenant_id: agent.tenant_id,
@@ -180,12 +222,12 @@ Deno.serve(async (req) => {
         alert_type: 'high_memory',
         severity: 'high',
         title: `Memória Alta: ${agent.agent_name}`,
-        message: `Uso de memória em ${metrics.memory_usage_percent.toFixed(1)}% (limite: 85%)`,
-        details: { memory_usage: metrics.memory_usage_percent },
+        message: `Uso de memória em ${memoryUsage.toFixed(1)}%${window} (limite: 85%)`,
+        details: { memory_usage: memoryUsage, aggregate: metrics.aggregates?.memory_usage_percent ?? null },
       });
     }
 
-    if (metrics.disk_usage_percent && metrics.disk_usage_percent > 90) {
+    if (diskUsage && diskUsage > 90) {
       logger.info('High disk usage detected');
       alerts.push({
         tenant_id: agent.tenant_id,
@@ -193,8 +235,8 @@ Deno.serve(async (req) => {
         alert_type: 'high_disk',
         severity: 'critical',
         title: `Disco Crítico: ${agent.agent_name}`,
-        message: `Uso de disco em ${metrics.disk_usage_percent.toFixed(1)}% (limite: 90%)`,
-        details: { disk_usage: metrics.disk_usage_percent },
+        message: `Uso de disco em ${diskUsage.toFixed(1)}% (limite: 90%)`,
+        details: { disk_usage: diskUsage },
       });
     }
 
@@ -219,7 +261,7 @@ Deno.serve(async (req) => {
       }), 
       {
         status: 200,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
       }
     );
 
@@ -229,7 +271,7 @@ Deno.serve(async (req) => {
       JSON.stringify({ error: 'Internal server error' }), 
       {
         status: 500,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
       }
     );
   }
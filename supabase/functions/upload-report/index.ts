@@ -2,6 +2,13 @@ import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.74.0'
 import { UploadReportSchemaEnhanced, validateFileSize, AgentTokenSchema } from '../_shared/validation.ts'
 import { handleException, handleValidationError, corsHeaders } from '../_shared/error-handler.ts'
 import { verifyHmacSignature } from '../_shared/hmac.ts'
+import {
+  createEncodingErrorResponse,
+  readRequestFormData,
+  readRequestText,
+  RequestEncodingError,
+  requestEncodingHeaders,
+} from '../_shared/request-encoding.ts'
 import { checkRateLimit } from '../_shared/rate-limit.ts'
 import { logSecurityEvent, extractIpAddress } from '../_shared/security-log.ts'
 
@@ -21,7 +28,7 @@ Deno.serve(async (req) => {
     if (!agentToken) {
       return new Response(
         JSON.stringify({ error: 'Token do agente necessário' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 401 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
       )
     }
 
@@ -30,7 +37,7 @@ Deno.serve(async (req) => {
     if (!tokenValidation.success) {
       return new Response(
         JSON.stringify({ error: 'Formato de token inválido' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 400 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 400 }
       )
     }
 
@@ -47,7 +54,7 @@ Deno.serve(async (req) => {
     if (!token?.agents) {
       return new Response(
         JSON.stringify({ error: 'Token inválido' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 401 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 401 }
       )
     }
 
@@ -58,11 +65,12 @@ Deno.serve(async (req) => {
       console.error(`[${requestId}] Agent ${agent.agent_name} has no tenant_id`)
       return new Response(
         JSON.stringify({ error: 'Configuração inválida do agente' }),
-        { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 500 }
+        { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 500 }
       )
     }
     
     // Verificar HMAC se configurado
+    let rawBody: string | undefined
     if (agent.hmac_secret) {
       const hmacResult = await verifyHmacSignature(supabase, req, agent.agent_name, agent.hmac_secret)
       if (!hmacResult.valid) {
@@ -73,9 +81,10 @@ Deno.serve(async (req) => {
             message: hmacResult.errorMessage,
             transient: hmacResult.transient
           }),
-          { status: 401, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+          { status: 401, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
         )
       }
+      rawBody = hmacResult.rawBody
     }
 
     // Rate limiting
@@ -91,7 +100,7 @@ Deno.serve(async (req) => {
           error: 'Rate limit excedido',
           resetAt: rateLimitResult.resetAt 
         }),
-        { status: 429, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        { status: 429, headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' } }
       )
     }
     
@@ -109,13 +118,22 @@ Deno.serve(async (req) => {
     let fileContent: string
 
     if (contentType.includes('application/json')) {
-      // Processar report de execução de job (JSON)
-      const { job_id, result, timestamp } = await req.json()
+      // Processar report de execução de job (JSON, possivelmente comprimido)
+      let report
+      try {
+        report = JSON.parse(rawBody ?? await readRequestText(req))
+      } catch (error) {
+        if (error instanceof RequestEncodingError) {
+          return createEncodingErrorResponse(error, corsHeaders)
+        }
+        throw error
+      }
+      const { job_id, result, timestamp } = report
 
       if (!job_id || !result) {
         return new Response(
           JSON.stringify({ error: 'Campos obrigatórios faltando (job_id, result)' }),
-          { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 400 }
+          { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 400 }
         )
       }
 
@@ -131,15 +149,23 @@ Deno.serve(async (req) => {
       }, null, 2)
 
     } else {
-      // Processar multipart form (upload de arquivo)
-      const formData = await req.formData()
+      // Processar multipart form (upload de arquivo, possivelmente comprimido)
+      let formData
+      try {
+        formData = await readRequestFormData(req)
+      } catch (error) {
+        if (error instanceof RequestEncodingError) {
+          return createEncodingErrorResponse(error, corsHeaders)
+        }
+        throw error
+      }
       const kind = formData.get('kind') as string
       const file = formData.get('file') as File
 
       if (!kind || !file) {
         return new Response(
           JSON.stringify({ error: 'Campos obrigatórios faltando (kind, file)' }),
-          { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 400 }
+          { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 400 }
         )
       }
 
@@ -177,7 +203,7 @@ Deno.serve(async (req) => {
       if (!validateFileSize(file.size)) {
         return new Response(
           JSON.stringify({ error: 'Arquivo muito grande (máximo 10MB)' }),
-          { headers: { ...corsHeaders, 'Content-Type': 'application/json' }, status: 413 }
+          { headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' }, status: 413 }
         )
       }
 
@@ -214,7 +240,7 @@ Deno.serve(async (req) => {
         file: report.file_path
       }),
       {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        headers: { ...corsHeaders, ...requestEncodingHeaders, 'Content-Type': 'application/json' },
         status: 201
       }
     )
@@ -0,0 +1,11 @@
+-- ============================================================================
+-- Heartbeat combinado ao poll-jobs
+-- ============================================================================
+-- Agentes em modo combined_heartbeat enviam apenas o hash do OS info a cada
+-- poll; o OS info completo só é reenviado quando o hash armazenado diverge.
+-- ============================================================================
+
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS os_info_hash TEXT;
+
+COMMENT ON COLUMN public.agents.os_info_hash IS
+'SHA256 do OS info (os_type, os_version, hostname) informado pelo agente no último heartbeat combinado ao poll-jobs.';
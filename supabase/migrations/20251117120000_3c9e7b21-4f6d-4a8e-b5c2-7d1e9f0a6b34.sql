@@ -0,0 +1,12 @@
+-- ============================================================================
+-- Agregados de janela nas métricas do agente
+-- ============================================================================
+-- O agente amostra CPU e memória em alta frequência e envia, a cada
+-- submit-system-metrics, min/max/média/p95 da janela. cpu_usage_percent e
+-- memory_usage_percent passam a ser a média da janela; os alertas usam o p95.
+-- ============================================================================
+
+ALTER TABLE public.agent_system_metrics ADD COLUMN IF NOT EXISTS aggregates JSONB;
+
+COMMENT ON COLUMN public.agent_system_metrics.aggregates IS
+'Agregado da janela de amostras do agente por métrica: {"cpu_usage_percent": {"min", "max", "mean", "p95", "samples"}, ...}. NULL para agentes que enviam apenas snapshots.';
@@ -0,0 +1,45 @@
+-- ============================================================================
+-- Patches binários entre versões do agente
+-- ============================================================================
+-- O check-agent-updates anuncia um patch (formato csdelta1, gerado por
+-- agent/tools/make_update_patch.py) quando o SHA256 do executável instalado,
+-- enviado pelo agente, tem patch para a versão latest. O agente confere o
+-- resultado com agent_versions.sha256 e volta ao download completo se falhar.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.agent_version_patches (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  to_version_id UUID NOT NULL REFERENCES public.agent_versions(id) ON DELETE CASCADE,
+  from_sha256 TEXT NOT NULL CHECK (from_sha256 ~ '^[0-9a-f]{64}$'),
+  format TEXT NOT NULL DEFAULT 'csdelta1',
+  sha256 TEXT NOT NULL,
+  size_bytes BIGINT NOT NULL,
+  download_url TEXT NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT now(),
+  UNIQUE(to_version_id, from_sha256)
+);
+
+-- Habilitar RLS
+ALTER TABLE public.agent_version_patches ENABLE ROW LEVEL SECURITY;
+
+-- Política: Agentes podem ler patches (para auto-update)
+CREATE POLICY "agents_can_read_version_patches"
+ON public.agent_version_patches
+FOR SELECT
+TO authenticated
+USING (true);
+
+-- Política: Super admins podem gerenciar patches
+CREATE POLICY "super_admins_can_manage_version_patches"
+ON public.agent_version_patches
+FOR ALL
+TO authenticated
+USING (public.is_super_admin(auth.uid()))
+WITH CHECK (public.is_super_admin(auth.uid()));
+
+COMMENT ON TABLE public.agent_version_patches IS 'Patches binários do executável do agente (origem instalada → versão)';
+COMMENT ON COLUMN public.agent_version_patches.from_sha256 IS 'SHA256 do executável de origem (instalado no agente)';
+COMMENT ON COLUMN public.agent_version_patches.format IS 'Formato do patch (csdelta1)';
+COMMENT ON COLUMN public.agent_version_patches.sha256 IS 'Hash SHA256 do arquivo de patch';
+COMMENT ON COLUMN public.agent_version_patches.size_bytes IS 'Tamanho do patch em bytes';
+COMMENT ON COLUMN public.agent_version_patches.download_url IS 'URL pública para download do patch';